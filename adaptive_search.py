@@ -0,0 +1,165 @@
+"""Adaptive search over a parent's variant space with successive halving.
+
+Instead of simulating every combination of operators, groups and windows,
+`adaptive_variant_search` simulates a small random seed sample of a parent's
+variants, scores every dimension value by the mean reward (sharpe + fitness
+by default) of the variants that used it, keeps the better half of the values
+of each dimension, and samples the next round from the reduced space. It
+stops once the per-parent budget of simulations is spent.
+"""
+import logging
+import math
+import random
+import time
+
+from brain_api import API_BASE
+from fastexpr import canonical_expression
+from simulation_scheduler import run_in_flight
+from variable_list import _extract_alpha_code, _random_combos, _render_variant, _variant_dimensions
+
+logger = logging.getLogger(__name__)
+
+
+def default_reward(metrics):
+    """Sharpe + fitness; failed or unknown simulations score below any real alpha."""
+    if not metrics:
+        return -5.0
+    return (metrics.get("sharpe") or 0) + (metrics.get("fitness") or 0)
+
+
+def fetch_alpha_metrics(sess, alpha_id, max_retries=3, retry_delay=10):
+    """GET /alphas/{id} and return its IS metrics dict, or None."""
+    url = f"{API_BASE}/alphas/{alpha_id}"
+    for attempt in range(max_retries):
+        try:
+            response = sess.get(url)
+            if response.status_code == 429 or response.headers.get("Retry-After"):
+                time.sleep(float(response.headers.get("Retry-After", retry_delay)))
+                continue
+            response.raise_for_status()
+            return response.json().get("is")
+        except Exception as e:
+            logger.warning(f"Fetching alpha {alpha_id} failed (attempt {attempt + 1}): {e}")
+            time.sleep(retry_delay)
+    return None
+
+
+def make_brain_evaluator(sess, sign_in, max_in_flight=3, batch_size=10, cache=None):
+    """
+    Build an `evaluate(payloads) -> [metrics or None]` that simulates on Brain.
+
+    Payloads with cached metrics are not simulated again; new results are
+    written back to the cache with their metrics.
+    """
+    def evaluate(payloads):
+        metrics = [None] * len(payloads)
+        to_run = []
+        for i, payload in enumerate(payloads):
+            cached = cache.get(payload) if cache is not None else None
+            if cached is not None and cached["metrics"] is not None:
+                metrics[i] = cached["metrics"]
+            else:
+                to_run.append(i)
+        results = run_in_flight(
+            [payloads[i] for i in to_run], sess, sign_in,
+            max_in_flight=max_in_flight, batch_size=batch_size,
+        )
+        for run_idx, alpha_id in results:
+            if not alpha_id:
+                continue
+            i = to_run[run_idx]
+            metrics[i] = fetch_alpha_metrics(sess, alpha_id)
+            if cache is not None:
+                cache.put(payloads[i], alpha_id, metrics[i])
+        return metrics
+    return evaluate
+
+
+def adaptive_variant_search(
+    parent,
+    evaluate,
+    budget=60,
+    seed_size=12,
+    keep_fraction=0.5,
+    reward_fn=default_reward,
+    seed=None,
+):
+    """
+    Spend at most `budget` simulations on variants of `parent`.
+
+    evaluate: callable taking a list of payloads and returning a list of IS
+    metrics dicts (None for failures), e.g. from `make_brain_evaluator`.
+    Round one simulates `seed_size` random variants; every following round
+    halves (by `keep_fraction`) the surviving values of each dimension by
+    mean reward and samples from what is left. Returns `(payload, metrics,
+    reward)` tuples for everything simulated, best first.
+    """
+    alpha_code = _extract_alpha_code(parent)
+    if not alpha_code or not isinstance(parent, dict):
+        return []
+    tokens, dimensions = _variant_dimensions(alpha_code)
+    if not dimensions:
+        return []
+    rng = random.Random(seed)
+    dimension_slots = [slots for slots, _, _ in dimensions]
+    base_values = tuple(original for _, _, original in dimensions)
+    surviving = [list(options) for _, options, _ in dimensions]
+    # (dimension index, value) -> [reward sum, count]
+    arm_stats = {}
+    tried = {canonical_expression(alpha_code)}
+    evaluated = []
+
+    while len(evaluated) < budget:
+        round_size = min(seed_size, budget - len(evaluated))
+        combos, payloads = [], []
+        for combo in _random_combos(surviving, rng):
+            if combo == base_values:
+                continue
+            new_code = _render_variant(tokens, dimension_slots, combo)
+            key = canonical_expression(new_code)
+            if key in tried:
+                continue
+            tried.add(key)
+            combos.append(combo)
+            payloads.append(dict(parent, regular=new_code))
+            if len(payloads) >= round_size:
+                break
+        if not payloads:
+            break  # reduced space exhausted
+
+        for combo, payload, metrics in zip(combos, payloads, evaluate(payloads)):
+            reward = reward_fn(metrics)
+            evaluated.append((payload, metrics, reward))
+            for d, value in enumerate(combo):
+                stats = arm_stats.setdefault((d, value), [0.0, 0])
+                stats[0] += reward
+                stats[1] += 1
+        best = max(reward for _, _, reward in evaluated)
+        logger.info(
+            f"Adaptive search {alpha_code[:60]}: {len(evaluated)}/{budget} simulated, best reward {best:.2f}, "
+            f"space {math.prod(len(values) for values in surviving)}"
+        )
+
+        # ---- SUCCESSIVE HALVING PER DIMENSION ----
+        # widest dimensions first; never shrink the space below what two more rounds need
+        for d in sorted(range(len(surviving)), key=lambda d: len(surviving[d]), reverse=True):
+            values = surviving[d]
+            if len(values) <= 1:
+                continue
+            keep = max(1, math.ceil(len(values) * keep_fraction))
+            space_after = math.prod(len(v) for v in surviving) // len(values) * keep
+            if space_after < 2 * seed_size:
+                continue
+            # untried values keep an optimistic score so they still get a chance
+            ranked = sorted(
+                values,
+                key=lambda value: (
+                    arm_stats[(d, value)][0] / arm_stats[(d, value)][1]
+                    if (d, value) in arm_stats else float("inf")
+                ),
+                reverse=True,
+            )
+            surviving[d] = ranked[:keep]
+
+    evaluated.sort(key=lambda item: item[2], reverse=True)
+    return evaluated
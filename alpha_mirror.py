@@ -0,0 +1,286 @@
+"""Incremental local mirror of the user's alphas from /users/self/alphas.
+
+`sync` pages through alphas newest first and stops as soon as it reaches
+alphas created before the stored `dateCreated` watermark, so a run after the
+first only downloads what is new; `reconcile=True` walks the whole window
+instead and also refreshes alphas whose status changed elsewhere (e.g.
+submitted from the web UI). Alphas are kept in SQLite with their IS
+metrics as indexed columns; `select` runs the filters that the fetch paths
+used to apply page by page as one local query.
+"""
+import datetime
+import json
+import logging
+import sqlite3
+import threading
+import time
+
+from brain_api import API_BASE
+
+logger = logging.getLogger(__name__)
+
+ALPHAS_URL = f"{API_BASE}/users/self/alphas"
+ALPHA_URL = f"{API_BASE}/alphas/{{alpha_id}}"
+DEFAULT_MIRROR_PATH = "alpha_mirror.db"
+
+# IS metric -> column
+METRIC_COLUMNS = {
+    "sharpe": "sharpe",
+    "fitness": "fitness",
+    "returns": "returns",
+    "turnover": "turnover",
+    "drawdown": "drawdown",
+    "margin": "margin",
+}
+_ROW_COLUMNS = {"id", "date_created", "status", "region", "universe", "delay", "code", *METRIC_COLUMNS.values()}
+
+
+def _timestamp(value):
+    """dateCreated as an aware UTC datetime, or None if missing/unparseable."""
+    if not value:
+        return None
+    try:
+        parsed = datetime.datetime.fromisoformat(value)
+    except ValueError:
+        return None
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=datetime.timezone.utc)
+    return parsed.astimezone(datetime.timezone.utc)
+
+
+def alpha_code(alpha):
+    regular = alpha.get("regular")
+    return regular.get("code") if isinstance(regular, dict) else regular
+
+
+class AlphaMirror:
+    """SQLite-backed mirror; safe to share between threads of one process."""
+
+    def __init__(self, path=DEFAULT_MIRROR_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        metric_columns = ", ".join(f"{column} REAL" for column in METRIC_COLUMNS.values())
+        self._conn.execute(
+            f"""
+            CREATE TABLE IF NOT EXISTS alphas (
+                id TEXT PRIMARY KEY,
+                date_created TEXT,
+                status TEXT,
+                region TEXT,
+                universe TEXT,
+                delay INTEGER,
+                code TEXT,
+                {metric_columns},
+                raw TEXT NOT NULL,
+                synced_at REAL NOT NULL
+            )
+            """
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_alphas_status_created ON alphas(status, date_created)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_alphas_status_sharpe ON alphas(status, sharpe)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_alphas_status_fitness ON alphas(status, fitness)")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS sync_state (status TEXT PRIMARY KEY, watermark TEXT, last_sync REAL)"
+        )
+        self._conn.commit()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    # ---- WRITE SIDE ----
+
+    def upsert(self, alphas):
+        now = time.time()
+        rows = []
+        for alpha in alphas:
+            metrics = alpha.get("is") or {}
+            settings = alpha.get("settings") or {}
+            rows.append((
+                alpha.get("id"), alpha.get("dateCreated"), alpha.get("status"),
+                settings.get("region"), settings.get("universe"), settings.get("delay"), alpha_code(alpha),
+                *[metrics.get(metric) for metric in METRIC_COLUMNS],
+                json.dumps(alpha, ensure_ascii=False), now,
+            ))
+        columns = ["id", "date_created", "status", "region", "universe", "delay", "code",
+                   *METRIC_COLUMNS.values(), "raw", "synced_at"]
+        updates = ", ".join(f"{column} = excluded.{column}" for column in columns[1:])
+        with self._lock, self._conn:
+            self._conn.executemany(
+                f"INSERT INTO alphas ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))}) "
+                f"ON CONFLICT(id) DO UPDATE SET {updates}",
+                rows,
+            )
+
+    def mark_status(self, alpha_id, status):
+        """Record a status change we caused locally (e.g. after a successful submit)."""
+        with self._lock, self._conn:
+            row = self._conn.execute("SELECT raw FROM alphas WHERE id = ?", (alpha_id,)).fetchone()
+            if row is None:
+                return
+            raw = json.loads(row[0])
+            raw["status"] = status
+            self._conn.execute(
+                "UPDATE alphas SET status = ?, raw = ? WHERE id = ?",
+                (status, json.dumps(raw, ensure_ascii=False), alpha_id),
+            )
+
+    def watermark(self, status):
+        with self._lock:
+            row = self._conn.execute("SELECT watermark FROM sync_state WHERE status = ?", (status,)).fetchone()
+        return row[0] if row else None
+
+    def sync(self, sess, status="UNSUBMITTED", page_size=100, max_items=3000, max_retries=3, retry_delay=60,
+             reconcile=False):
+        """
+        Pull alphas newer than the watermark (everything up to `max_items` on
+        the first sync). Returns the number of alphas fetched.
+
+        The watermark only moves once the walk has reached the previous one
+        (or the end of the list); a walk cut short by `max_items` leaves it
+        where it was, so the gap is fetched next time.
+
+        reconcile: walk the whole window (the newest `max_items`) even past
+        the watermark, refreshing the rows seen, and re-fetch local rows of
+        `status` in that window that the server no longer lists under it,
+        e.g. alphas submitted from another machine or the web UI.
+        """
+        watermark = _timestamp(self.watermark(status))
+        newest = watermark
+        reached = watermark is None  # a first sync only wants the window
+        end_of_list = False
+        seen = set()
+        oldest = None
+        fetched = 0
+        offset = 0
+        while max_items is None or offset < max_items:
+            limit = page_size if max_items is None else min(page_size, max_items - offset)
+            params = {"limit": limit, "offset": offset, "status": status, "order": "-dateCreated", "hidden": "false"}
+            for attempt in range(max_retries):
+                try:
+                    response = sess.get(ALPHAS_URL, params=params)
+                    if response.status_code == 429:
+                        wait_time = int(response.headers.get("Retry-After", retry_delay))
+                        logger.info(f"Rate limited. Waiting {wait_time} seconds...")
+                        time.sleep(wait_time)
+                        continue
+                    response.raise_for_status()
+                    results = response.json().get("results", [])
+                    break
+                except Exception as e:
+                    logger.warning(f"Mirror sync failed at offset {offset} (attempt {attempt + 1}): {e}")
+                    time.sleep(retry_delay)
+            else:
+                # Keep the old watermark so the next sync retries the gap.
+                logger.error(f"Mirror sync aborted at offset {offset}; watermark not advanced")
+                return fetched
+            # Brain's US-Eastern offsets flip with DST, so compare instants, not strings
+            new = []
+            for alpha in results:
+                created = _timestamp(alpha.get("dateCreated"))
+                seen.add(alpha.get("id"))
+                if created is not None and (oldest is None or created < oldest):
+                    oldest = created
+                if watermark is not None and created is not None and created <= watermark:
+                    reached = True
+                if not reconcile and watermark is not None and (created is None or created < watermark):
+                    continue
+                new.append(alpha)
+                if created is not None and (newest is None or created > newest):
+                    newest = created
+            self.upsert(new)
+            fetched += len(new)
+            if len(results) < limit:
+                reached = end_of_list = True
+                break
+            if reached and watermark is not None and not reconcile:
+                break
+            offset += limit
+        if reconcile:
+            fetched += self._reconcile(sess, status, seen, None if end_of_list else oldest)
+        if not reached:
+            logger.warning(f"Mirror sync ({status}) stopped after {max_items} alphas before reaching the "
+                           f"watermark; watermark not advanced")
+            return fetched
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT INTO sync_state (status, watermark, last_sync) VALUES (?, ?, ?) "
+                "ON CONFLICT(status) DO UPDATE SET watermark = excluded.watermark, last_sync = excluded.last_sync",
+                (status, newest.isoformat() if newest else None, time.time()),
+            )
+        logger.info(f"Mirror sync ({status}): {fetched} alphas fetched, watermark {newest.isoformat() if newest else None}")
+        return fetched
+
+    def _reconcile(self, sess, status, seen, since):
+        """Re-fetch rows of `status` created at or after `since` (None: all) that the server did not list."""
+        with self._lock:
+            rows = self._conn.execute("SELECT id, date_created FROM alphas WHERE status = ?", (status,)).fetchall()
+        stale = []
+        for alpha_id, date_created in rows:
+            if alpha_id in seen:
+                continue
+            created = _timestamp(date_created)
+            if since is None or (created is not None and created >= since):
+                stale.append(alpha_id)
+        refreshed = []
+        for alpha_id in stale:
+            try:
+                response = sess.get(ALPHA_URL.format(alpha_id=alpha_id))
+                if response.status_code == 404:
+                    with self._lock, self._conn:
+                        self._conn.execute("DELETE FROM alphas WHERE id = ?", (alpha_id,))
+                    continue
+                response.raise_for_status()
+                refreshed.append(response.json())
+            except Exception as e:
+                logger.warning(f"Could not refresh alpha {alpha_id}: {e}")
+        self.upsert(refreshed)
+        if stale:
+            logger.info(f"Mirror reconcile ({status}): {len(refreshed)} of {len(stale)} changed alphas refreshed")
+        return len(refreshed)
+
+    # ---- READ SIDE ----
+
+    def select(self, status="UNSUBMITTED", min_sharpe=None, min_fitness=None, min_return=None, window=None, limit=None):
+        """
+        Alphas (original API dicts) matching the thresholds, newest first.
+
+        window: only consider the newest `window` alphas of `status`, the way
+        the fetch paths looked at the first `max_items` of the server list.
+        """
+        inner = "SELECT * FROM alphas WHERE status = ? ORDER BY date_created DESC"
+        params = [status]
+        if window is not None:
+            inner += " LIMIT ?"
+            params.append(window)
+        conditions = []
+        for column, threshold in (("sharpe", min_sharpe), ("fitness", min_fitness), ("returns", min_return)):
+            if threshold is not None:
+                conditions.append(f"COALESCE({column}, 0) >= ?")
+                params.append(threshold)
+        query = f"SELECT raw FROM ({inner})"
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+        query += " ORDER BY date_created DESC"
+        if limit is not None:
+            query += " LIMIT ?"
+            params.append(limit)
+        with self._lock:
+            rows = self._conn.execute(query, params).fetchall()
+        return [json.loads(raw) for (raw,) in rows]
+
+    def rows(self, *columns, ids=None):
+        """Tuples of the given columns (e.g. "id", "code", "sharpe") without decoding the raw JSON."""
+        unknown = set(columns) - _ROW_COLUMNS
+        if unknown:
+            raise ValueError(f"Unknown mirror columns: {', '.join(sorted(unknown))}")
+        with self._lock:
+            rows = self._conn.execute(f"SELECT id, {', '.join(columns)} FROM alphas").fetchall()
+        return [row[1:] for row in rows if ids is None or row[0] in ids]
+
+    def __len__(self):
+        with self._lock:
+            (count,) = self._conn.execute("SELECT COUNT(*) FROM alphas").fetchone()
+        return count
@@ -0,0 +1,114 @@
+"""Vectorized multi-criteria selection over fetched alphas.
+
+The fetch paths used to evaluate thresholds alpha by alpha through closures
+with their own hardcoded numbers. `alphas_to_frame` loads the IS metrics of a
+list of alpha dicts into one columnar DataFrame; `select_alphas` applies
+thresholds, ranking, top-k and an optional Pareto-front filter to it with
+NumPy/pandas operations and hands back the original dicts. pandas and numpy
+are imported lazily.
+"""
+
+METRICS = ("sharpe", "fitness", "returns", "turnover", "drawdown", "margin")
+
+# Pareto objectives: larger is better / smaller is better.
+PARETO_MAXIMIZE = ("sharpe", "fitness")
+PARETO_MINIMIZE = ("turnover", "drawdown")
+
+
+def alphas_to_frame(alphas):
+    """One row per alpha: id, code, IS metrics as float columns (NaN when missing)."""
+    import pandas as pd
+    rows = []
+    for alpha in alphas:
+        metrics = alpha.get("is") or {}
+        regular = alpha.get("regular")
+        row = {
+            "id": alpha.get("id") or alpha.get("alphaId") or alpha.get("alpha") or alpha.get("name"),
+            "code": regular.get("code") if isinstance(regular, dict) else regular,
+            "date_created": alpha.get("dateCreated"),
+        }
+        for metric in METRICS:
+            value = metrics.get(metric)
+            if value is None and metric == "returns":
+                value = metrics.get("return")
+            row[metric] = value
+        rows.append(row)
+    frame = pd.DataFrame(rows, columns=["id", "code", "date_created", *METRICS])
+    frame[list(METRICS)] = frame[list(METRICS)].astype(float)
+    return frame
+
+
+def pareto_mask(frame, maximize=PARETO_MAXIMIZE, minimize=PARETO_MINIMIZE):
+    """
+    Boolean array: True for rows not dominated by any other row.
+
+    A row is dominated if another row is at least as good on every objective
+    and strictly better on one; missing values count as the worst possible.
+    Each pass takes a surviving row and drops everything it dominates in one
+    vectorized comparison, so the cost grows with rows x front size.
+    """
+    import numpy as np
+    columns = [frame[name].to_numpy(dtype=float) for name in maximize]
+    columns += [-frame[name].to_numpy(dtype=float) for name in minimize]
+    mask = np.zeros(len(frame), dtype=bool)
+    if not columns or len(frame) == 0:
+        mask[:] = True
+        return mask
+    scores = np.nan_to_num(np.column_stack(columns), nan=-np.inf)
+    candidates = np.arange(len(scores))
+    pos = 0
+    while pos < len(candidates):
+        point = scores[candidates[pos]]
+        rest = scores[candidates]
+        # survivors: better somewhere, or identical to `point`
+        keep = (rest > point).any(axis=1) | (rest == point).all(axis=1)
+        pos = keep[:pos].sum() + 1
+        candidates = candidates[keep]
+    mask[candidates] = True
+    return mask
+
+
+def select_alphas(
+    alphas,
+    min_sharpe=None,
+    min_fitness=None,
+    min_return=None,
+    max_turnover=None,
+    max_drawdown=None,
+    rank_by=None,
+    top_k=None,
+    pareto=False,
+):
+    """
+    Filter and rank alpha dicts; returns the selected dicts.
+
+    Thresholds treat a missing metric as 0, like the old filters. rank_by is a
+    metric name (descending; prefix with "-" for ascending) or None to keep
+    the input order. pareto=True keeps only the Pareto front over sharpe,
+    fitness, turnover and drawdown before ranking and top_k.
+    """
+    alphas = list(alphas)
+    if not alphas:
+        return []
+    frame = alphas_to_frame(alphas)
+    filled = frame[list(METRICS)].fillna(0)
+    keep = filled["sharpe"] == filled["sharpe"]  # all True, same index
+    if min_sharpe is not None:
+        keep &= filled["sharpe"] >= min_sharpe
+    if min_fitness is not None:
+        keep &= filled["fitness"] >= min_fitness
+    if min_return is not None:
+        keep &= filled["returns"] >= min_return
+    if max_turnover is not None:
+        keep &= filled["turnover"] <= max_turnover
+    if max_drawdown is not None:
+        keep &= filled["drawdown"] <= max_drawdown
+    frame = frame[keep.to_numpy()]
+    if pareto:
+        frame = frame[pareto_mask(frame)]
+    if rank_by:
+        column = rank_by.lstrip("-")
+        frame = frame.sort_values(column, ascending=rank_by.startswith("-"), kind="stable", na_position="last")
+    if top_k is not None:
+        frame = frame.head(top_k)
+    return [alphas[i] for i in frame.index]
@@ -0,0 +1,279 @@
+"""Lazy N-slot FASTEXPR templates over the datafield catalog.
+
+`alpha_list_generation2` could only build `{datafield}/{datafield2}`, built a
+fresh settings dict for every pair and materialised the whole product. An
+`AlphaTemplate` takes any FASTEXPR text with `{slot}` placeholders:
+
+    template = AlphaTemplate(
+        "{op}({x} / {y}, {window})",
+        x=FieldSlot(datasets=["pv1"]), y=FieldSlot(search="equity"),
+        op=["ts_rank", "ts_zscore"], window=[20, 60],
+    )
+    for payload in template.expand(datafields, settings=simulation_settings()):
+        ...
+
+A `FieldSlot` is filled from datafield metadata (the records, or the
+DataFrame, returned by `get_datafields` / `DatafieldCatalog`); any other slot
+is a plain list of choices such as operators or windows. Combinations are
+generated depth-first and pruned as soon as a partial assignment is invalid,
+so rejected prefixes never expand:
+
+* field type: a slot only takes the types it asks for (MATRIX by default),
+  so VECTOR and GROUP fields never land where a matrix operator expects one;
+* units: operands of `+`, `-` and comparisons must carry the same unit when
+  the catalog reports one, the combinations `unitHandling: VERIFY` rejects;
+* degenerate pairs: the same field on both sides of one operator (`x/x`,
+  `x-x`, ...) is skipped, and for commutative operators (`+`, `*`, ...) over
+  two slots of the same kind only one order is generated.
+
+Every payload shares one `FrozenSettings` object, which cannot be changed by
+accident and serialises like the plain dict it is.
+"""
+import string
+
+from fastexpr import FastExprSyntaxError, parse
+
+DEFAULT_FIELD_TYPES = ("MATRIX",)
+_SAME_UNIT_OPERATORS = {"+", "-", "<", "<=", ">", ">=", "==", "!="}
+_COMMUTATIVE_OPERATORS = {"+", "*", "==", "!="}
+_SLOT_PREFIX = "__slot_"
+_FORMATTER = string.Formatter()
+
+
+class FrozenSettings(dict):
+    """Read-only settings dict shared by every payload of a run."""
+
+    def _readonly(self, *args, **kwargs):
+        raise TypeError("simulation settings are shared between payloads; copy with dict(settings) to change them")
+
+    __setitem__ = __delitem__ = clear = pop = popitem = setdefault = update = _readonly
+    __ior__ = _readonly
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
+
+    def __reduce__(self):
+        return FrozenSettings, (dict(self),)
+
+    def __hash__(self):
+        return hash(tuple(sorted((k, str(v)) for k, v in self.items())))
+
+
+def simulation_settings(instrumentType="EQUITY", region="USA", universe="TOP3000", delay=1, decay=1,
+                        truncation=0.08, neutralization="SUBINDUSTRY", **overrides):
+    """FrozenSettings with the defaults the generation scripts have always used."""
+    settings = {
+        "instrumentType": instrumentType,
+        "region": region,
+        "universe": universe,
+        "delay": delay,
+        "decay": decay,
+        "neutralization": neutralization,
+        "truncation": truncation,
+        "pasteurization": "ON",
+        "unitHandling": "VERIFY",
+        "nanHandling": "ON",
+        "language": "FASTEXPR",
+        "visualization": False,
+    }
+    settings.update(overrides)
+    return FrozenSettings(settings)
+
+
+def datafield_unit(field):
+    """Unit reported by the catalog for a datafield record, or None when unknown."""
+    unit = field.get("unit") or field.get("units")
+    if isinstance(unit, dict):
+        unit = unit.get("id") or unit.get("name")
+    return unit or None
+
+
+class FieldSlot:
+    """
+    A slot filled with datafields that match the given metadata.
+
+    types: allowed datafield types; datasets / categories: allowed dataset or
+    category ids; search: case-insensitive substring of id or description;
+    min_coverage: lowest acceptable `coverage`; ids: explicit field ids, which
+    still have to exist in the catalog and pass the other filters.
+    """
+
+    def __init__(self, types=DEFAULT_FIELD_TYPES, datasets=None, categories=None, search=None,
+                 min_coverage=None, ids=None):
+        self.types = tuple(types) if types else None
+        self.datasets = set(datasets) if datasets else None
+        self.categories = set(categories) if categories else None
+        self.search = search.lower() if search else None
+        self.min_coverage = min_coverage
+        self.ids = set(ids) if ids is not None else None
+
+    def key(self):
+        return (self.types, frozenset(self.datasets or ()), frozenset(self.categories or ()),
+                self.search, self.min_coverage, frozenset(self.ids or ()))
+
+    def accepts(self, field):
+        if self.ids is not None and field.get("id") not in self.ids:
+            return False
+        if self.types and field.get("type") not in self.types:
+            return False
+        if self.datasets and (field.get("dataset") or {}).get("id") not in self.datasets:
+            return False
+        if self.categories and (field.get("category") or {}).get("id") not in self.categories:
+            return False
+        if self.search and self.search not in field.get("id", "").lower() \
+                and self.search not in (field.get("description") or "").lower():
+            return False
+        if self.min_coverage is not None and (field.get("coverage") or 0) < self.min_coverage:
+            return False
+        return True
+
+
+def _records(datafields):
+    """Datafield records from a list of dicts or a DataFrame, one per field id."""
+    if hasattr(datafields, "to_dict"):
+        datafields = datafields.to_dict("records")
+    return list({field.get("id"): field for field in datafields}.values())
+
+
+def _operand_slot(node):
+    """Name of the slot if `node` is exactly one placeholder, else None."""
+    if isinstance(node, tuple) and node[0] == "name" and node[1].startswith(_SLOT_PREFIX):
+        return node[1][len(_SLOT_PREFIX):]
+    return None
+
+
+def _binops(node):
+    """Every ("binop", ...) node of a fastexpr AST."""
+    if not isinstance(node, tuple) or not node:
+        return
+    if node[0] == "binop":
+        yield node
+    # AST nodes start with their kind; argument tuples and kwargs pairs are walked whole
+    for child in (node[1:] if isinstance(node[0], str) else node):
+        yield from _binops(child)
+
+
+class AlphaTemplate:
+    """
+    template: FASTEXPR text with `{name}` placeholders, one keyword per slot.
+    Each keyword is a FieldSlot or an iterable of choices (str/int/float).
+    """
+
+    def __init__(self, template, **slots):
+        self.template = template
+        names = [name for _, name, _, _ in _FORMATTER.parse(template) if name]
+        missing = sorted(set(names) - set(slots))
+        if missing:
+            raise ValueError(f"No options given for template slots: {', '.join(missing)}")
+        self.slot_names = list(dict.fromkeys(names))
+        self.slots = {name: slots[name] if isinstance(slots[name], FieldSlot) else list(slots[name])
+                      for name in self.slot_names}
+        self.same_unit, self.distinct, self.ordered = self._constraints()
+        # position -> [(earlier position, same unit, ordered)], checked when that slot is filled
+        self._checks = {}
+        for earlier, later in self.distinct:
+            self._checks.setdefault(self.slot_names.index(later), []).append((
+                self.slot_names.index(earlier), (earlier, later) in self.same_unit, (earlier, later) in self.ordered,
+            ))
+
+    def _constraints(self):
+        """Slot pairs that must share a unit, must differ, or only come in one order."""
+        probe = self.template.format(**{name: _SLOT_PREFIX + name for name in self.slot_names})
+        try:
+            tree = parse(probe)
+        except FastExprSyntaxError:
+            return set(), set(), set()
+        same_unit, distinct, ordered = set(), set(), set()
+        for _, op, left, right in _binops(tree):
+            a, b = _operand_slot(left), _operand_slot(right)
+            if a is None or b is None or a == b:
+                continue
+            if not (isinstance(self.slots[a], FieldSlot) and isinstance(self.slots[b], FieldSlot)):
+                continue
+            pair = tuple(sorted((a, b), key=self.slot_names.index))
+            distinct.add(pair)
+            if op in _SAME_UNIT_OPERATORS:
+                same_unit.add(pair)
+            if op in _COMMUTATIVE_OPERATORS and self.slots[a].key() == self.slots[b].key():
+                ordered.add(pair)
+        return same_unit, distinct, ordered
+
+    def options(self, datafields=()):
+        """Per-slot option lists after metadata filtering; field slots hold records."""
+        records = None
+        options = []
+        for name in self.slot_names:
+            slot = self.slots[name]
+            if isinstance(slot, FieldSlot):
+                if records is None:
+                    records = _records(datafields)
+                options.append([field for field in records if slot.accepts(field)])
+            else:
+                options.append(slot)
+        return options
+
+    def _valid(self, position, chosen):
+        """Check the constraints between slot `position` and the slots filled before it."""
+        value = chosen[position]
+        for earlier, same_unit, ordered in self._checks[position]:
+            other = chosen[earlier]
+            if other.get("id") == value.get("id"):
+                return False
+            if ordered and other.get("id") > value.get("id"):
+                return False
+            if same_unit:
+                unit_a, unit_b = datafield_unit(other), datafield_unit(value)
+                if unit_a is not None and unit_b is not None and unit_a != unit_b:
+                    return False
+        return True
+
+    def combinations(self, datafields=()):
+        """Lazily yield valid slot assignments as tuples (records for field slots)."""
+        options = self.options(datafields)
+        if any(not values for values in options):
+            return
+        chosen = [None] * len(options)
+
+        def expand(position):
+            if position == len(options):
+                yield tuple(chosen)
+                return
+            for value in options[position]:
+                chosen[position] = value
+                if position in self._checks and not self._valid(position, chosen):
+                    continue
+                yield from expand(position + 1)
+
+        yield from expand(0)
+
+    def render(self, combo):
+        values = {name: value.get("id") if isinstance(value, dict) else value
+                  for name, value in zip(self.slot_names, combo)}
+        return self.template.format(**values)
+
+    def expand(self, datafields=(), settings=None, limit=None, cache=None):
+        """
+        Lazily yield REGULAR simulation payloads sharing one settings object.
+
+        cache: optional result_cache.ResultCache; expressions simulated by
+        earlier runs are skipped.
+        """
+        settings = settings if isinstance(settings, FrozenSettings) else (
+            FrozenSettings(settings) if settings is not None else simulation_settings())
+        yielded = 0
+        for combo in self.combinations(datafields):
+            payload = {"type": "REGULAR", "settings": settings, "regular": self.render(combo)}
+            if cache is not None and payload in cache:
+                continue
+            yield payload
+            yielded += 1
+            if limit is not None and yielded >= limit:
+                return
+
+    def count(self, datafields=()):
+        """Number of valid combinations (walks them; nothing is kept)."""
+        return sum(1 for _ in self.combinations(datafields))
+
@@ -1,31 +1,63 @@
-
-
 import copy
-import json
-import os
-import requests
-from requests.auth import HTTPBasicAuth
-from typing import List, Dict
-from concurrent.futures import ThreadPoolExecutor, as_completed
-import argparse
 import logging
 import time
-from variable_list import generate_alpha_variants, element
-from iteration_main import testing_alphas
+from typing import Dict
+from variable_list import element, iter_alpha_variants
+from alpha_mirror import ALPHAS_URL, AlphaMirror
+from alpha_selection import select_alphas
+from adaptive_search import adaptive_variant_search, make_brain_evaluator
+from fastexpr import canonical_expression
+from pipeline_metrics import metrics
+from priority_scheduler import DailyQuota, PriorityScheduler
+from result_cache import ResultCache
+from result_store import ResultHarvester
+from session_manager import account_count, sign_in
+from simulation_journal import SimulationJournal
+from simulation_scheduler import run_in_flight
+from streaming_pipeline import StreamingPipeline
 
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
+
+MAX_VARIANTS_PER_PARENT = 500
+MAX_VARIANTS_TOTAL = 20000
+# "stream": 按上限+分层采样流水线式跑，达标的子alpha回流当父alpha; "adaptive": 每个父alpha先跑少量种子，再按sharpe/fitness逐轮减半搜索空间
+# "priority": 所有变体进优先队列，按期望价值（父alpha表现、算子历史、和已测邻居的距离）先跑，受每日配额限制
+SEARCH_MODE = "stream"
+ADAPTIVE_BUDGET_PER_PARENT = 60
+# priority 模式：每天最多模拟多少个alpha（多次运行共享，记在 simulation_quota.db）
+DAILY_SIMULATION_QUOTA = 3000
+# priority 模式：堆里最多同时放多少个待选变体（变体边生成边入堆，内存不随变体空间增长）
+PRIORITY_LOOKAHEAD = 2000
+# 父alpha挑选：按 PARENT_RANK_BY 排序取前 PARENT_TOP_K 个（None 为全部）；
+# PARENT_PARETO 为 True 时只保留 sharpe/fitness/turnover/drawdown 的 Pareto 前沿
+PARENT_RANK_BY = "sharpe"
+PARENT_TOP_K = None
+PARENT_PARETO = False
+# credential.txt 里有多个账号时设为 True：模拟按账号分摊，并发数按账号数放大
+USE_ACCOUNT_POOL = False
+SIMULATIONS_PER_ACCOUNT = 3
+# stream 模式的回流：sharpe/fitness 都达标的变体再生成下一代，最多 FEEDBACK_MAX_DEPTH 代（0 为不回流）
+FEEDBACK_MAX_DEPTH = 2
+FEEDBACK_MIN_SHARPE = 1.25
+FEEDBACK_MIN_FITNESS = 1.0
+
 class AlphaSubmitter:
     def __init__(self):
-        self.sess = requests.Session()
-        self.sess.auth = HTTPBasicAuth(username="ENTER UR USERNAME", password="ENTER YOUR PASSWORD")
-        response = self.sess.post("https://api.worldquantbrain.com/authentication")
-        if response.status_code != 201:
-            raise Exception(f"Authentication failed: {response.text}")
-        logger.info("Successfully logged into WorldQuant Brain")
+        # 账号从 credential.txt（或环境变量 WQB_USERNAME/WQB_PASSWORD）读取，token 过期前自动重新登录
+        self.sess = sign_in(pool=USE_ACCOUNT_POOL)
 
-    def fetch_successful_alphas(self, max_items: int = 180, page_size: int = 100) -> Dict:
-        url = "https://api.worldquantbrain.com/users/self/alphas"
+    @metrics.timed("stage_seconds", stage="fetch_successful_alphas")
+    def fetch_successful_alphas(self, max_items: int = 180, page_size: int = 100, mirror=None,
+                                min_sharpe=1.00, min_fitness=0.5, rank_by=None, top_k=None, pareto=False) -> Dict:
+        if mirror is not None:
+            # 本地镜像：只增量同步新的alpha，筛选在本地数据库里做
+            mirror.sync(self.sess, page_size=page_size, max_items=max_items)
+            collected = select_alphas(
+                mirror.select(min_sharpe=min_sharpe, min_fitness=min_fitness, window=max_items),
+                rank_by=rank_by, top_k=top_k, pareto=pareto,
+            )
+            return {"count": len(collected), "results": collected}
+        url = ALPHAS_URL
         max_retries = 3
         retry_delay = 60
         collected = []
@@ -53,13 +85,9 @@ class AlphaSubmitter:
                     data = response.json()
                     results = data.get("results", [])
                     if not results:
-                        return {"count": len(collected), "results": collected}
-                    filtered = [
-                        alpha for alpha in results
-                        if (alpha.get("is") or {}).get("sharpe", 0) >= 1.00
-                           and (alpha.get("is") or {}).get("fitness", 0) >= 0.5
-                    ]
-                    collected.extend(filtered)
+                        offset = max_items  # 服务器没有更多alpha了
+                        break
+                    collected.extend(results)
                     break
                 except Exception as e:
                     logger.warning(f"Fetch failed (Attempt {attempt + 1}): {str(e)}")
@@ -67,33 +95,102 @@ class AlphaSubmitter:
             else:
                 break
             offset += limit
+        # 阈值、排序、top-k 和 Pareto 前沿在整张表上一次性向量化计算
+        collected = select_alphas(
+            collected, min_sharpe=min_sharpe, min_fitness=min_fitness,
+            rank_by=rank_by, top_k=top_k, pareto=pareto,
+        )
         return {"count": len(collected), "results": collected}
-ok = AlphaSubmitter()
-data = ok.fetch_successful_alphas()
-print(f"alpha2_0 raw results count: {len(data.get('results', []))}")
-print(f"alpha2_0 raw results: {data.get('results', [])}")
-alpha2_0 = []
-for alpha in data.get("results", []):
-    regular = alpha.get("regular")
-    if isinstance(regular, dict):
-        alpha_code = regular.get("code")
-    else:
-        alpha_code = regular
-    if alpha_code:
-        alpha_id = alpha.get("id") or alpha.get("alphaId") or alpha.get("alpha") or alpha.get("name")
-        print(f"{alpha_id}\t{alpha_code}")
-        rendered = copy.deepcopy(element)
-        rendered["regular"] = alpha_code
-        alpha2_0.append(rendered)
-print("alpha2_0 successful printed")
+def iter_parents(ok, cache, with_metrics=False):
+    """拉取父alpha并逐个转成模拟payload（stream 模式下在单独线程里跑，边拉边生成变体）；with_metrics 时给出 (payload, 父alpha的IS指标)"""
+    data = ok.fetch_successful_alphas(
+        mirror=AlphaMirror(), rank_by=PARENT_RANK_BY, top_k=PARENT_TOP_K, pareto=PARENT_PARETO
+    )
+    print(f"alpha2_0 raw results count: {len(data.get('results', []))}")
+    seen_parents = set()
+    for alpha in data.get("results", []):
+        regular = alpha.get("regular")
+        if isinstance(regular, dict):
+            alpha_code = regular.get("code")
+        else:
+            alpha_code = regular
+        if alpha_code and canonical_expression(alpha_code) in seen_parents:
+            continue  # 同一个表达式只是写法不同，不重复当父alpha
+        if alpha_code:
+            seen_parents.add(canonical_expression(alpha_code))
+            alpha_id = alpha.get("id") or alpha.get("alphaId") or alpha.get("alpha") or alpha.get("name")
+            print(f"{alpha_id}\t{alpha_code}")
+            rendered = copy.deepcopy(element)
+            rendered["regular"] = alpha_code
+            if alpha_id:
+                # 父alpha本身也记进cache，之后生成的变体如果和它一样就不会再跑
+                cache.put({"regular": alpha_code, "settings": alpha.get("settings") or element["settings"]}, alpha_id, alpha.get("is"))
+            yield (rendered, alpha.get("is")) if with_metrics else rendered
+    print("alpha2_0 successful printed")
+
+def iter_variants_with_parent_metrics(ok, cache):
+    """(variant, 父alpha的IS指标)：所有父alpha共用一个 iter_alpha_variants，跨父alpha的重复变体只出一次。"""
+    current = {}
+
+    def parents():
+        for parent, parent_metrics in iter_parents(ok, cache, with_metrics=True):
+            # iter_alpha_variants 处理完上一个父alpha才会取下一个，所以此后的变体都属于它
+            current["metrics"] = parent_metrics
+            yield parent
+
+    for variant in iter_alpha_variants(parents(), cache=cache, max_per_parent=MAX_VARIANTS_PER_PARENT):
+        yield variant, current.get("metrics")
+
+
+# 在这里可以手动插入一段alpha2.0让alpha3.0来处理（在 iter_parents 里多 yield 几个payload）
+
+
+def main(search_mode=SEARCH_MODE):
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    metrics.export_at_exit()  # 结束时写 pipeline_metrics.prom 并打印各阶段耗时汇总
+    cache = ResultCache()
+    ok = AlphaSubmitter()
+    if search_mode == "adaptive":
+        evaluate = make_brain_evaluator(
+            ok.sess, sign_in, max_in_flight=SIMULATIONS_PER_ACCOUNT * account_count(ok.sess), batch_size=10, cache=cache
+        )
+        for parent in iter_parents(ok, cache):
+            ranked = adaptive_variant_search(parent, evaluate, budget=ADAPTIVE_BUDGET_PER_PARENT)
+            for payload, scores, reward in ranked[:5]:
+                print(f"{reward:.2f}\t{payload['regular']}")
+        return
+    if search_mode == "priority":
+        # 变体不再按 itertools.product 顺序跑：每空出一个模拟位就跑期望价值最高的那个，配额用完就停
+        journal = SimulationJournal()
+        with ResultHarvester(ok.sess) as harvester:
+            scheduler = PriorityScheduler(DailyQuota(DAILY_SIMULATION_QUOTA), harvester=harvester,
+                                          cache=cache, journal=journal)
+            # 所有父alpha共用一个变体生成器（跨父alpha去重），按需懒加载进堆，只保留 PRIORITY_LOOKAHEAD 个候选
+            scheduler.feed(iter_variants_with_parent_metrics(ok, cache), lookahead=PRIORITY_LOOKAHEAD)
+            print(f"{scheduler.quota.remaining()} simulations left today")
+            run_in_flight(scheduler, ok.sess, sign_in, max_in_flight=SIMULATIONS_PER_ACCOUNT * account_count(ok.sess),
+                          batch_size=10, journal=journal, cache=cache, on_result=scheduler.on_result)
+        if not scheduler.exhausted:
+            print("Daily quota spent; remaining variants will be regenerated next run")
+        return
+    # 拉取 -> 生成变体 -> 模拟 -> 取结果 四个阶段同时跑，中间是有界队列：第一个父alpha拉到就开始模拟，
+    # 内存不随变体空间增长；达标的变体再当父alpha生成下一代，最多 FEEDBACK_MAX_DEPTH 代
+    # 每个变体的完整结果（IS指标+checks）同时存进 alpha_results.db
+    print("ALPHA LIST3.0 STREAMING INTO testing_alphas (also written to alpha3_0.jsonl)")
+    harvester = ResultHarvester(ok.sess)
+    pipeline = StreamingPipeline(
+        ok.sess, sign_in, lambda: iter_parents(ok, cache),
+        max_depth=FEEDBACK_MAX_DEPTH, min_sharpe=FEEDBACK_MIN_SHARPE, min_fitness=FEEDBACK_MIN_FITNESS,
+        max_in_flight=SIMULATIONS_PER_ACCOUNT * account_count(ok.sess), batch_size=10,
+        journal=SimulationJournal(), cache=cache, record_path="alpha3_0.jsonl", harvester=harvester,
+        max_per_parent=MAX_VARIANTS_PER_PARENT, max_total=MAX_VARIANTS_TOTAL, sample="stratified", seed=0,
+    )
+    with harvester:
+        qualified = pipeline.run()
+    for payload, alpha_id, scores, depth in qualified[:20]:
+        print(f"{alpha_id}\tdepth={depth}\tsharpe={scores.get('sharpe')}\tfitness={scores.get('fitness')}\t{payload['regular']}")
 
-# 在这里可以手动插入一段alpha2.0让alpha3.0来处理：
 
-alpha3_0 = generate_alpha_variants(alpha2_0)
-print("alpha 3 长度为：")
-print(len(alpha3_0))
-print("ALPHA LIST3.0 SUCCESSFULLY GENERATED NOW TESTING ALPHA3.0")
-with open("alpha3_0", "w", encoding="utf-8") as f:
-    json.dump(alpha3_0, f, ensure_ascii=True, indent=2)
-print("alpha3_0 written to file: alpha3_0")
-testing_alphas(alpha3_0, ok.sess)
+# 脚本部分只在直接运行时执行，import 本模块不会登录或发请求
+if __name__ == "__main__":
+    main()
@@ -1,13 +1,21 @@
 import argparse
-import json
+import functools
 import logging
-import os
+import queue
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
+
+from alpha_mirror import ALPHAS_URL, AlphaMirror
+from alpha_selection import select_alphas
+from brain_api import API_BASE
+from correlation_screen import CorrelationScreen
+from fastexpr import canonical_expression
+from pipeline_metrics import metrics
+from pnl_store import PnlStore
+from submission_log import PASSED, PENDING, SubmissionLog, result_outcome, submission_outcome
+import session_manager
 
-import requests
-from requests.auth import HTTPBasicAuth
-
-logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
 logger = logging.getLogger(__name__)
 sess = None
 
@@ -17,33 +25,12 @@ HARDCODED_PASSWORD = ""
 
 
 def sign_in(credentials_path=None, username=None, password=None):
-    """Authenticate and return a session. Uses JSON credentials or env/args."""
+    """Authenticate and return the shared session (see session_manager). Uses JSON credentials or env/args."""
     global sess
-    if username is None or password is None:
-        if credentials_path is None:
-            username = HARDCODED_USERNAME or os.getenv("WQB_USERNAME")
-            password = HARDCODED_PASSWORD or os.getenv("WQB_PASSWORD")
-        else:
-            with open(credentials_path, "r") as f:
-                credentials = json.load(f)
-            if isinstance(credentials, list):
-                username = credentials[0].get("username")
-                password = credentials[0].get("password")
-            elif isinstance(credentials, dict):
-                username = credentials.get("username")
-                password = credentials.get("password")
-            else:
-                raise Exception("Invalid credentials format.")
-    if not username or not password:
-        raise Exception("Missing username or password for authentication. Set env WQB_USERNAME/WQB_PASSWORD or pass credentials.")
-
-    sess = requests.Session()
-    sess.auth = HTTPBasicAuth(username, password)
+    if username is None and password is None and credentials_path is None and HARDCODED_USERNAME and HARDCODED_PASSWORD:
+        username, password = HARDCODED_USERNAME, HARDCODED_PASSWORD
     try:
-        response = sess.post("https://api.worldquantbrain.com/authentication")
-        if response.status_code != 201:
-            raise Exception(f"Authentication failed: {response.text}")
-        logger.info("Successfully logged into WorldQuant Brain")
+        sess = session_manager.sign_in(credentials_path=credentials_path, username=username, password=password)
         return sess
     except Exception as e:
         logger.error(f"登录失败，错误信息: {str(e)}")
@@ -53,90 +40,115 @@ def sign_in(credentials_path=None, username=None, password=None):
 def setup_session(credentials_path="./credential.txt", username=None, password=None):
     """Initialize global session using credentials file or explicit username/password."""
     return sign_in(credentials_path=credentials_path, username=username, password=password)
-def monitor_submission(alpha_id, max_attempts=30, sleep_time=10):
-    url = f"https://api.worldquantbrain.com/alphas/{alpha_id}/submit"
-    for attempt in range(max_attempts):
+def _next_poll_interval(response, interval, max_interval):
+    """Honour Retry-After when the server sends one, otherwise back off geometrically."""
+    retry_after = response.headers.get("Retry-After") if response is not None else None
+    if retry_after:
+        try:
+            return float(retry_after), interval
+        except ValueError:
+            pass
+    return interval, min(interval * 1.5, max_interval)
+
+
+@metrics.timed("stage_seconds", stage="monitor_submission")
+def monitor_submission(alpha_id, max_attempts=30, sleep_time=10, min_interval=2):
+    """
+    Poll the submit endpoint until the checks are done.
+
+    The first polls come quickly (min_interval) and back off up to 3 × sleep_time,
+    or follow the server's Retry-After. The overall deadline stays
+    max_attempts × sleep_time as before.
+    """
+    url = f"{API_BASE}/alphas/{alpha_id}/submit"
+    deadline = time.time() + max_attempts * sleep_time
+    interval = min_interval
+    attempt = 0
+    while time.time() < deadline:
+        response = None
         try:
             response = sess.get(url)
             logger.info(f"监控尝试 {attempt + 1} alpha {alpha_id}")
             logger.info(f"响应状态: {response.status_code}")
             logger.info(f"响应内容: {response.text[:1000] if response.text else '无内容'}")
 
-            if response.status_code != 200:
+            if response.status_code == 429:
+                logger.info(f"alpha {alpha_id} 监控被限流，稍后重试")
+            elif response.status_code != 200:
                 logger.error(f"alpha {alpha_id} 提交可能失败")
                 logger.error(f"响应状态: {response.status_code}")
                 logger.error(f"响应文本: {response.text}")
                 return {"status": "failed", "error": response.text}
-
-            if not response.text.strip():
+            elif not response.text.strip():
                 logger.info(f"alpha {alpha_id} 仍在提交中，等待...")
-                time.sleep(sleep_time)
-                continue
-
-            try:
-                data = response.json()
-                logger.info(f"alpha {alpha_id} 提交完成")
-                return data
-            except Exception as e:
-                logger.warning(f"监控尝试 {attempt + 1} 解析失败: {str(e)}")
-                logger.warning(f"响应内容: {response.text if 'response' in locals() else 'N/A'}")
+            else:
+                try:
+                    data = response.json()
+                    logger.info(f"alpha {alpha_id} 提交完成")
+                    return data
+                except Exception as e:
+                    logger.warning(f"监控尝试 {attempt + 1} 解析失败: {str(e)}")
+                    logger.warning(f"响应内容: {response.text}")
 
         except Exception as e:
             logger.warning(f"监控请求尝试 {attempt + 1} 失败: {str(e)}")
 
-        time.sleep(sleep_time)
+        attempt += 1
+        wait, interval = _next_poll_interval(response, interval, sleep_time * 3)
+        wait = max(0.0, min(wait, deadline - time.time()))
+        metrics.observe("monitor_sleep_seconds", wait)
+        time.sleep(wait)
 
     logger.error(f"alpha {alpha_id} 监控超时")
+    metrics.inc("monitor_timeouts_total")
     return {"status": "timeout", "error": "监控超时"}
 
 
-def log_submission_result(alpha_id, result):
-    log_file = "submission_results.json"
-    existing_results = []
+_submission_log = None
+_submission_log_lock = threading.Lock()
 
-    if os.path.exists(log_file):
-        try:
-            with open(log_file, 'r') as f:
-                existing_results = json.load(f)
-        except json.JSONDecodeError:
-            logger.warning(f"无法解析 {log_file}，重置结果列表")
-            existing_results = []
-
-    entry = {
-        "alpha_id": alpha_id,
-        "timestamp": int(time.time()),
-        "result": result
-    }
-    existing_results.append(entry)
-
-    with open(log_file, 'w') as f:
-        json.dump(existing_results, f, indent=2)
+
+def get_submission_log():
+    """Module-wide SubmissionLog; imports the old submission_results.json on first use."""
+    global _submission_log
+    with _submission_log_lock:
+        if _submission_log is None:
+            _submission_log = SubmissionLog()
+            _submission_log.import_legacy_json()
+        return _submission_log
+
+
+def log_submission_result(alpha_id, result):
+    get_submission_log().append(alpha_id, result)
     logger.info(f"已记录alpha {alpha_id} 的提交结果")
 
 
 def has_fail_checks(alpha):
-    checks = alpha.get("result", {}).get("checks", [])
+    """True if the alpha's IS checks (or a submission result's checks) already contain a FAIL."""
+    checks = (alpha.get("is") or alpha.get("result") or {}).get("checks", [])
     return any(check.get("result") == "FAIL" for check in checks)
 
 
 def submission_passed(result):
-    if not result or not isinstance(result, dict):
-        return False
-    if result.get("status") == "failed":
-        return False
-    checks = result.get("is", {}).get("checks", [])
-    if any(check.get("result") == "FAIL" for check in checks):
-        return False
-    return True
+    return bool(result) and result_outcome(result) == PASSED
 
 
-def submit_alpha(alpha_id):
-    url = f"https://api.worldquantbrain.com/alphas/{alpha_id}/submit"
+@metrics.timed("stage_seconds", stage="submit_alpha")
+def submit_alpha(alpha_id, max_rate_limit_retries=3):
+    url = f"{API_BASE}/alphas/{alpha_id}/submit"
     logger.info(f"正在提交alpha {alpha_id}")
     logger.info(f"请求URL: {url}")
 
     try:
         response = sess.post(url)
+        for _ in range(max_rate_limit_retries):
+            if response.status_code != 429:
+                break
+            wait_time = float(response.headers.get("Retry-After", 30))
+            logger.info(f"提交alpha {alpha_id} 被限流，等待 {wait_time} 秒后重试")
+            metrics.observe("submit_rate_limit_sleep_seconds", wait_time)
+            time.sleep(wait_time)
+            response = sess.post(url)
         logger.info(f"响应状态: {response.status_code}")
 
         if response.status_code == 201:
@@ -145,17 +157,26 @@ def submit_alpha(alpha_id):
             if result:
                 log_submission_result(alpha_id, result)
                 if submission_passed(result):
+                    metrics.inc("submissions_total", outcome="passed")
                     return True
+                if result_outcome(result) == PENDING:
+                    logger.error(f"alpha {alpha_id} 提交监控超时，结果未知")
+                    metrics.inc("submissions_total", outcome="timeout")
+                    return False
                 logger.error(f"alpha {alpha_id} 未通过检查，视为提交失败")
+                metrics.inc("submissions_total", outcome="failed_checks")
                 return False
             else:
                 logger.error(f"alpha {alpha_id} 提交监控超时")
+                metrics.inc("submissions_total", outcome="timeout")
                 return False
         else:
             logger.error(f"提交alpha {alpha_id} 失败，状态: {response.status_code}")
             logger.error(f"响应文本: {response.text}")
+            metrics.inc("submissions_total", outcome="rejected")
             return False
     except Exception as e:
+        metrics.inc("submissions_total", outcome="error")
         logger.error(f"提交alpha {alpha_id} 时出错: {str(e)}")
         logger.exception("完整报错跟踪:")
         return False
@@ -174,32 +195,18 @@ def build_alpha_filter(min_sharpe=1.0, min_fitness=0.5, min_return=0.0):
     return _alpha_filter
 
 
-def submit_filtered_alphas(
-    max_items=3000,
-    page_size=100,
-    batch_size=5,
-    min_sharpe=1.25,
-    min_fitness=1.0,
-    filter_fn=None,
-    retry_delay=60,
-):
-    """
-    Fetch unsubmitted alphas, filter by parameter conditions, and submit via backend API.
-    Expects global `sess` and `logger` to be defined in this module.
-    """
-    if sess is None:
-        raise Exception("Session not initialized. Call sign_in() first.")
-    url = "https://api.worldquantbrain.com/users/self/alphas"
-    offset = 0
-    total_submitted = 0
-
-    # Submitter ignores return threshold by default.
-    active_filter = filter_fn or build_alpha_filter(
-        min_sharpe=min_sharpe,
-        min_fitness=min_fitness,
-        min_return=0.0,
-    )
+def _iter_alpha_pages(max_items=3000, page_size=100, retry_delay=60, mirror=None):
+    """Yield pages (lists) of the newest unsubmitted alphas, from the server or the local mirror."""
+    if mirror is not None:
+        # walk the whole window so alphas submitted elsewhere are not offered again
+        mirror.sync(sess, page_size=page_size, max_items=max_items, reconcile=True)
+        window = mirror.select(window=max_items)
+        for start in range(0, len(window), page_size):
+            yield window[start:start + page_size]
+        return
 
+    url = ALPHAS_URL
+    offset = 0
     while offset < max_items:
         limit = min(page_size, max_items - offset)
         params = {
@@ -229,23 +236,196 @@ def submit_filtered_alphas(
         if not results:
             logger.info("No more alphas returned by server")
             break
+        yield results
+        offset += limit
 
-        filtered = [alpha for alpha in results if active_filter(alpha)]
-        logger.info(f"Filtered {len(filtered)} alphas from {len(results)} candidates")
 
-        for alpha in filtered[:batch_size]:
+def iter_submission_candidates(
+    select,
+    max_items=3000,
+    page_size=100,
+    batch_size=5,
+    retry_delay=60,
+    mirror=None,
+    screen=None,
+):
+    """
+    Page through unsubmitted alphas and yield the IDs worth submitting.
+
+    select: callable picking the candidates of one page (a list of alpha
+    dicts), e.g. a `select_alphas` partial; at most `batch_size` of them are
+    used. Alphas whose IS checks already FAIL and spelling variants of an
+    expression already yielded in this run are skipped. With a
+    CorrelationScreen, candidates that would fail self-correlation are dropped
+    and the rest are tried most distinct first. With an AlphaMirror
+    only alphas newer than its watermark are downloaded.
+    """
+    # Canonical expressions already tried this run; spelling variants of one alpha are submitted once.
+    tried_expressions = set()
+
+    for results in _iter_alpha_pages(max_items, page_size, retry_delay, mirror):
+        filtered = select(results)
+        logger.info(f"Selected {len(filtered)} alphas from {len(results)} candidates")
+
+        picked = []             # (alpha_id, canonical expression or None)
+        page_expressions = set()
+        for alpha in filtered:
+            if screen is None and len(picked) >= batch_size:
+                break
             alpha_id = alpha.get("id") or alpha.get("alphaId") or alpha.get("alpha") or alpha.get("name")
             if not alpha_id:
                 continue
-            if submit_alpha(alpha_id):
-                total_submitted += 1
+            if has_fail_checks(alpha):
+                logger.info(f"跳过alpha {alpha_id}: IS检查已有FAIL")
+                continue
+            regular = alpha.get("regular")
+            code = regular.get("code") if isinstance(regular, dict) else regular
+            expression_key = canonical_expression(code) if code else None
+            if expression_key is not None:
+                if expression_key in tried_expressions or expression_key in page_expressions:
+                    logger.info(f"跳过alpha {alpha_id}: 表达式与本轮已提交的alpha等价")
+                    continue
+                page_expressions.add(expression_key)
+            picked.append((alpha_id, expression_key))
+
+        if screen is not None and picked:
+            expressions = dict(picked)
+            picked = [(alpha_id, expressions[alpha_id]) for alpha_id, _ in screen.rank(list(expressions))]
+        # only what is actually handed out counts as tried; candidates cut by
+        # the ranking stay eligible on later pages
+        for alpha_id, expression_key in picked[:batch_size]:
+            if expression_key is not None:
+                tried_expressions.add(expression_key)
+            yield alpha_id
+
+
+def _prefetch(iterable, maxsize):
+    """Run `iterable` in a background thread so page fetching overlaps with submissions."""
+    done = object()
+    buffer = queue.Queue(maxsize=maxsize)
+
+    def produce():
+        try:
+            for item in iterable:
+                buffer.put(item)
+        except Exception as e:
+            logger.error(f"获取候选alpha时出错: {str(e)}")
+        finally:
+            buffer.put(done)
 
-        offset += limit
+    threading.Thread(target=produce, daemon=True).start()
+    while True:
+        item = buffer.get()
+        if item is done:
+            return
+        yield item
+
+
+def submit_filtered_alphas(
+    max_items=3000,
+    page_size=100,
+    batch_size=5,
+    min_sharpe=1.25,
+    min_fitness=1.0,
+    filter_fn=None,
+    retry_delay=60,
+    concurrency=1,
+    mirror=None,
+    rank_by=None,
+    pareto=False,
+    correlation_screen=None,
+):
+    """
+    Fetch unsubmitted alphas, filter by parameter conditions, and submit via backend API.
+    Expects global `sess` and `logger` to be defined in this module.
+
+    Candidates of each page are picked with `alpha_selection.select_alphas`:
+    thresholds, then optionally the Pareto front (pareto=True) and a ranking
+    by `rank_by` (e.g. "sharpe") before the top `batch_size` are taken. A
+    custom `filter_fn(alpha) -> bool` replaces the thresholds. A
+    CorrelationScreen skips candidates that would fail the self-correlation
+    check before they are POSTed; alphas submitted here join its reference.
+
+    With concurrency > 1, pages are fetched in a background thread while up to
+    `concurrency` submit-and-monitor tasks run at once. Keep it at or below the
+    number of submissions the platform lets you have pending. With an
+    AlphaMirror, candidates come from the local mirror after an incremental sync.
+    """
+    if sess is None:
+        raise Exception("Session not initialized. Call sign_in() first.")
+    total_submitted = 0
+
+    if filter_fn is not None:
+        def select(results):
+            return select_alphas(
+                [alpha for alpha in results if filter_fn(alpha)], rank_by=rank_by, pareto=pareto
+            )
+    else:
+        # Submitter ignores return threshold by default.
+        select = functools.partial(
+            select_alphas,
+            min_sharpe=min_sharpe,
+            min_fitness=min_fitness,
+            min_return=0.0,
+            rank_by=rank_by,
+            pareto=pareto,
+        )
+    candidates = iter_submission_candidates(
+        select,
+        max_items=max_items,
+        page_size=page_size,
+        batch_size=batch_size,
+        retry_delay=retry_delay,
+        mirror=mirror,
+        screen=correlation_screen,
+    )
+
+    def submit(alpha_id):
+        submitted = submit_alpha(alpha_id)
+        if submitted and mirror is not None:
+            mirror.mark_status(alpha_id, "ACTIVE")
+        if submitted and correlation_screen is not None:
+            correlation_screen.add_reference(alpha_id)
+        return submitted
+
+    if concurrency <= 1:
+        for alpha_id in candidates:
+            if submit(alpha_id):
+                total_submitted += 1
+    else:
+        slots = threading.BoundedSemaphore(concurrency)
+        futures = []
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            for alpha_id in _prefetch(candidates, maxsize=concurrency * 2):
+                slots.acquire()
+                future = pool.submit(submit, alpha_id)
+                future.add_done_callback(lambda _: slots.release())
+                futures.append(future)
+        total_submitted = sum(1 for future in futures if future.result())
 
     logger.info(f"Finished submitting. Total successful submits: {total_submitted}")
     return total_submitted
 
 
+def submitted_alpha_ids(mirror=None):
+    """
+    IDs of our submitted alphas: passed entries of the submission log plus
+    every ACTIVE alpha on the platform, so alphas submitted through the web
+    UI or other tools are screened against too. Without a mirror the ACTIVE
+    list is paged into a throw-away in-memory one.
+    """
+    alpha_ids = [
+        alpha_id for alpha_id, (status, _) in get_submission_log().latest_statuses().items()
+        if submission_outcome(status) == PASSED
+    ]
+    if mirror is None:
+        mirror = AlphaMirror(":memory:")
+    # reconcile: an alpha submitted elsewhere keeps its old dateCreated, below the watermark
+    mirror.sync(sess, status="ACTIVE", max_items=None, reconcile=True)
+    alpha_ids.extend(alpha["id"] for alpha in mirror.select(status="ACTIVE"))
+    return list(dict.fromkeys(alpha_ids))
+
+
 def batch_submit(batch_size=5):
     logger.info(f"开始批量提交，批次大小: {batch_size}")
     offset = 0
@@ -277,7 +457,7 @@ def batch_submit(batch_size=5):
     logger.info(f"批量提交完成，共成功提交 {total_submitted} 个alpha")
 
 
-def main():
+def main(argv=None):
     parser = argparse.ArgumentParser(description="将成功的alpha提交到WorldQuant Brain")
     parser.add_argument("--credentials", type=str, default=None,
                         help="凭据文件路径（默认：None，使用环境变量）")
@@ -293,18 +473,57 @@ def main():
                         help="Sharpe阈值（默认：1.25）")
     parser.add_argument("--min-fitness", type=float, default=1.0,
                         help="Fitness阈值（默认：1.0）")
+    parser.add_argument("--concurrency", type=int, default=1,
+                        help="同时进行的提交+监控任务数（默认：1，串行）")
+    parser.add_argument("--mirror", type=str, default=None,
+                        help="本地alpha镜像数据库路径（如 alpha_mirror.db），只增量同步新alpha")
+    parser.add_argument("--rank-by", type=str, default=None,
+                        help="每页候选按该指标降序排序后取前batch-size个（如 sharpe、fitness；前缀-为升序）")
+    parser.add_argument("--pareto", action="store_true",
+                        help="只提交 sharpe/fitness/turnover/drawdown 的 Pareto 前沿上的alpha")
+    parser.add_argument("--max-correlation", type=float, default=None,
+                        help="提交前先在本地用PnL算与已提交alpha（提交记录+平台上所有ACTIVE alpha）的相关性，超过该值（如 0.7）的跳过（默认：不筛）")
+    parser.add_argument("--pnl-store", type=str, default="pnl_store.db",
+                        help="本地PnL数据库路径（默认：pnl_store.db）")
+    parser.add_argument("--metrics", type=str, default="pipeline_metrics.prom",
+                        help="结束时把计数器/耗时直方图写到该文件（.json 为JSON，其余为Prometheus文本）")
+    parser.add_argument("--metrics-port", type=int, default=None,
+                        help="运行期间在 http://127.0.0.1:PORT/metrics 提供实时指标（默认：不开）")
+    parser.add_argument("--markdown", type=str, default=None,
+                        help="提交完后增量更新该目录下的Markdown文档（如 reports，读 alpha_results.db 和提交记录）")
+    parser.add_argument("--results", type=str, default="alpha_results.db",
+                        help="--markdown 用的结果库（默认：alpha_results.db）")
     parser.add_argument("--log-level", type=str, default="INFO",
                         choices=["DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL"],
                         help="设置日志级别（默认：INFO）")
-    args = parser.parse_args()
+    args = parser.parse_args(argv)
 
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
     logging.getLogger().setLevel(getattr(logging, args.log_level))
+    metrics.export_at_exit(args.metrics)
+    if args.metrics_port is not None:
+        metrics.serve(args.metrics_port)
     sign_in(credentials_path=args.credentials, username=args.username, password=args.password)
+    mirror = AlphaMirror(args.mirror) if args.mirror else None
+    correlation_screen = None
+    if args.max_correlation is not None:
+        correlation_screen = CorrelationScreen(
+            sess, submitted_alpha_ids(mirror), store=PnlStore(args.pnl_store), threshold=args.max_correlation
+        )
     submit_filtered_alphas(
         max_items=args.max_items,
         batch_size=args.batch_size,
         min_sharpe=args.min_sharpe,
         min_fitness=args.min_fitness,
+        concurrency=args.concurrency,
+        mirror=mirror,
+        rank_by=args.rank_by,
+        pareto=args.pareto,
+        correlation_screen=correlation_screen,
     )
+    if args.markdown:
+        from markdown_report import MarkdownReport
+        from result_store import ResultStore
+        MarkdownReport(ResultStore(args.results), log=get_submission_log(), mirror=mirror, out_dir=args.markdown).build()
 if __name__ == "__main__":
     main()
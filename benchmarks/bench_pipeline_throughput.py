@@ -0,0 +1,207 @@
+"""End-to-end throughput benchmark against the local fake Brain server.
+
+Usage:
+    python benchmarks/bench_pipeline_throughput.py [--alphas 60] [--simulation-time 0.2]
+        [--latency 0.01] [--session-ttl 5] [--rate-limit-probability 0.02] [--shared-rate-limit] [--json out.json]
+
+Starts benchmarks/fake_brain_server.py in-process, points the pipeline at it
+through WQB_API_BASE and runs, in a scratch directory:
+
+    simulate   testing_alphas serially, with several simulations in flight,
+               with multi-simulation batches, and over a pool of accounts
+    stream     StreamingPipeline: generate, simulate and evaluate concurrently,
+               qualifying children fed back as parents
+    generate   generate_alpha_variants (offline; no requests)
+    submit     submit_filtered_alphas over the fake inventory, serial and concurrent
+
+For every stage it reports alphas per hour, requests per alpha (counted by the
+server), alphas that came back without a result, wall time and the Python
+heap peak (tracemalloc, which slows the run a little but equally for every
+stage). The host-wide rate limiter (rate_limiter) is off unless
+--shared-rate-limit is given: its budgets are meant for the real API, and the
+fake server answers far faster than Brain would.
+"""
+import argparse
+import contextlib
+import io
+import json
+import logging
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, ".."))
+sys.path.insert(0, HERE)
+
+from fake_brain_server import FakeBrainServer  # noqa: E402
+
+PARENTS = [
+    "group_rank(ts_mean(close, 5)/ts_std_dev(volume, 20), subindustry)",
+    "ts_decay_linear(group_scale(ts_corr(close, volume, 15), market) + ts_quantile(vwap, 7), 9)",
+]
+
+
+def _simulation_payloads(count):
+    settings = {
+        "instrumentType": "EQUITY", "region": "USA", "universe": "TOP3000", "delay": 1, "decay": 1,
+        "neutralization": "SUBINDUSTRY", "truncation": 0.08, "pasteurization": "ON",
+        "unitHandling": "VERIFY", "nanHandling": "ON", "language": "FASTEXPR", "visualization": False,
+    }
+    return [
+        {"type": "REGULAR", "settings": settings, "regular": f"group_rank(ts_rank(field_{i}, {5 + i % 60}), sector)"}
+        for i in range(count)
+    ]
+
+
+def _measure(server, name, count_fn, run):
+    """Run `run()`, returning a result row; count_fn(output) -> (alphas handled, alphas without result)."""
+    server.reset_stats()
+    tracemalloc.start()
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        output = run()
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    handled, missing = count_fn(output)
+    requests_made = sum(server.stats.values())
+    return {
+        "stage": name,
+        "alphas": handled,
+        "missing": missing,
+        "seconds": round(elapsed, 3),
+        "alphas_per_hour": round(handled / elapsed * 3600) if elapsed else 0,
+        "requests": requests_made,
+        "requests_per_alpha": round(requests_made / handled, 2) if handled else None,
+        "peak_mib": round(peak / 2 ** 20, 2),
+    }
+
+
+def run_benchmarks(args, server):
+    import automatic_submitter
+    import iteration_main
+    import session_manager
+    from streaming_pipeline import StreamingPipeline
+    import pandas  # noqa: F401  (imported lazily by the pipeline; keep the import out of the memory peaks)
+    import variable_list
+
+    rows = []
+    payloads = _simulation_payloads(args.alphas)
+
+    def simulated(results):
+        if results is None:  # the serial path returns nothing, so failures cannot be counted
+            return len(payloads), None
+        return len(results), sum(1 for _, alpha_id in results if not alpha_id)
+
+    for label, max_in_flight, batch_size in (
+        ("simulate serial", 1, 1),
+        (f"simulate in-flight x{args.max_in_flight}", args.max_in_flight, 1),
+        (f"simulate batched x{args.max_in_flight}/{args.batch_size}", args.max_in_flight, args.batch_size),
+    ):
+        with contextlib.redirect_stdout(io.StringIO()):
+            sess = iteration_main.sign_in()
+        rows.append(_measure(server, label, simulated, lambda: iteration_main.testing_alphas(
+            payloads, sess, max_in_flight=max_in_flight, batch_size=batch_size,
+        )))
+
+    credentials_path = os.path.abspath("bench_credentials.json")
+    with open(credentials_path, "w") as f:
+        json.dump([{"username": f"bench{i}", "password": "bench"} for i in range(args.accounts)], f)
+    pool = session_manager.sign_in(credentials_path=credentials_path, pool=True)
+    rows.append(_measure(
+        server, f"simulate pool x{args.accounts} accounts", simulated, lambda: iteration_main.testing_alphas(
+            payloads, pool, max_in_flight=args.max_in_flight * len(pool), batch_size=1,
+        ),
+    ))
+
+    parents = [dict(variable_list.element, regular=code) for code in PARENTS]
+    with contextlib.redirect_stdout(io.StringIO()):
+        sess = iteration_main.sign_in()
+    rows.append(_measure(
+        server, f"stream closed-loop x{args.max_in_flight}/{args.batch_size}", lambda _: (args.alphas, None),
+        lambda: StreamingPipeline(
+            sess, iteration_main.sign_in, lambda: parents, max_depth=2,
+            max_in_flight=args.max_in_flight, batch_size=args.batch_size, max_total=args.alphas,
+            sample="stratified", seed=0,
+        ).run(),
+    ))
+    rows.append(_measure(
+        server, "generate variants", lambda variants: (len(variants), 0),
+        lambda: variable_list.generate_alpha_variants(parents, max_per_parent=args.variants_per_parent),
+    ))
+
+    for label, concurrency in (("submit serial", 1), (f"submit concurrent x{args.max_in_flight}", args.max_in_flight)):
+        automatic_submitter.sign_in(username="bench", password="bench")
+        rows.append(_measure(
+            server, label, lambda submitted: (submitted, 0),
+            lambda: automatic_submitter.submit_filtered_alphas(
+                max_items=args.submit_window, batch_size=args.submit_batch, concurrency=concurrency,
+                min_sharpe=1.25, min_fitness=0.5,
+            ),
+        ))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pipeline throughput against the fake Brain server")
+    parser.add_argument("--alphas", type=int, default=60, help="alphas simulated per simulate stage")
+    parser.add_argument("--max-in-flight", type=int, default=3)
+    parser.add_argument("--batch-size", type=int, default=10)
+    parser.add_argument("--accounts", type=int, default=3, help="accounts in the pooled simulate stage")
+    parser.add_argument("--variants-per-parent", type=int, default=20000)
+    parser.add_argument("--submit-window", type=int, default=200, help="newest unsubmitted alphas scanned")
+    parser.add_argument("--submit-batch", type=int, default=5, help="submissions per page")
+    parser.add_argument("--simulation-time", type=float, default=0.2)
+    parser.add_argument("--submit-time", type=float, default=0.2)
+    parser.add_argument("--latency", type=float, default=0.005, help="seconds added to every request")
+    parser.add_argument("--session-ttl", type=float, default=None)
+    parser.add_argument("--rate-limit-probability", type=float, default=0.0)
+    parser.add_argument("--json", type=str, default=None, help="also write the rows to this file")
+    parser.add_argument("--metrics", action="store_true", help="also print the pipeline_metrics summary of the run")
+    parser.add_argument("--shared-rate-limit", action="store_true",
+                        help="keep the host-wide rate limiter on (with a scratch state file)")
+    args = parser.parse_args()
+    if args.json:
+        args.json = os.path.abspath(args.json)
+
+    server = FakeBrainServer(
+        latency=args.latency, simulation_time=args.simulation_time, submit_time=args.submit_time,
+        max_concurrent_simulations=args.max_in_flight, session_ttl=args.session_ttl,
+        rate_limit_probability=args.rate_limit_probability, inventory=max(args.submit_window, 100),
+    ).start()
+    # must be set before the pipeline modules are imported: they read it once
+    os.environ["WQB_API_BASE"] = server.url
+    os.environ.setdefault("WQB_USERNAME", "bench")
+    os.environ.setdefault("WQB_PASSWORD", "bench")
+    scratch = tempfile.mkdtemp(prefix="bench_pipeline_")
+    if args.shared_rate_limit:
+        os.environ["WQB_RATE_LIMIT_PATH"] = os.path.join(scratch, "rate_limit.db")
+    else:
+        os.environ["WQB_RATE_LIMIT"] = "off"
+    os.chdir(scratch)
+    logging.disable(logging.WARNING)
+    try:
+        rows = run_benchmarks(args, server)
+    finally:
+        server.stop()
+
+    print(f"{'stage':<30} {'alphas':>7} {'missing':>8} {'seconds':>8} {'alphas/h':>10} {'req/alpha':>10} {'peak MiB':>9}")
+    for row in rows:
+        per_alpha = "-" if row["requests_per_alpha"] is None else f"{row['requests_per_alpha']:.2f}"
+        missing = "-" if row["missing"] is None else row["missing"]
+        print(f"{row['stage']:<30} {row['alphas']:>7} {missing:>8} {row['seconds']:>8.2f} "
+              f"{row['alphas_per_hour']:>10} {per_alpha:>10} {row['peak_mib']:>9.2f}")
+    if args.metrics:
+        from pipeline_metrics import metrics
+        print(metrics.summary())
+    print(f"(scratch files in {scratch})")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(rows, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+"""Micro-benchmark: token-slot variant substitution vs. the old regex passes.
+
+Usage:
+    python benchmarks/bench_variant_generation.py [--limit 50000] [--repeat 3]
+
+The legacy path below is the per-combination substitution variable_list used
+before tokenization: one `re.sub` with lookbehind/lookahead per operator or
+group dimension, plus a placeholder replace per number. Both paths render the
+same number of variants per parent; only rendering and dedupe are timed.
+The tokenized path also dedupes on the canonical expression (fastexpr), so
+parents with commutative operators cost more there than plain substitution.
+"""
+import argparse
+import copy
+import itertools
+import json
+import os
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import variable_list  # noqa: E402
+
+PARENTS = [
+    "group_rank(ts_mean(close, 5)/ts_std_dev(volume, 20), subindustry)",
+    "group_neutralize(ts_rank(ts_delta(close, 3), 60) * ts_zscore(returns, 22), industry)"
+    " - group_zscore(ts_sum(volume, 10)/ts_mean(volume, 40), sector)",
+    "ts_decay_linear(group_scale(ts_corr(close, volume, 15), market) + ts_quantile(vwap, 7), 9)",
+]
+
+
+def _legacy_token_present(alpha_code, token):
+    return re.search(rf"(?<!\w){re.escape(token)}(?!\w)", alpha_code) is not None
+
+
+def _legacy_replace_token(alpha_code, token, replacement):
+    return re.sub(rf"(?<!\w){re.escape(token)}(?!\w)", replacement, alpha_code)
+
+
+def _legacy_number_dimensions(alpha_code):
+    matches = list(re.finditer(r"\b\d+\b", alpha_code))
+    parts, last, dimensions = [], 0, []
+    for idx, match in enumerate(matches):
+        parts.append(alpha_code[last:match.start()])
+        placeholder = f"__NUM{idx}__"
+        parts.append(placeholder)
+        last = match.end()
+        dimensions.append((placeholder, variable_list._number_options(match.group(0)), match.group(0)))
+    parts.append(alpha_code[last:])
+    return "".join(parts), dimensions
+
+
+def legacy_variants(element, limit):
+    alpha_code = element["regular"]
+    template, number_dimensions = _legacy_number_dimensions(alpha_code)
+    token_dimensions = []
+    for candidates in (variable_list.group_list, variable_list.group_operator_list, variable_list.ts_operator_list):
+        for token in candidates:
+            if _legacy_token_present(alpha_code, token):
+                token_dimensions.append((token, [token] + [v for v in candidates if v != token], token))
+    dimensions = token_dimensions + number_dimensions
+    base_tokens = [token for token, _, _ in dimensions]
+    base_values = [original for _, _, original in dimensions]
+    seen = set()
+    out = []
+    for combo in itertools.product(*[options for _, options, _ in dimensions]):
+        if all(chosen == original for chosen, original in zip(combo, base_values)):
+            continue
+        new_code = template
+        for token, replacement in zip(base_tokens, combo):
+            if token.startswith("__NUM"):
+                new_code = new_code.replace(token, replacement)
+            else:
+                new_code = _legacy_replace_token(new_code, token, replacement)
+        new_element = copy.deepcopy(element)
+        new_element["regular"] = new_code
+        dedupe_key = json.dumps(new_element, sort_keys=True)
+        if dedupe_key not in seen:
+            seen.add(dedupe_key)
+            out.append(new_element)
+            if len(out) >= limit:
+                break
+    return out
+
+
+def tokenized_variants(element, limit):
+    return list(variable_list.iter_alpha_variants([element], max_per_parent=limit))
+
+
+def _best_of(fn, repeat):
+    best, produced = float("inf"), 0
+    for _ in range(repeat):
+        start = time.perf_counter()
+        produced = len(fn())
+        best = min(best, time.perf_counter() - start)
+    return best, produced
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark variant substitution")
+    parser.add_argument("--limit", type=int, default=50000, help="variants rendered per parent")
+    parser.add_argument("--repeat", type=int, default=3, help="best-of repetitions")
+    args = parser.parse_args()
+
+    print(f"{'parent':<48} {'variants':>9} {'regex s':>9} {'token s':>9} {'speedup':>8}")
+    for code in PARENTS:
+        element = dict(variable_list.element, regular=code)
+        legacy_s, legacy_n = _best_of(lambda: legacy_variants(element, args.limit), args.repeat)
+        token_s, token_n = _best_of(lambda: tokenized_variants(element, args.limit), args.repeat)
+        label = code if len(code) <= 45 else code[:45] + "..."
+        print(f"{label:<48} {min(legacy_n, token_n):>9} {legacy_s:>9.3f} {token_s:>9.3f} {legacy_s / token_s:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,392 @@
+"""Local stand-in for the WorldQuant Brain API.
+
+Usage:
+    python benchmarks/fake_brain_server.py [--port 8765] [--latency 0.02] ...
+    WQB_API_BASE=http://127.0.0.1:8765 python automatic_submitter.py ...
+
+or in-process (see bench_pipeline_throughput.py):
+
+    with FakeBrainServer(simulation_time=0.2) as server:
+        os.environ["WQB_API_BASE"] = server.url
+
+Emulates the endpoints the pipeline uses, with the platform's semantics:
+
+    POST /authentication                     201 + session cookie
+    POST /simulations                        201 + Location (single or list of up to 10)
+    GET  /simulations/{id}                   Retry-After while running, then alpha / children
+    GET  /users/self/alphas                  paginated, filter by status, order=-dateCreated
+    GET  /data-fields                        paginated with real `count`
+    GET  /alphas/{id}                        alpha record with IS metrics
+    GET  /alphas/{id}/recordsets/pnl         cumulative PnL records
+    POST /alphas/{id}/submit                 201, then GET polls with Retry-After until checked
+
+Latency, simulation and submission duration, the per-account
+concurrent-simulation limit (429 beyond it), random 429s and session expiry
+(401 after `session_ttl` seconds) are configurable. Simulations are only
+visible to the account that started them. `stats` counts requests per endpoint.
+"""
+import argparse
+import base64
+import collections
+import itertools
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+MAX_MULTI_SIMULATION_SIZE = 10
+
+
+def _retry_after(remaining):
+    # never "0": clients read a zero Retry-After as "finished"
+    return f"{min(max(remaining, 0.01), 1.0):.2f}"
+
+
+class FakeBrainState:
+    def __init__(
+        self,
+        simulation_time=0.5,
+        submit_time=0.5,
+        max_concurrent_simulations=3,
+        rate_limit_probability=0.0,
+        session_ttl=None,
+        inventory=500,
+        datafields=300,
+        pnl_days=1000,
+        seed=0,
+    ):
+        self.simulation_time = simulation_time
+        self.submit_time = submit_time
+        self.max_concurrent_simulations = max_concurrent_simulations
+        self.rate_limit_probability = rate_limit_probability
+        self.session_ttl = session_ttl
+        self.pnl_days = pnl_days
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.ids = itertools.count(1)
+        self.sessions = {}       # token -> (created_at, username)
+        self.simulations = {}    # id -> dict
+        self.alphas = {}         # id -> alpha record (insertion order = creation order)
+        self.submissions = {}    # alpha id -> submitted_at
+        self.stats = collections.Counter()
+        for _ in range(inventory):
+            self._new_alpha("ts_rank(close, %d)" % self.rng.randint(2, 250), {"region": "USA", "universe": "TOP3000", "delay": 1})
+        self.datafields = [
+            {
+                "id": f"field_{i}",
+                "type": "MATRIX" if i % 4 else "VECTOR",
+                "dataset": {"id": f"ds{i % 7}"},
+                "description": f"Synthetic datafield {i}",
+            }
+            for i in range(datafields)
+        ]
+
+    def _new_alpha(self, code, settings):
+        alpha_id = f"A{next(self.ids):07d}"
+        sharpe = round(self.rng.gauss(0.8, 0.8), 2)
+        self.alphas[alpha_id] = {
+            "id": alpha_id,
+            "type": "REGULAR",
+            "status": "UNSUBMITTED",
+            "dateCreated": time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime()) + f".{len(self.alphas):06d}-05:00",
+            "settings": dict(settings),
+            "regular": {"code": code},
+            "is": {
+                "sharpe": sharpe,
+                "fitness": round(sharpe * self.rng.uniform(0.4, 1.2), 2),
+                "returns": round(self.rng.uniform(-0.05, 0.25), 4),
+                "turnover": round(self.rng.uniform(0.02, 0.9), 4),
+                "drawdown": round(self.rng.uniform(0.01, 0.3), 4),
+                "margin": round(self.rng.uniform(0, 0.002), 6),
+                "checks": [{"name": "LOW_SHARPE", "result": "PASS" if sharpe >= 1.25 else "FAIL"}],
+            },
+        }
+        return alpha_id
+
+    def running_simulations(self, owner, now):
+        return sum(
+            1 for sim in self.simulations.values()
+            if sim["owner"] == owner and "children_of" not in sim and sim["done_at"] > now
+        )
+
+
+class _Handler(BaseHTTPRequestHandler):
+    server_version = "FakeBrain/1.0"
+    protocol_version = "HTTP/1.1"
+
+    # ---- PLUMBING ----
+
+    def log_message(self, format, *args):
+        pass
+
+    @property
+    def state(self):
+        return self.server.state
+
+    def _send(self, status, body=None, headers=None):
+        payload = b"" if body is None else json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _body(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        return json.loads(self.rfile.read(length)) if length else None
+
+    def _session_user(self):
+        """Username of a live session cookie, else None."""
+        cookie = self.headers.get("Cookie") or ""
+        match = re.search(r"t=([\w-]+)", cookie)
+        with self.state.lock:
+            session = self.state.sessions.get(match.group(1)) if match else None
+        if session is None:
+            return None
+        created, username = session
+        ttl = self.state.session_ttl
+        return username if ttl is None or time.time() - created < ttl else None
+
+    def _dispatch(self, method):
+        # always drain the body so early 401/429 answers keep the connection usable
+        self.payload = self._body()
+        if self.server.latency:
+            time.sleep(self.server.latency)
+        url = urlparse(self.path)
+        path = url.path.rstrip("/")
+        query = {key: values[0] for key, values in parse_qs(url.query).items()}
+        for pattern, endpoint, handler in self.server.routes[method]:
+            match = pattern.fullmatch(path)
+            if match is None:
+                continue
+            with self.state.lock:
+                self.state.stats[f"{method} {endpoint}"] += 1
+            self.user = self._session_user()
+            if endpoint != "/authentication" and self.user is None:
+                return self._send(401, {"detail": "Incorrect authentication credentials."})
+            if endpoint != "/authentication" and self.state.rng.random() < self.state.rate_limit_probability:
+                return self._send(429, {"detail": "Too many requests"}, {"Retry-After": "1"})
+            return handler(self, query, *match.groups())
+        self._send(404, {"detail": "Not found."})
+
+    def do_GET(self):
+        self._dispatch("GET")
+
+    def do_POST(self):
+        self._dispatch("POST")
+
+    # ---- ENDPOINTS ----
+
+    def authenticate(self, query):
+        token = uuid.uuid4().hex
+        authorization = self.headers.get("Authorization") or ""
+        try:
+            username = base64.b64decode(authorization.split(" ", 1)[1]).decode("utf-8").split(":", 1)[0]
+        except (IndexError, ValueError):
+            return self._send(401, {"detail": "Invalid username/password."})
+        with self.state.lock:
+            self.state.sessions[token] = (time.time(), username)
+        self._send(201, {"user": {"id": "FAKE"}, "token": {"expiry": self.state.session_ttl or 14400}},
+                   {"Set-Cookie": f"t={token}; Path=/"})
+
+    def create_simulation(self, query):
+        payload = self.payload
+        members = payload if isinstance(payload, list) else [payload]
+        if not members or len(members) > MAX_MULTI_SIMULATION_SIZE or not all(
+            isinstance(m, dict) and m.get("regular") for m in members
+        ):
+            return self._send(400, {"detail": "Invalid simulation request."})
+        now = time.time()
+        with self.state.lock:
+            if self.state.running_simulations(self.user, now) >= self.state.max_concurrent_simulations:
+                return self._send(429, {"detail": "CONCURRENT_SIMULATION_LIMIT_EXCEEDED"}, {"Retry-After": "1"})
+            sim_id = f"S{next(self.state.ids)}"
+            done_at = now + self.state.simulation_time
+            sim = {"done_at": done_at, "started": now, "owner": self.user}
+            if isinstance(payload, list):
+                sim["children"] = []
+                for member in members:
+                    child_id = f"S{next(self.state.ids)}"
+                    self.state.simulations[child_id] = {
+                        "done_at": done_at, "children_of": sim_id, "owner": self.user,
+                        "alpha": self.state._new_alpha(member["regular"], member.get("settings") or {}),
+                    }
+                    sim["children"].append(child_id)
+            else:
+                sim["alpha"] = self.state._new_alpha(payload["regular"], payload.get("settings") or {})
+            self.state.simulations[sim_id] = sim
+        self._send(201, None, {"Location": f"{self.server.url}/simulations/{sim_id}"})
+
+    def simulation_progress(self, query, sim_id):
+        with self.state.lock:
+            sim = self.state.simulations.get(sim_id)
+        if sim is None or sim["owner"] != self.user:
+            return self._send(404, {"detail": "Not found."})
+        remaining = sim["done_at"] - time.time()
+        if remaining > 0:
+            elapsed = time.time() - sim.get("started", sim["done_at"] - self.state.simulation_time)
+            progress = min(0.99, elapsed / max(self.state.simulation_time, 1e-9))
+            return self._send(200, {"progress": round(progress, 2)}, {"Retry-After": _retry_after(remaining)})
+        body = {"id": sim_id, "status": "COMPLETE"}
+        if "children" in sim:
+            body["children"] = sim["children"]
+        else:
+            body["alpha"] = sim["alpha"]
+        self._send(200, body)
+
+    def list_alphas(self, query):
+        limit = min(int(query.get("limit", 10)), 100)
+        offset = int(query.get("offset", 0))
+        status = query.get("status")
+        with self.state.lock:
+            alphas = [a for a in self.state.alphas.values() if status is None or a["status"] == status]
+        if query.get("order", "-dateCreated") == "-dateCreated":
+            alphas.reverse()
+        self._send(200, {"count": len(alphas), "results": alphas[offset:offset + limit]})
+
+    def list_datafields(self, query):
+        limit = min(int(query.get("limit", 50)), 50)
+        offset = int(query.get("offset", 0))
+        fields = self.state.datafields
+        if query.get("dataset.id"):
+            fields = [f for f in fields if f["dataset"]["id"] == query["dataset.id"]]
+        if query.get("search"):
+            fields = [f for f in fields if query["search"].lower() in f["id"] + f["description"].lower()]
+        self._send(200, {"count": len(fields), "results": fields[offset:offset + limit]})
+
+    def get_alpha(self, query, alpha_id):
+        with self.state.lock:
+            alpha = self.state.alphas.get(alpha_id)
+        if alpha is None:
+            return self._send(404, {"detail": "Not found."})
+        self._send(200, alpha)
+
+    def alpha_pnl(self, query, alpha_id):
+        if alpha_id not in self.state.alphas:
+            return self._send(404, {"detail": "Not found."})
+        rng = random.Random(alpha_id)
+        cumulative, records = 0.0, []
+        for day in range(self.state.pnl_days):
+            cumulative += rng.gauss(0, 1000)
+            records.append([time.strftime("%Y-%m-%d", time.gmtime(1262304000 + day * 86400)), round(cumulative, 2)])
+        self._send(200, {"schema": {"properties": [{"name": "date"}, {"name": "pnl"}]}, "records": records})
+
+    def submit_alpha(self, query, alpha_id):
+        with self.state.lock:
+            alpha = self.state.alphas.get(alpha_id)
+            if alpha is None:
+                return self._send(404, {"detail": "Not found."})
+            if alpha_id in self.state.submissions:
+                return self._send(403, {"detail": "Alpha already submitted."})
+            self.state.submissions[alpha_id] = time.time()
+        self._send(201, None, {"Location": f"{self.server.url}/alphas/{alpha_id}/submit"})
+
+    def submission_progress(self, query, alpha_id):
+        with self.state.lock:
+            submitted_at = self.state.submissions.get(alpha_id)
+            alpha = self.state.alphas.get(alpha_id)
+        if submitted_at is None or alpha is None:
+            return self._send(404, {"detail": "Not found."})
+        remaining = submitted_at + self.state.submit_time - time.time()
+        if remaining > 0:
+            return self._send(200, None, {"Retry-After": _retry_after(remaining)})
+        with self.state.lock:
+            passed = all(check["result"] != "FAIL" for check in alpha["is"]["checks"])
+            if passed:
+                alpha["status"] = "ACTIVE"
+        self._send(200, alpha)
+
+
+class FakeBrainServer:
+    """Threaded fake server; `url` is its base URL once started."""
+
+    def __init__(self, host="127.0.0.1", port=0, latency=0.0, **state_options):
+        self.state = FakeBrainState(**state_options)
+        self._httpd = ThreadingHTTPServer((host, port), _Handler)
+        self._httpd.daemon_threads = True
+        self._httpd.state = self.state
+        self._httpd.latency = latency
+        self._httpd.url = f"http://{host}:{self._httpd.server_address[1]}"
+        self._httpd.routes = {
+            "POST": [
+                (re.compile(r"/authentication"), "/authentication", _Handler.authenticate),
+                (re.compile(r"/simulations"), "/simulations", _Handler.create_simulation),
+                (re.compile(r"/alphas/([\w-]+)/submit"), "/alphas/{id}/submit", _Handler.submit_alpha),
+            ],
+            "GET": [
+                (re.compile(r"/simulations/([\w-]+)"), "/simulations/{id}", _Handler.simulation_progress),
+                (re.compile(r"/users/self/alphas"), "/users/self/alphas", _Handler.list_alphas),
+                (re.compile(r"/data-fields"), "/data-fields", _Handler.list_datafields),
+                (re.compile(r"/alphas/([\w-]+)/recordsets/pnl"), "/alphas/{id}/recordsets/pnl", _Handler.alpha_pnl),
+                (re.compile(r"/alphas/([\w-]+)/submit"), "/alphas/{id}/submit", _Handler.submission_progress),
+                (re.compile(r"/alphas/([\w-]+)"), "/alphas/{id}", _Handler.get_alpha),
+            ],
+        }
+        self._thread = None
+
+    @property
+    def url(self):
+        return self._httpd.url
+
+    @property
+    def stats(self):
+        with self.state.lock:
+            return collections.Counter(self.state.stats)
+
+    def reset_stats(self):
+        with self.state.lock:
+            self.state.stats.clear()
+
+    def start(self):
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local stand-in for the WorldQuant Brain API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every request")
+    parser.add_argument("--simulation-time", type=float, default=0.5)
+    parser.add_argument("--submit-time", type=float, default=0.5)
+    parser.add_argument("--max-concurrent-simulations", type=int, default=3)
+    parser.add_argument("--rate-limit-probability", type=float, default=0.0, help="chance of a random 429")
+    parser.add_argument("--session-ttl", type=float, default=None, help="seconds until a session gets 401s")
+    parser.add_argument("--inventory", type=int, default=500, help="pre-existing unsubmitted alphas")
+    parser.add_argument("--datafields", type=int, default=300)
+    args = parser.parse_args()
+    server = FakeBrainServer(
+        host=args.host, port=args.port, latency=args.latency,
+        simulation_time=args.simulation_time, submit_time=args.submit_time,
+        max_concurrent_simulations=args.max_concurrent_simulations,
+        rate_limit_probability=args.rate_limit_probability, session_ttl=args.session_ttl,
+        inventory=args.inventory, datafields=args.datafields,
+    )
+    print(f"Fake Brain API on {server.url} (WQB_API_BASE={server.url})")
+    try:
+        server._httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server._httpd.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,10 @@
+"""Shared WorldQuant Brain API constants used by the pipeline modules.
+
+Set WQB_API_BASE to point every module at another server, e.g. the local
+stand-in in benchmarks/fake_brain_server.py.
+"""
+import os
+
+API_BASE = os.environ.get("WQB_API_BASE", "https://api.worldquantbrain.com").rstrip("/")
+AUTHENTICATION_URL = f"{API_BASE}/authentication"
+SIMULATIONS_URL = f"{API_BASE}/simulations"
@@ -0,0 +1,106 @@
+"""The `requests.Session` behind session_manager.sign_in.
+
+Kept apart from session_manager so that importing the pipeline modules does
+not import `requests`; only code that actually logs in loads this module.
+"""
+import logging
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.auth import HTTPBasicAuth
+
+from brain_api import AUTHENTICATION_URL
+from pipeline_metrics import metrics
+from rate_limiter import endpoint_of, is_rate_limited, shared_rate_limiter
+from session_manager import DEFAULT_TOKEN_LIFETIME, REFRESH_MARGIN, AuthenticationError
+
+logger = logging.getLogger(__name__)
+
+# connections kept per host: scheduler polls plus ResultHarvester's workers
+DEFAULT_POOL_SIZE = 16
+
+
+class BrainSession(requests.Session):
+    """
+    requests.Session for one account that keeps its own login fresh.
+
+    Every request takes a token from the host-wide rate limiter first
+    (rate_limiter.shared_rate_limiter() unless `limiter` is given; False
+    turns it off). Rate-limit 429s are reported to the limiter, which pauses
+    every process using the account, and retried up to `max_rate_limit_retries`
+    times before the 429 is handed to the caller.
+
+    pool_maxsize: connections kept per host, shared by every thread using
+    the session (requests' default of 10 is smaller than a harvester plus a
+    scheduler need).
+    """
+
+    def __init__(self, username, password, refresh_margin=REFRESH_MARGIN, limiter=None, max_rate_limit_retries=3,
+                 pool_maxsize=DEFAULT_POOL_SIZE):
+        super().__init__()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_maxsize)
+        self.mount("https://", adapter)
+        self.mount("http://", adapter)
+        self.username = username
+        self.auth = HTTPBasicAuth(username, password)
+        self.refresh_margin = refresh_margin
+        self.expires_at = 0.0
+        self.lifetime = DEFAULT_TOKEN_LIFETIME
+        self.logins = 0
+        self._auth_lock = threading.Lock()
+        self.limiter = shared_rate_limiter() if limiter is None else (limiter or None)
+        self.max_rate_limit_retries = max_rate_limit_retries
+        metrics.instrument_session(self)
+
+    def authenticate(self):
+        """Log in (again) now. Raises AuthenticationError on refusal."""
+        with self._auth_lock:
+            self._authenticate()
+
+    def _authenticate(self):
+        response = super().request("POST", AUTHENTICATION_URL)
+        if response.status_code != 201:
+            raise AuthenticationError(f"Authentication failed for {self.username}: {response.text[:200]}")
+        try:
+            lifetime = float(response.json()["token"]["expiry"])
+        except (ValueError, KeyError, TypeError):
+            lifetime = DEFAULT_TOKEN_LIFETIME
+        self.lifetime = lifetime
+        self.expires_at = time.time() + lifetime
+        self.logins += 1
+        metrics.inc("logins_total", account=self.username)
+        logger.info(f"Logged into WorldQuant Brain as {self.username} (token valid {lifetime:.0f}s)")
+
+    def _refresh_if(self, stale, reason):
+        with self._auth_lock:
+            # another thread may have refreshed while we waited for the lock
+            if stale():
+                if self.logins:
+                    metrics.inc("session_refreshes_total", reason=reason)
+                self._authenticate()
+
+    def request(self, method, url, *args, **kwargs):
+        if url != AUTHENTICATION_URL:
+            margin = min(self.refresh_margin, self.lifetime / 10)
+            self._refresh_if(lambda: time.time() >= self.expires_at - margin, "expiry")
+        expires_at = self.expires_at
+        response = self._limited_request(method, url, *args, **kwargs)
+        if response.status_code == 401 and url != AUTHENTICATION_URL:
+            logger.warning(f"Session of {self.username} rejected (401); re-authenticating")
+            self._refresh_if(lambda: self.expires_at == expires_at, "401")
+            response = self._limited_request(method, url, *args, **kwargs)
+        return response
+
+    def _limited_request(self, method, url, *args, **kwargs):
+        if self.limiter is None:
+            return super().request(method, url, *args, **kwargs)
+        endpoint = endpoint_of(method, url)
+        for attempt in range(self.max_rate_limit_retries + 1):
+            self.limiter.acquire(endpoint, self.username)
+            response = super().request(method, url, *args, **kwargs)
+            if not is_rate_limited(response):
+                break
+            self.limiter.penalize(endpoint, self.username, response.headers.get("Retry-After"))
+        return response
@@ -0,0 +1,283 @@
+"""Single command line for the pipeline.
+
+    python cli.py generate  PARENTS [--out variants.jsonl] [--max-per-parent N] [--max-total N] [--sample stratified]
+    python cli.py simulate  PAYLOADS [--max-in-flight 3] [--batch-size 10] [--pool] [--no-journal] [--no-cache] [--no-results] [--daily-quota N]
+    python cli.py submit    [automatic_submitter 的全部参数]
+    python cli.py report    [--mirror alpha_mirror.db | --results alpha_results.db] [--sync] [--rank-by sharpe] [--top 20] [--pareto]
+    python cli.py markdown  [--out reports] [--results alpha_results.db] [--log submission_log.db] [--mirror alpha_mirror.db] [--full]
+    python cli.py queue     add PAYLOADS | status | retry-failed [--queue work_queue.db]
+    python cli.py worker    [--queue work_queue.db] [--max-in-flight 3] [--batch-size 10] [--pool] [--wait]
+
+PARENTS / PAYLOADS: a file (or - for stdin) with one simulation payload as
+JSON per line, or one bare FASTEXPR expression per line (simulated with the
+default settings of variable_list.element). `generate` writes the same JSONL
+format, so `generate ... | simulate -` works.
+
+Each subcommand imports what it needs when it runs, so `--help` and short
+jobs start without loading requests, pandas or sqlite.
+"""
+import argparse
+import json
+import logging
+import sys
+
+logger = logging.getLogger(__name__)
+
+
+def read_payloads(path):
+    """Yield payload dicts from a JSONL/expression file, `-` for stdin."""
+    from variable_list import element
+    f = sys.stdin if path == "-" else open(path, "r", encoding="utf-8")
+    try:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            if line.startswith("{"):
+                yield json.loads(line)
+            else:
+                yield dict(element, regular=line)
+    finally:
+        if f is not sys.stdin:
+            f.close()
+
+
+def cmd_generate(args):
+    from result_cache import ResultCache
+    from variable_list import iter_alpha_variants
+    cache = ResultCache(args.cache) if args.cache else None
+    out = sys.stdout if args.out == "-" else open(args.out, "w", encoding="utf-8")
+    count = 0
+    try:
+        for variant in iter_alpha_variants(
+            read_payloads(args.parents), cache=cache, max_per_parent=args.max_per_parent,
+            max_total=args.max_total, sample=args.sample, seed=args.seed,
+        ):
+            out.write(json.dumps(variant, ensure_ascii=True) + "\n")
+            count += 1
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    logger.info(f"{count} variants written to {args.out}")
+
+
+def cmd_simulate(args):
+    from iteration_main import testing_alphas
+    from pipeline_metrics import metrics
+    from result_cache import ResultCache
+    from result_store import ResultHarvester, ResultStore
+    from session_manager import account_count, sign_in
+    from simulation_journal import SimulationJournal
+    metrics.export_at_exit(args.metrics)
+    sess = sign_in(credentials_path=args.credentials, pool=args.pool)
+    harvester = None if args.no_results else ResultHarvester(sess, ResultStore(args.results))
+    journal = None if args.no_journal else SimulationJournal()
+    cache = None if args.no_cache else ResultCache()
+    payloads, on_result = read_payloads(args.payloads), None
+    if args.daily_quota is not None:
+        # 按期望价值排序，配额用完就停（剩下的留到明天）
+        from priority_scheduler import DailyQuota, PriorityScheduler
+        payloads = PriorityScheduler(DailyQuota(args.daily_quota), harvester=harvester, cache=cache, journal=journal)
+        payloads.extend(read_payloads(args.payloads))
+        on_result = payloads.on_result
+        logger.info(f"{len(payloads)} payloads queued, {payloads.quota.remaining()} simulations left today")
+    try:
+        results = testing_alphas(
+            payloads, sess,
+            max_in_flight=args.max_in_flight * account_count(sess), batch_size=args.batch_size,
+            journal=journal, cache=cache,
+            harvester=None if on_result is not None else harvester, on_result=on_result,
+        )
+    finally:
+        if harvester is not None:
+            harvester.close()
+    if results is not None:
+        logger.info(f"{sum(1 for _, alpha_id in results if alpha_id)}/{len(results)} alphas simulated")
+
+
+def cmd_queue(args):
+    from work_queue import WorkQueue
+    queue = WorkQueue(args.queue)
+    if args.action == "add":
+        if not args.payloads:
+            raise SystemExit("queue add needs a payload file (or - for stdin)")
+        added = queue.enqueue(read_payloads(args.payloads))
+        print(f"{added} payloads added to {args.queue}")
+    elif args.action == "retry-failed":
+        print(f"{queue.retry_failed()} failed tasks back in {args.queue}")
+    print(f"{args.queue}: {queue.counts()}")
+
+
+def cmd_worker(args):
+    from pipeline_metrics import metrics
+    from result_cache import ResultCache
+    from result_store import ResultHarvester, ResultStore
+    from session_manager import account_count, sign_in
+    from work_queue import WorkQueue, run_worker
+    metrics.export_at_exit(args.metrics)
+    sess = sign_in(credentials_path=args.credentials, pool=args.pool)
+    queue = WorkQueue(args.queue, lease_seconds=args.lease_seconds)
+    harvester = None if args.no_results else ResultHarvester(sess, ResultStore(args.results))
+    try:
+        run_worker(
+            queue, sess, lambda: sign_in(credentials_path=args.credentials, pool=args.pool),
+            max_in_flight=args.max_in_flight * account_count(sess), batch_size=args.batch_size,
+            cache=None if args.no_cache else ResultCache(), harvester=harvester, wait=args.wait,
+        )
+    finally:
+        if harvester is not None:
+            harvester.close()
+
+
+def cmd_submit(args):
+    import automatic_submitter
+    automatic_submitter.main(args.args)
+
+
+def cmd_report(args):
+    from alpha_selection import select_alphas
+    if args.results:
+        # 本地结果库：simulate 取回的完整结果，不需要同步
+        from result_store import ResultStore
+        source = ResultStore(args.results)
+        candidates = source.select()
+        label = f"alphas in {args.results}"
+    else:
+        from alpha_mirror import AlphaMirror
+        source = AlphaMirror(args.mirror)
+        if args.sync:
+            from session_manager import sign_in
+            source.sync(sign_in(credentials_path=args.credentials), status=args.status, max_items=args.window)
+        candidates = source.select(status=args.status, window=args.window)
+        label = f"{args.status} alphas in {args.mirror}"
+    alphas = select_alphas(
+        candidates, min_sharpe=args.min_sharpe, min_fitness=args.min_fitness,
+        rank_by=args.rank_by, top_k=args.top, pareto=args.pareto,
+    )
+    print(f"{len(alphas)} {label} pass the filters ({len(source)} stored)")
+    print(f"{'id':<10} {'sharpe':>7} {'fitness':>8} {'turnover':>9} {'returns':>8}  code")
+    for alpha in alphas:
+        stats = alpha.get("is") or {}
+        regular = alpha.get("regular")
+        code = regular.get("code") if isinstance(regular, dict) else regular
+        values = [stats.get(name) for name in ("sharpe", "fitness", "turnover", "returns")]
+        cells = ["-" if value is None else f"{value:.2f}" for value in values]
+        print(f"{alpha.get('id', ''):<10} {cells[0]:>7} {cells[1]:>8} {cells[2]:>9} {cells[3]:>8}  {code}")
+
+
+def cmd_markdown(args):
+    import os
+    from markdown_report import MarkdownReport
+    from result_store import ResultStore
+    from submission_log import SubmissionLog
+    log = SubmissionLog(args.log) if os.path.exists(args.log) else None
+    mirror = None
+    if args.mirror and os.path.exists(args.mirror):
+        from alpha_mirror import AlphaMirror
+        mirror = AlphaMirror(args.mirror)
+    stats = MarkdownReport(ResultStore(args.results), log=log, mirror=mirror, out_dir=args.out).build(full=args.full)
+    print(f"{args.out}: {stats['written']} files written, {stats['removed']} removed, "
+          f"{stats['unchanged']} sections unchanged ({stats['seconds']}s)")
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="WorldQuant Brain alpha pipeline")
+    parser.add_argument("--log-level", type=str, default="INFO",
+                        choices=["DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL"])
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    generate = commands.add_parser("generate", help="由父alpha生成变体（离线，不发请求）")
+    generate.add_argument("parents", help="父alpha文件（JSONL payload 或每行一个表达式），- 为标准输入")
+    generate.add_argument("--out", default="-", help="输出JSONL（默认：标准输出）")
+    generate.add_argument("--max-per-parent", type=int, default=None)
+    generate.add_argument("--max-total", type=int, default=None)
+    generate.add_argument("--sample", choices=["random", "stratified"], default=None)
+    generate.add_argument("--seed", type=int, default=None)
+    generate.add_argument("--cache", default=None, help="跳过该结果缓存（如 result_cache.db）里已模拟过的变体")
+    generate.set_defaults(func=cmd_generate)
+
+    simulate = commands.add_parser("simulate", help="模拟一个payload文件")
+    simulate.add_argument("payloads", help="JSONL payload 或每行一个表达式，- 为标准输入")
+    simulate.add_argument("--max-in-flight", type=int, default=3, help="每个账号同时跑的模拟数（默认：3）")
+    simulate.add_argument("--batch-size", type=int, default=10, help="每个multi-simulation的alpha数（默认：10）")
+    simulate.add_argument("--credentials", default=None, help="凭据文件（默认：credential.txt 或环境变量）")
+    simulate.add_argument("--pool", action="store_true", help="用凭据文件里的所有账号")
+    simulate.add_argument("--no-journal", action="store_true", help="不读写 simulation_journal.db")
+    simulate.add_argument("--no-cache", action="store_true", help="不读写 result_cache.db")
+    simulate.add_argument("--results", default="alpha_results.db", help="完整结果（IS指标+checks）存到这里")
+    simulate.add_argument("--no-results", action="store_true", help="不取回完整结果")
+    simulate.add_argument("--daily-quota", type=int, default=None,
+                          help="按期望价值排序并限制每天的模拟数（记在 simulation_quota.db）")
+    simulate.add_argument("--metrics", default="pipeline_metrics.prom")
+    simulate.set_defaults(func=cmd_simulate)
+
+    markdown = commands.add_parser("markdown", help="增量生成已提交/可提交alpha的Markdown文档")
+    markdown.add_argument("--out", default="reports")
+    markdown.add_argument("--results", default="alpha_results.db")
+    markdown.add_argument("--log", default="submission_log.db", help="提交记录（automatic_submitter 写的）")
+    markdown.add_argument("--mirror", default="alpha_mirror.db", help="补上结果库里没有的已提交alpha")
+    markdown.add_argument("--full", action="store_true", help="忽略上次的状态，全部重写")
+    markdown.set_defaults(func=cmd_markdown)
+
+    queue = commands.add_parser("queue", help="多进程/多机共享的模拟任务队列")
+    queue.add_argument("action", choices=["add", "status", "retry-failed"])
+    queue.add_argument("payloads", nargs="?", help="add 时：JSONL payload 或每行一个表达式，- 为标准输入")
+    queue.add_argument("--queue", default="work_queue.db")
+    queue.set_defaults(func=cmd_queue)
+
+    worker = commands.add_parser("worker", help="从任务队列领任务模拟（可以开多个）")
+    worker.add_argument("--queue", default="work_queue.db")
+    worker.add_argument("--max-in-flight", type=int, default=3, help="每个账号同时跑的模拟数（默认：3）")
+    worker.add_argument("--batch-size", type=int, default=10)
+    worker.add_argument("--lease-seconds", type=float, default=600, help="worker 停止心跳多久后任务被别人接手")
+    worker.add_argument("--wait", action="store_true", help="队列空了也不退出，等新任务")
+    worker.add_argument("--credentials", default=None)
+    worker.add_argument("--pool", action="store_true")
+    worker.add_argument("--no-cache", action="store_true")
+    worker.add_argument("--results", default="alpha_results.db")
+    worker.add_argument("--no-results", action="store_true")
+    worker.add_argument("--metrics", default="pipeline_metrics.prom")
+    worker.set_defaults(func=cmd_worker)
+
+    submit = commands.add_parser("submit", add_help=False, help="提交alpha（参数同 automatic_submitter.py）")
+    submit.add_argument("args", nargs="*", help="automatic_submitter.py 的参数")
+    submit.set_defaults(func=cmd_submit)
+
+    report = commands.add_parser("report", help="列出本地镜像里最好的alpha")
+    report.add_argument("--mirror", default="alpha_mirror.db")
+    report.add_argument("--results", default=None, help="改为读 simulate 存下的结果库（如 alpha_results.db）")
+    report.add_argument("--sync", action="store_true", help="先增量同步镜像（需要登录）")
+    report.add_argument("--credentials", default=None)
+    report.add_argument("--status", default="UNSUBMITTED")
+    report.add_argument("--window", type=int, default=3000, help="只看最新的N个alpha")
+    report.add_argument("--min-sharpe", type=float, default=None)
+    report.add_argument("--min-fitness", type=float, default=None)
+    report.add_argument("--rank-by", default="sharpe")
+    report.add_argument("--top", type=int, default=20)
+    report.add_argument("--pareto", action="store_true")
+    report.set_defaults(func=cmd_report)
+    return parser
+
+
+def main(argv=None):
+    parser = build_parser()
+    argv = sys.argv[1:] if argv is None else list(argv)
+    args = None
+    if "submit" in argv:
+        # everything after `submit` goes to automatic_submitter untouched, --help included
+        split = argv.index("submit") + 1
+        args = parser.parse_args(argv[:split])
+        if args.command == "submit":
+            args.args = argv[split:]
+        else:
+            args = None
+    if args is None:
+        args = parser.parse_args(argv)
+    if args.command != "submit":  # automatic_submitter configures logging itself
+        logging.basicConfig(level=getattr(logging, args.log_level),
+                            format="%(asctime)s - %(levelname)s - %(message)s")
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""Pre-submission self-correlation screening.
+
+The platform rejects an alpha whose daily PnL correlates above 0.7 with one of
+our submitted alphas, but `submit_alpha` only finds out after the POST and
+minutes of monitoring. `CorrelationScreen` keeps the submitted alphas' daily
+PnL as a standardized matrix and scores a batch of candidates against it with
+one matrix product: candidates above `threshold` are dropped and the rest are
+returned most distinct first.
+"""
+import logging
+
+from pnl_store import PnlStore
+
+logger = logging.getLogger(__name__)
+
+SELF_CORRELATION_LIMIT = 0.7
+# The platform compares the last four years of daily PnL.
+LOOKBACK_DAYS = 4 * 252
+
+
+def _standardize(matrix):
+    """Centre each column and scale it to unit norm; constant columns become 0."""
+    import numpy as np
+    centred = matrix - matrix.mean(axis=0)
+    norms = np.linalg.norm(centred, axis=0)
+    norms[norms == 0] = np.inf
+    return centred / norms
+
+
+def max_correlations(candidates, reference, lookback=LOOKBACK_DAYS):
+    """
+    Highest Pearson correlation of each candidate column with any reference column.
+
+    candidates, reference: daily PnL DataFrames indexed by date. Both are
+    aligned on the last `lookback` dates of the reference; missing days count
+    as zero PnL. Returns a Series indexed like candidates' columns.
+    """
+    import numpy as np
+    import pandas as pd
+    if candidates.empty:
+        return pd.Series(dtype=float)
+    if reference.empty:
+        return pd.Series(0.0, index=candidates.columns)
+    dates = reference.index[-lookback:]
+    ref = _standardize(reference.reindex(dates).fillna(0.0).to_numpy())
+    cand = _standardize(candidates.reindex(dates).fillna(0.0).to_numpy())
+    corr = cand.T @ ref  # (candidates, reference)
+    return pd.Series(np.nan_to_num(corr).max(axis=1), index=candidates.columns)
+
+
+class CorrelationScreen:
+    """
+    Screen candidate alpha IDs against the PnL of submitted alphas.
+
+    reference_ids: IDs of alphas already submitted; their PnL is fetched once
+    into the store. Call `add_reference` after each successful submission so
+    later candidates are compared with it too.
+    """
+
+    def __init__(self, sess, reference_ids, store=None, threshold=SELF_CORRELATION_LIMIT,
+                 lookback=LOOKBACK_DAYS, max_workers=8):
+        self.sess = sess
+        self.store = store if store is not None else PnlStore()
+        self.threshold = threshold
+        self.lookback = lookback
+        self.max_workers = max_workers
+        self.reference_ids = self.store.ensure(sess, reference_ids, max_workers=max_workers)
+        self._reference = None
+        logger.info(f"Correlation screen: {len(self.reference_ids)} submitted alphas as reference")
+
+    def _reference_frame(self):
+        if self._reference is None:
+            self._reference = self.store.daily_frame(self.reference_ids)
+        return self._reference
+
+    def add_reference(self, alpha_id):
+        if alpha_id in self.reference_ids:
+            return
+        if self.store.ensure(self.sess, [alpha_id]):
+            self.reference_ids.append(alpha_id)
+            self._reference = None
+
+    def scores(self, alpha_ids):
+        """Max self-correlation per candidate ID (candidates without PnL are left out)."""
+        available = self.store.ensure(self.sess, alpha_ids, max_workers=self.max_workers)
+        return max_correlations(self.store.daily_frame(available), self._reference_frame(), self.lookback)
+
+    def rank(self, alpha_ids):
+        """
+        `[(alpha_id, max_correlation)]` for candidates at or below the threshold,
+        most distinct first. A candidate is also dropped when it correlates
+        above the threshold with a more distinct candidate of the same batch,
+        since only one of the two could pass once the other is submitted.
+        Candidates whose PnL could not be fetched are kept at the end with
+        correlation None and left to the platform check.
+        """
+        available = self.store.ensure(self.sess, alpha_ids, max_workers=self.max_workers)
+        candidates = self.store.daily_frame(available)
+        scores = max_correlations(candidates, self._reference_frame(), self.lookback).sort_values(kind="stable")
+        passed = [alpha_id for alpha_id, corr in scores.items() if corr <= self.threshold]
+        for alpha_id, corr in scores.items():
+            if corr > self.threshold:
+                logger.info(f"跳过alpha {alpha_id}: 与已提交alpha的相关性 {corr:.3f} > {self.threshold}")
+        ranked = []
+        if passed:
+            reference = self._reference_frame()
+            dates = (candidates if reference.empty else reference).index[-self.lookback:]
+            z = _standardize(candidates[passed].reindex(dates).fillna(0.0).to_numpy())
+            within = z.T @ z
+            accepted = []
+            for i, alpha_id in enumerate(passed):
+                if accepted and within[i, accepted].max() > self.threshold:
+                    logger.info(f"跳过alpha {alpha_id}: 与本批更独特的候选alpha相关性过高")
+                    continue
+                accepted.append(i)
+                ranked.append((alpha_id, float(scores[alpha_id])))
+        ranked.extend((alpha_id, None) for alpha_id in alpha_ids if alpha_id not in scores.index)
+        return ranked
@@ -0,0 +1,128 @@
+"""Local, TTL-cached catalog of /data-fields with concurrent page fetching.
+
+`get_datafields` used to page through /data-fields serially on every script
+start (and truncated search results at 100). `DatafieldCatalog` reads the
+real `count` from the first page, fetches the remaining pages concurrently,
+and stores the result as JSON per (instrumentType, region, delay, universe,
+dataset, search). Later calls within `ttl` seconds are served from disk, and
+`query` filters a cached catalog locally by type, dataset and search term.
+"""
+import hashlib
+import json
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlencode
+
+from brain_api import API_BASE
+
+logger = logging.getLogger(__name__)
+
+DATAFIELDS_URL = f"{API_BASE}/data-fields"
+DEFAULT_CATALOG_DIR = ".datafield_cache"
+PAGE_SIZE = 50  # maximum the endpoint accepts
+
+
+class DatafieldCatalog:
+    def __init__(self, sess, cache_dir=DEFAULT_CATALOG_DIR, ttl=24 * 3600, max_workers=8, max_retries=3, retry_delay=10):
+        self.sess = sess
+        self.cache_dir = cache_dir
+        self.ttl = ttl
+        self.max_workers = max_workers
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+        os.makedirs(cache_dir, exist_ok=True)
+
+    @staticmethod
+    def _params(searchScope, dataset_id, search, offset):
+        params = {
+            "instrumentType": searchScope["instrumentType"],
+            "region": searchScope["region"],
+            "delay": str(searchScope["delay"]),
+            "universe": searchScope["universe"],
+            "limit": PAGE_SIZE,
+            "offset": offset,
+        }
+        if dataset_id:
+            params["dataset.id"] = dataset_id
+        if search:
+            params["search"] = search
+        return params
+
+    def _cache_path(self, searchScope, dataset_id, search):
+        key = "|".join(str(part) for part in (
+            searchScope["instrumentType"], searchScope["region"], searchScope["delay"],
+            searchScope["universe"], dataset_id, search,
+        ))
+        readable = "_".join(str(part) for part in (
+            searchScope["region"], searchScope["universe"], f"d{searchScope['delay']}", dataset_id or "all",
+        ))
+        return os.path.join(self.cache_dir, f"{readable}_{hashlib.sha1(key.encode('utf-8')).hexdigest()[:10]}.json")
+
+    def _get_page(self, searchScope, dataset_id, search, offset):
+        url = f"{DATAFIELDS_URL}?{urlencode(self._params(searchScope, dataset_id, search, offset))}"
+        for attempt in range(self.max_retries):
+            try:
+                response = self.sess.get(url)
+                if response.status_code == 429:
+                    wait_time = float(response.headers.get("Retry-After", self.retry_delay))
+                    logger.info(f"Rate limited on data-fields offset {offset}. Waiting {wait_time} seconds...")
+                    time.sleep(wait_time)
+                    continue
+                response.raise_for_status()
+                return response.json()
+            except Exception as e:
+                logger.warning(f"data-fields offset {offset} failed (attempt {attempt + 1}): {e}")
+                time.sleep(self.retry_delay)
+        raise RuntimeError(f"Could not fetch data-fields page at offset {offset}")
+
+    def fetch(self, searchScope, dataset_id="", search=""):
+        """Download every page from the server, ignoring the local cache."""
+        first = self._get_page(searchScope, dataset_id, search, 0)
+        count = first.get("count", 0)
+        results = list(first.get("results", []))
+        offsets = range(PAGE_SIZE, count, PAGE_SIZE)
+        if offsets:
+            with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+                # map keeps page order, so the catalog order matches serial paging
+                for page in pool.map(lambda x: self._get_page(searchScope, dataset_id, search, x), offsets):
+                    results.extend(page.get("results", []))
+        logger.info(f"Fetched {len(results)}/{count} datafields in {len(offsets) + 1} pages")
+        return results
+
+    def load(self, searchScope, dataset_id="", search="", refresh=False):
+        """Catalog entries (list of dicts) for a scope, from disk when fresher than `ttl`."""
+        path = self._cache_path(searchScope, dataset_id, search)
+        if not refresh and os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                cached = json.load(f)
+            if time.time() - cached.get("fetched_at", 0) < self.ttl:
+                return cached["results"]
+        results = self.fetch(searchScope, dataset_id, search)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"fetched_at": time.time(), "results": results}, f)
+        os.replace(tmp_path, path)
+        return results
+
+    def query(self, searchScope, dataset_id="", type=None, dataset=None, search=None, refresh=False):
+        """
+        Filter the cached catalog of a scope locally; returns a DataFrame.
+
+        type: datafield type such as "MATRIX" or "VECTOR"; dataset: dataset id
+        (useful when `dataset_id` is empty and the whole scope is cached);
+        search: case-insensitive substring of the field id or description.
+        """
+        import pandas as pd
+        needle = search.lower() if search else None
+        rows = []
+        for item in self.load(searchScope, dataset_id, refresh=refresh):
+            if type and item.get("type") != type:
+                continue
+            if dataset and (item.get("dataset") or {}).get("id") != dataset:
+                continue
+            if needle and needle not in item.get("id", "").lower() and needle not in (item.get("description") or "").lower():
+                continue
+            rows.append(item)
+        return pd.DataFrame(rows)
@@ -0,0 +1,374 @@
+"""Small FASTEXPR parser and canonical printer.
+
+Expressions are parsed into a tuple-based AST and printed back in one
+canonical form, so alphas that differ only in whitespace, redundant
+parentheses, number spelling (5.0 vs 5), keyword-argument order or the
+order of commutative operands get the same identity key.
+
+Grammar (lowest to highest precedence):
+
+    program     := statement (';' statement)* [';']
+    statement   := NAME '=' expr | expr
+    expr        := or ['?' expr ':' expr]
+    or          := and ('||' and)*
+    and         := compare ('&&' compare)*
+    compare     := additive (('<' | '<=' | '>' | '>=' | '==' | '!=') additive)*
+    additive    := multiplicative (('+' | '-') multiplicative)*
+    multiplicative := unary (('*' | '/') unary)*
+    unary       := ('-' | '+' | '!') unary | power
+    power       := primary ['^' unary]
+    primary     := NUMBER | STRING | NAME | NAME '(' [arg (',' arg)*] ')' | '(' expr ')'
+    arg         := NAME '=' expr | expr
+
+AST nodes are tuples whose first item is the node kind:
+("num", float), ("str", text), ("name", id), ("call", name, args, kwargs),
+("unary", op, operand), ("binop", op, left, right),
+("ternary", cond, if_true, if_false), ("assign", name, value),
+("program", statements). `kwargs` is a tuple of (name, node) pairs.
+"""
+import re
+
+# Binary operators with precedence; commutative ones get their operands sorted.
+# Associative ones are also flattened, so a + (b + c) and (a + b) + c agree;
+# == and != are not associative ((a == b) == c is not a == (b == c)), so they
+# only swap their two operands.
+_BINARY_PRECEDENCE = {
+    "||": 2, "&&": 3,
+    "<": 4, "<=": 4, ">": 4, ">=": 4, "==": 4, "!=": 4,
+    "+": 5, "-": 5,
+    "*": 6, "/": 6,
+    "^": 8,
+}
+_COMMUTATIVE_OPERATORS = {"+", "*", "==", "!=", "&&", "||"}
+_ASSOCIATIVE_OPERATORS = {"+", "*", "&&", "||"}
+_COMMUTATIVE_FUNCTIONS = {"add", "multiply", "max", "min"}
+_TERNARY_PRECEDENCE = 1
+_UNARY_PRECEDENCE = 7
+_ATOM_PRECEDENCE = 9
+
+_TOKEN_RE = re.compile(
+    r"""
+    (?:\d+\.\d*|\.\d+|\d+)(?:[eE][+-]?\d+)?
+    |[A-Za-z_][A-Za-z0-9_.]*
+    |"[^"]*"|'[^']*'
+    |<=|>=|==|!=|&&|\|\|
+    |\S
+    """,
+    re.VERBOSE,
+)
+_NUMBER_RE = re.compile(r"(?:\d+\.\d*|\.\d+|\d+)(?:[eE][+-]?\d+)?")
+_SINGLE_CHAR_OPERATORS = set("-+*/^<>!?:;,()=")
+
+
+class FastExprSyntaxError(ValueError):
+    """Raised when an expression cannot be parsed."""
+
+
+def tokenize(code: str):
+    """Return the list of token strings, whitespace dropped."""
+    tokens = _TOKEN_RE.findall(code)
+    for token in tokens:
+        if len(token) == 1 and not token.isalnum() and token != "_" and token not in _SINGLE_CHAR_OPERATORS:
+            raise FastExprSyntaxError(f"Unexpected character {token!r} in {code!r}")
+    return tokens
+
+
+def _is_name(token):
+    return token is not None and (token[0].isalpha() or token[0] == "_")
+
+
+class _Parser:
+    """Recursive descent for statements and calls, precedence climbing for operators."""
+
+    def __init__(self, code):
+        self.code = code
+        self.tokens = tokenize(code)
+        self.pos = 0
+
+    def peek(self, offset=0):
+        index = self.pos + offset
+        return self.tokens[index] if index < len(self.tokens) else None
+
+    def take(self, text=None):
+        token = self.peek()
+        if token is None or (text is not None and token != text):
+            raise FastExprSyntaxError(f"Expected {text or 'token'} at token {self.pos} in {self.code!r}, got {token!r}")
+        self.pos += 1
+        return token
+
+    def accept(self, text):
+        if self.pos < len(self.tokens) and self.tokens[self.pos] == text:
+            self.pos += 1
+            return True
+        return False
+
+    def program(self):
+        statements = [self.statement()]
+        while self.accept(";"):
+            if self.peek() is None:
+                break
+            statements.append(self.statement())
+        if self.peek() is not None:
+            raise FastExprSyntaxError(f"Unexpected {self.peek()!r} at token {self.pos} in {self.code!r}")
+        return statements[0] if len(statements) == 1 else ("program", tuple(statements))
+
+    def statement(self):
+        if _is_name(self.peek()) and self.peek(1) == "=":
+            name = self.take()
+            self.take("=")
+            return ("assign", name, self.expr())
+        return self.expr()
+
+    def expr(self):
+        cond = self.binary(2)
+        if self.accept("?"):
+            if_true = self.expr()
+            self.take(":")
+            return ("ternary", cond, if_true, self.expr())
+        return cond
+
+    def binary(self, min_precedence):
+        left = self.unary()
+        tokens = self.tokens
+        while self.pos < len(tokens):
+            op = tokens[self.pos]
+            precedence = _BINARY_PRECEDENCE.get(op)
+            if precedence is None or precedence < min_precedence or op == "^":
+                break
+            self.pos += 1
+            left = ("binop", op, left, self.binary(precedence + 1))
+        return left
+
+    def unary(self):
+        token = self.peek()
+        if token in ("-", "+", "!"):
+            self.pos += 1
+            operand = self.unary()
+            if token == "+":
+                return operand
+            if token == "-" and operand[0] == "num":
+                return ("num", -operand[1])
+            return ("unary", token, operand)
+        base = self.primary()
+        if self.accept("^"):
+            return ("binop", "^", base, self.unary())
+        return base
+
+    def primary(self):
+        token = self.take()
+        first = token[0]
+        if first.isdigit() or (first == "." and len(token) > 1):
+            return ("num", float(token))
+        if first in "\"'":
+            return ("str", token[1:-1])
+        if first.isalpha() or first == "_":
+            if self.accept("("):
+                return self.call(token)
+            return ("name", token)
+        if token == "(":
+            inner = self.expr()
+            self.take(")")
+            return inner
+        raise FastExprSyntaxError(f"Unexpected {token!r} at token {self.pos - 1} in {self.code!r}")
+
+    def call(self, name):
+        args, kwargs = [], []
+        if not self.accept(")"):
+            while True:
+                if _is_name(self.peek()) and self.peek(1) == "=":
+                    key = self.take()
+                    self.take("=")
+                    kwargs.append((key, self.expr()))
+                else:
+                    args.append(self.expr())
+                if self.accept(")"):
+                    break
+                self.take(",")
+        return ("call", name, tuple(args), tuple(kwargs))
+
+
+def parse(code: str):
+    """Parse a FASTEXPR expression (or ';'-separated program) into an AST."""
+    return _Parser(code).program()
+
+
+def _format_number(value: float) -> str:
+    # abs() first: int() of an overflowed literal (inf) raises OverflowError
+    if abs(value) < 1e15 and value == int(value):
+        return str(int(value))
+    return repr(value)
+
+
+def _precedence(node):
+    kind = node[0]
+    if kind == "binop":
+        return _BINARY_PRECEDENCE[node[1]]
+    if kind == "unary":
+        return _UNARY_PRECEDENCE
+    if kind == "ternary":
+        return _TERNARY_PRECEDENCE
+    if kind == "num" and node[1] < 0:
+        return _UNARY_PRECEDENCE
+    return _ATOM_PRECEDENCE
+
+
+def _wrap(node, min_precedence, subs=None):
+    text = to_canonical(node, subs)
+    return f"({text})" if _precedence(node) < min_precedence else text
+
+
+def _flatten(node, op):
+    if node[0] == "binop" and node[1] == op:
+        return _flatten(node[2], op) + _flatten(node[3], op)
+    return [node]
+
+
+def to_canonical(node, subs=None) -> str:
+    """Print an AST in canonical form; `subs` maps identifiers to replacement text."""
+    kind = node[0]
+    if kind == "num":
+        return _format_number(node[1])
+    if kind == "str":
+        return f'"{node[1]}"'
+    if kind == "name":
+        return subs.get(node[1], node[1]) if subs else node[1]
+    if kind == "call":
+        _, name, args, kwargs = node
+        if subs:
+            name = subs.get(name, name)
+        printed = [to_canonical(arg, subs) for arg in args]
+        if name in _COMMUTATIVE_FUNCTIONS:
+            printed.sort()
+        printed += [f"{key}={to_canonical(value, subs)}" for key, value in sorted(kwargs)]
+        return f"{name}({', '.join(printed)})"
+    if kind == "unary":
+        return f"{node[1]}{_wrap(node[2], _UNARY_PRECEDENCE, subs)}"
+    if kind == "binop":
+        op = node[1]
+        precedence = _BINARY_PRECEDENCE[op]
+        if op in _ASSOCIATIVE_OPERATORS:
+            operands = sorted(_wrap(child, precedence + 1, subs) for child in _flatten(node, op))
+            return f" {op} ".join(operands)
+        if op in _COMMUTATIVE_OPERATORS:
+            # nested comparisons keep their parentheses on either side
+            operands = sorted(_wrap(child, precedence + 1, subs) for child in node[2:])
+            return f" {op} ".join(operands)
+        if op == "^":
+            # right-associative
+            return f"{_wrap(node[2], precedence + 1, subs)} ^ {_wrap(node[3], precedence, subs)}"
+        return f"{_wrap(node[2], precedence, subs)} {op} {_wrap(node[3], precedence + 1, subs)}"
+    if kind == "ternary":
+        _, cond, if_true, if_false = node
+        return (
+            f"{_wrap(cond, _TERNARY_PRECEDENCE + 1, subs)} ? "
+            f"{_wrap(if_true, _TERNARY_PRECEDENCE, subs)} : {_wrap(if_false, _TERNARY_PRECEDENCE, subs)}"
+        )
+    if kind == "assign":
+        return f"{node[1]} = {to_canonical(node[2], subs)}"
+    if kind == "program":
+        return "; ".join(to_canonical(statement, subs) for statement in node[1])
+    raise ValueError(f"Unknown AST node: {node!r}")
+
+
+class CanonicalTemplate:
+    """
+    Canonical printer for many fillings of one expression template.
+
+    The template marks its variable parts with placeholder identifiers
+    (`slot_options` maps each placeholder to the values it can take). It is
+    parsed once; `render(values)` then returns the canonical form of the
+    filled-in expression without re-parsing. When no placeholder sits under a
+    commutative operator, the canonical layout cannot change and rendering is
+    a plain string join. Use `CanonicalTemplate.build`, which returns None if
+    the template does not parse or a placeholder is glued into a larger token;
+    callers then fall back to `canonical_expression` per filling.
+    """
+
+    def __init__(self, tree, slot_options, stable):
+        self.tree = tree
+        self.slots = list(slot_options)
+        self._parts = None
+        if stable:
+            pattern = re.compile("(" + "|".join(re.escape(slot) for slot in self.slots) + ")")
+            self._parts = pattern.split(to_canonical(tree))
+
+    @classmethod
+    def build(cls, code, slot_options):
+        try:
+            tree = parse(code)
+        except FastExprSyntaxError:
+            return None
+        check = _SlotCheck(slot_options)
+        if not check.visit(tree, False):
+            return None
+        return cls(tree, slot_options, check.stable)
+
+    def render(self, values):
+        """Canonical text with `values[i]` filled into the i-th placeholder."""
+        subs = {slot: (_format_number(float(value)) if _NUMBER_RE.fullmatch(value) else value)
+                for slot, value in zip(self.slots, values)}
+        if self._parts is None:
+            return to_canonical(self.tree, subs)
+        parts = self._parts[:]
+        for i in range(1, len(parts), 2):
+            parts[i] = subs[parts[i]]
+        return "".join(parts)
+
+
+class _SlotCheck:
+    """Walks a template AST: are placeholders whole leaves, and is their layout stable?"""
+
+    def __init__(self, slot_options):
+        self.slot_options = slot_options
+        self.stable = True
+
+    def _leaf(self, text, under_commutative, is_call=False):
+        if text in self.slot_options:
+            if under_commutative:
+                self.stable = False
+            if is_call and any(option in _COMMUTATIVE_FUNCTIONS for option in self.slot_options[text]):
+                self.stable = False
+            return True
+        return not any(slot in text for slot in self.slot_options)
+
+    def visit(self, node, under_commutative):
+        kind = node[0]
+        if kind == "num":
+            return True
+        if kind == "str":
+            return not any(slot in node[1] for slot in self.slot_options)
+        if kind == "name":
+            return self._leaf(node[1], under_commutative)
+        if kind == "call":
+            _, name, args, kwargs = node
+            if not self._leaf(name, under_commutative, is_call=True):
+                return False
+            inner = under_commutative or name in _COMMUTATIVE_FUNCTIONS
+            return all(self.visit(arg, inner) for arg in args) and all(
+                self.visit(value, under_commutative) for _, value in kwargs
+            )
+        if kind == "unary":
+            return self.visit(node[2], under_commutative)
+        if kind == "binop":
+            inner = under_commutative or node[1] in _COMMUTATIVE_OPERATORS
+            return self.visit(node[2], inner) and self.visit(node[3], inner)
+        if kind == "ternary":
+            return all(self.visit(child, under_commutative) for child in node[1:])
+        if kind == "assign":
+            return self._leaf(node[1], under_commutative) and self.visit(node[2], under_commutative)
+        if kind == "program":
+            return all(self.visit(statement, under_commutative) for statement in node[1])
+        return False
+
+
+def canonical_expression(code: str) -> str:
+    """
+    Canonical form of an expression, used as its identity key.
+
+    Expressions that do not parse fall back to a whitespace-insensitive form,
+    so the key is always defined.
+    """
+    try:
+        return to_canonical(parse(code or ""))
+    except (FastExprSyntaxError, ValueError, OverflowError):
+        return re.sub(r"\s+", "", code or "")
@@ -1,105 +1,84 @@
 # import numpy as np
 # import pandas as pd
 # from pyworldquant.spot import Spot as Client
-import requests
 import json
+import time
 from time import sleep
 from os.path import expanduser
-from requests.auth import HTTPBasicAuth
 import logging
 
-def sign_in(username='', password=''):
-    try:
-        sess = requests.Session()
-        sess.auth = HTTPBasicAuth(username, password)
-        response = sess.post("https://api.worldquantbrain.com/authentication")
-        print(response.status_code)
-        print(response.json())
-        if response.status_code == 201:
-            print("Login successful!")
-            return sess
-        else:
-            print("Login failed.")
-            return None
-    except Exception as e:
-        print(f"Error during sign-in: {e}")
-        return None
+from alpha_templates import AlphaTemplate, FieldSlot, simulation_settings
+from brain_api import SIMULATIONS_URL
+from datafield_catalog import DatafieldCatalog
+from pipeline_metrics import metrics
+from result_cache import ResultCache
+from result_store import ResultHarvester
+from simulation_journal import SimulationJournal
+from session_manager import sign_in
+from simulation_scheduler import run_in_flight
 
-sess=requests.Session()
-sess.auth=HTTPBasicAuth(username,password)
-response= sess.post("https://api.worldquantbrain.com/authentication")
-print(response. status_code)
-print(response.json())
-logging.basicConfig(filename="simulation.log",level=logging.INFO,format="%(asctime)s-%(levelname)s-%(message)s")
 
 
 def get_datafields(
         s,
         searchScope,
         dataset_id: str = '',
-        search: str = ''
+        search: str = '',
+        refresh: bool = False
 ):
+    # pages are fetched concurrently with the real count and cached on disk for a day (see datafield_catalog)
     import pandas as pd
-    instrument_type = searchScope['instrumentType']
-    region = searchScope['region']
-    delay = searchScope['delay']
-    universe = searchScope['universe']
-    if len(search) == 0:
-        url_template = "https://api.worldquantbrain.com/data-fields?" + \
-                       f"&instrumentType={instrument_type}" + \
-                       f"&region={region}&delay={str(delay)}&universe={universe}&dataset.id={dataset_id}&limit=50" + \
-                       "&offset={x}"
-        count = s.get(url_template.format(x=0)).json()['count']
-    else:
-        url_template = "https://api.worldquantbrain.com/data-fields?" + \
-                       f"&instrumentType={instrument_type}" + \
-                       f"&region={region}&delay={str(delay)}&universe={universe}&limit=50" + \
-                       f"&search={search}" + \
-                       "&offset={x}"
-        count = 100
-    datafields_list = []
-    for x in range(0, count, 50):
-        datafields = s.get(url_template.format(x=x))
-        datafields_list.append(datafields.json()['results'])
-    datafields_list_flat = [item for sublist in datafields_list for item in sublist]
+    catalog = DatafieldCatalog(s)
+    with metrics.timer("stage_seconds", stage="get_datafields"):
+        if len(search) == 0:
+            datafields_list_flat = catalog.load(searchScope, dataset_id=dataset_id, refresh=refresh)
+        else:
+            datafields_list_flat = catalog.load(searchScope, search=search, refresh=refresh)
 
     datafields_df = pd.DataFrame(datafields_list_flat)
     return datafields_df
 
 
 # 两个datafield alpha list generation
-def alpha_list_generation2(datafield_list, datafield_list2, type, region, delay, decay, universe, truncation):
-    alpha_list = []
-    for datafield in datafield_list:
-        for datafield2 in datafield_list2:
-            print("正在将如下Alpha表达式与setting封装")
-            alpha_expression = f'{datafield}/{datafield2}'
-            print(alpha_expression)
-            simulation_data = {
-                'type': 'REGULAR',
-                'settings': {
-                    'instrumentType': type,
-                    'region': region,
-                    'universe': universe,
-                    'delay': delay,
-                    'decay': decay,
-                    'neutralization': 'SUBINDUSTRY',
-                    'truncation': truncation,
-                    'pasteurization': 'ON',
-                    'unitHandling': 'VERIFY',
-                    'nanHandling': 'ON',
-                    'language': 'FASTEXPR',
-                    'visualization': False,
-                },
-                'regular': alpha_expression
-            }
-            alpha_list.append(simulation_data)
-    print(f'there are {len(alpha_list)} Alphas to simulate')
-    return alpha_list
+def alpha_list_generation2(datafield_list, datafield_list2, type, region, delay, decay, universe, truncation, datafields=None):
+    # returns a list as before, each payload with its own settings dict; prefer iter_alpha_list_generation2 for large runs
+    return [{**payload, "settings": dict(payload["settings"])}
+            for payload in iter_alpha_list_generation2(datafield_list, datafield_list2, type, region, delay, decay,
+                                                       universe, truncation, datafields=datafields)]
+
+def iter_alpha_list_generation2(datafield_list, datafield_list2, type, region, delay, decay, universe, truncation, datafields=None):
+    # lazy: payloads are built as testing_alphas consumes them and share one frozen settings dict.
+    # datafields: metadata records / DataFrame from get_datafields; with it only MATRIX fields are paired
+    # and x/x is skipped. Any other template: alpha_templates.AlphaTemplate
+    settings = simulation_settings(type, region, universe, delay, decay, truncation)
+    if datafields is None:
+        template = AlphaTemplate("{x}/{y}", x=datafield_list, y=datafield_list2)
+        return template.expand(settings=settings)
+    template = AlphaTemplate("{x}/{y}", x=FieldSlot(ids=datafield_list), y=FieldSlot(ids=datafield_list2))
+    return template.expand(datafields, settings=settings)
+
+def testing_alphas(alpha_list, sess=None, max_in_flight=1, batch_size=1, journal=None, cache=None, harvester=None,
+                   on_result=None):
+    # max_in_flight > 1 keeps several simulations running at once, batch_size > 1 packs
+    # compatible alphas into multi-simulation requests, journal skips finished work and
+    # re-attaches to running simulations after a crash, cache answers alphas simulated
+    # by earlier runs (see simulation_scheduler). harvester (result_store.ResultHarvester)
+    # fetches the full result of every finished alpha in the background. alpha_list may
+    # be a priority_scheduler.PriorityScheduler; pass its on_result so results feed back
+    sess = sess or sign_in()
+    if max_in_flight > 1 or batch_size > 1 or journal is not None or cache is not None or on_result is not None:
+        callbacks = [callback for callback in (harvester.on_result if harvester is not None else None, on_result)
+                     if callback is not None]
+
+        def notify(idx, alpha, alpha_id):
+            for callback in callbacks:
+                callback(idx, alpha, alpha_id)
 
-logging.basicConfig(filename='simulation.log',level=logging.INFO,format='%(asctime)s - %(levelname)s - %(message)s')
-def testing_alphas(alpha_list):
-    sess=sign_in()
+        return run_in_flight(
+            alpha_list, sess, sign_in,
+            max_in_flight=max_in_flight, batch_size=batch_size, journal=journal, cache=cache,
+            on_result=notify if callbacks else None,
+        )
     alpha_fail_attempt_tolerance = 3
     for idx, alpha in enumerate(alpha_list):
         failure_count = 0
@@ -107,7 +86,7 @@ def testing_alphas(alpha_list):
         while True:
             try:
                 sim_resp = sess.post(
-                    'https://api.worldquantbrain.com/simulations',
+                    SIMULATIONS_URL,
                     json=alpha
                 )
                 if 'Location' not in sim_resp.headers:
@@ -116,6 +95,7 @@ def testing_alphas(alpha_list):
                         f"response={sim_resp.text[:200]}"
                     )
                 sim_progress_url = sim_resp.headers['Location']
+                submitted_at = time.time()
                 logging.info(f"[{idx}] Alpha submitted: {sim_progress_url}")
                 print(f"[{idx}] Alpha submitted: {sim_progress_url}")
 
@@ -129,11 +109,16 @@ def testing_alphas(alpha_list):
                         break
                     sleep(retry_after)
                 alpha_id = sim_progress_resp.json().get("alpha")
+                metrics.observe("simulation_seconds", time.time() - submitted_at, kind="single")
+                metrics.inc("simulations_completed_total", 1 if alpha_id else 0)
                 print(f"Simulation complete. Alpha ID: {alpha_id}")
                 logging.info(f"Simulation complete. Alpha ID: {alpha_id}")
+                if harvester is not None:
+                    harvester.submit(alpha_id, alpha)
                 break  # ✅ success → next alpha
             except Exception as e:
                 failure_count += 1
+                metrics.inc("simulation_failures_total", kind="single")
                 logging.error(
                     f"Alpha error (attempt {failure_count}): {e}"
                 )
@@ -148,6 +133,7 @@ def testing_alphas(alpha_list):
                 if not has_relogged:
                     logging.warning("Retry limit reached. Re-authenticating...")
                     print("Retry limit reached. Re-authenticating...")
+                    metrics.inc("relogins_total", stage="testing_alphas")
                     try:
                         sess = sign_in()
                         has_relogged = True
@@ -166,16 +152,27 @@ def testing_alphas(alpha_list):
                     print(msg)
                     break
 
-searchScope = {'region': 'USA', 'delay': '1', 'universe': 'TOP3000', 'instrumentType': 'EQUITY'}
-#Set 1
-sentimentvolume_data= get_datafields(s=sess, searchScope=searchScope, dataset_id='pv1',search="income")
-sentimentvolume_data = sentimentvolume_data[sentimentvolume_data["type"] == "MATRIX"]
-datafield1=sentimentvolume_data["id"].values
-#+
-sentimentvolume2_data= get_datafields(s=sess, searchScope=searchScope, dataset_id='',search="equity")
-sentimentvolume2_data = sentimentvolume2_data[sentimentvolume2_data["type"] == "MATRIX"]
-datafield2=sentimentvolume2_data["id"].values
-#testing_alphas(alpha_list1[2392:])
-alpha_list2=alpha_list_generation2(datafield1,datafield2,"EQUITY","USA",1,1,"TOP3000",0.08)
-testing_alphas(alpha_list2[107:])
-# testing_alphas(alpha_list3)
\ No newline at end of file
+# 脚本部分只在直接运行时执行，import testing_alphas 等函数不会登录或发请求
+if __name__ == "__main__":
+    logging.basicConfig(filename='simulation.log',level=logging.INFO,format='%(asctime)s - %(levelname)s - %(message)s')
+    # pipeline_metrics.prom + summary in simulation.log when the run ends
+    metrics.export_at_exit()
+    # credential.txt / WQB_USERNAME+WQB_PASSWORD; the session re-logs in by itself before the token expires
+    sess = sign_in()
+    searchScope = {'region': 'USA', 'delay': '1', 'universe': 'TOP3000', 'instrumentType': 'EQUITY'}
+    #Set 1
+    sentimentvolume_data= get_datafields(s=sess, searchScope=searchScope, dataset_id='pv1',search="income")
+    datafield1=sentimentvolume_data["id"].values
+    #+
+    sentimentvolume2_data= get_datafields(s=sess, searchScope=searchScope, dataset_id='',search="equity")
+    datafield2=sentimentvolume2_data["id"].values
+    #testing_alphas(alpha_list1[2392:])
+    # 字段元数据一起传进去：只配 MATRIX 字段、跳过 x/x；换模板/多字段见 alpha_templates.AlphaTemplate
+    datafields = sentimentvolume_data.to_dict("records") + sentimentvolume2_data.to_dict("records")
+    alpha_list2=iter_alpha_list_generation2(datafield1,datafield2,"EQUITY","USA",1,1,"TOP3000",0.08,datafields=datafields)
+    # 不用再手动切片 alpha_list2[107:]，journal 会跳过已经跑完的 alpha
+    # 每个跑完的alpha的完整结果（IS指标+checks）后台并发取回，存进 alpha_results.db
+    with ResultHarvester(sess) as harvester:
+        testing_alphas(alpha_list2, max_in_flight=3, batch_size=10, journal=SimulationJournal(), cache=ResultCache(),
+                       harvester=harvester)
+    # testing_alphas(alpha_list3)
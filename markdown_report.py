@@ -0,0 +1,311 @@
+"""Incremental Markdown report of submitted and submission-ready alphas.
+
+Documenting alphas used to mean reprocessing `submission_results.json` and
+the logs by hand, and a rebuild redid everything. `MarkdownReport` reads the
+stores instead, in one query each:
+
+    ResultStore     metrics, settings and check outcomes of simulated alphas
+    SubmissionLog   the latest submission status of every alpha
+    AlphaMirror     (optional) submitted alphas that were never harvested
+
+and writes one Markdown file per section:
+
+    reports/README.md                                  totals per region/universe
+    reports/<region>/<universe>/README.md              sections with counts and best sharpe
+    reports/<region>/<universe>/<dataset>__<family>.md the alphas, best sharpe first
+
+An alpha is `submitted` once its latest log entry passed, `rejected` if it
+was refused or failed its checks, `pending` if the submitter stopped
+waiting for the outcome (see submission_log.submission_outcome), and
+`ready` when it has not been submitted and every check passed. Its dataset comes from the datafields it uses (looked
+up in the local datafield catalog cache), its operator family from the
+operators it calls. Every section has a fingerprint of its rows, kept in
+`.report_state.json` next to the files; a rebuild rewrites only the sections
+whose fingerprint changed (and the index pages above them) and deletes the
+ones that emptied, so regenerating after a few new results costs one pass
+over the stores, not a rewrite of the whole history.
+"""
+import hashlib
+import json
+import logging
+import os
+import re
+import time
+
+from fastexpr import FastExprSyntaxError, tokenize
+from pipeline_metrics import metrics
+import submission_log
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_REPORT_DIR = "reports"
+STATE_FILE = ".report_state.json"
+SUBMITTED = "submitted"
+READY = "ready"
+REJECTED = "rejected"
+PENDING = "pending"
+STATUSES = (SUBMITTED, PENDING, READY, REJECTED)
+# SubmissionLog outcome -> report status
+_LOGGED = {submission_log.PASSED: SUBMITTED, submission_log.PENDING: PENDING, submission_log.REJECTED: REJECTED}
+# Brain's operator categories, in the order they are listed in a family name
+OPERATOR_FAMILIES = ("Group", "Time Series", "Cross Sectional", "Vector", "Logical", "Transformational", "Arithmetic")
+_CROSS_SECTIONAL = {"rank", "zscore", "scale", "normalize", "quantile", "winsorize", "truncate", "regression_neut",
+                    "vector_neut", "bucket", "densify"}
+_LOGICAL = {"if_else", "and", "or", "not", "is_nan", "equal", "not_equal", "less", "greater", "trade_when"}
+_TRANSFORMATIONAL = {"hump", "tail", "left_tail", "right_tail", "pasteurize", "keep", "clamp", "filter"}
+_UNSAFE_PATH = re.compile(r"[^\w.+-]+")
+
+
+def operator_family(name):
+    if name.startswith("group_"):
+        return "Group"
+    if name.startswith("ts_") or name in ("last_diff_value", "days_from_last_change", "hump_decay", "jump_decay"):
+        return "Time Series"
+    if name.startswith("vec_"):
+        return "Vector"
+    if name in _CROSS_SECTIONAL:
+        return "Cross Sectional"
+    if name in _LOGICAL:
+        return "Logical"
+    if name in _TRANSFORMATIONAL:
+        return "Transformational"
+    return "Arithmetic"
+
+
+def classify_expression(code, field_datasets):
+    """(dataset, family) of an expression; either is "unknown"/"Arithmetic" when nothing matches."""
+    try:
+        tokens = tokenize(code or "")
+    except FastExprSyntaxError:
+        return "unknown", "Arithmetic"
+    families, datasets = set(), set()
+    for i, token in enumerate(tokens):
+        if not (token[0].isalpha() or token[0] == "_"):
+            continue
+        following = tokens[i + 1] if i + 1 < len(tokens) else None
+        if following == "(":
+            families.add(operator_family(token))
+        elif following != "=" and token in field_datasets:
+            datasets.add(field_datasets[token])
+    family = " + ".join(name for name in OPERATOR_FAMILIES if name in families) or "Arithmetic"
+    return "+".join(sorted(datasets)) or "unknown", family
+
+
+def load_field_datasets(catalog_dir=None):
+    """{datafield id: dataset id} from every cached catalog file (see datafield_catalog)."""
+    from datafield_catalog import DEFAULT_CATALOG_DIR
+    catalog_dir = catalog_dir or DEFAULT_CATALOG_DIR
+    mapping = {}
+    if not os.path.isdir(catalog_dir):
+        return mapping
+    for name in sorted(os.listdir(catalog_dir)):
+        if not name.endswith(".json"):
+            continue
+        try:
+            with open(os.path.join(catalog_dir, name), "r", encoding="utf-8") as f:
+                records = json.load(f).get("results", [])
+        except (OSError, ValueError) as e:
+            logger.warning(f"Skipping datafield cache {name}: {e}")
+            continue
+        for field in records:
+            dataset = (field.get("dataset") or {}).get("id")
+            if field.get("id") and dataset:
+                mapping[field["id"]] = dataset
+    return mapping
+
+
+def _slug(text):
+    return _UNSAFE_PATH.sub("_", str(text)).strip("_") or "unknown"
+
+
+def _cell(value):
+    return "-" if value is None else f"{value:.2f}"
+
+
+class MarkdownReport:
+    """
+    results: ResultStore; log: SubmissionLog (optional); mirror: AlphaMirror
+    (optional, for submitted alphas missing from the results); field_datasets:
+    {datafield: dataset}, read from the datafield catalog cache by default.
+    """
+
+    ROW_COLUMNS = ("alpha_id", "code", "region", "universe", "sharpe", "fitness", "turnover", "returns",
+                   "failed_checks", "pending_checks")
+
+    def __init__(self, results, log=None, mirror=None, out_dir=DEFAULT_REPORT_DIR, field_datasets=None):
+        self.results = results
+        self.log = log
+        self.mirror = mirror
+        self.out_dir = out_dir
+        self.field_datasets = field_datasets if field_datasets is not None else load_field_datasets()
+        self._classified = {}  # code -> (dataset, family); codes repeat across settings
+
+    # ---- DATA ----
+
+    def _classify(self, code):
+        found = self._classified.get(code)
+        if found is None:
+            found = self._classified[code] = classify_expression(code, self.field_datasets)
+        return found
+
+    def sections(self):
+        """{(region, universe, dataset, family): [row, ...]} of the alphas worth reporting."""
+        statuses = self.log.latest_statuses() if self.log is not None else {}
+        sections = {}
+        seen = set()
+
+        def add(alpha_id, code, region, universe, sharpe, fitness, turnover, returns, status):
+            dataset, family = self._classify(code)
+            key = (region or "unknown", universe or "unknown", dataset, family)
+            sections.setdefault(key, []).append((alpha_id, status, sharpe, fitness, turnover, returns, code or ""))
+
+        for (alpha_id, code, region, universe, sharpe, fitness, turnover, returns,
+             failed_checks, pending_checks) in self.results.rows(*self.ROW_COLUMNS):
+            seen.add(alpha_id)
+            logged = statuses.get(alpha_id)
+            if logged is not None:
+                status = _LOGGED[submission_log.submission_outcome(logged[0])]
+            elif not failed_checks and not pending_checks and sharpe is not None:
+                status = READY
+            else:
+                continue
+            add(alpha_id, code, region, universe, sharpe, fitness, turnover, returns, status)
+        if self.mirror is not None:
+            missing = {}
+            for alpha_id, (status, _) in statuses.items():
+                outcome = submission_log.submission_outcome(status)
+                if alpha_id not in seen and outcome != submission_log.REJECTED:
+                    missing[alpha_id] = _LOGGED[outcome]
+            if missing:
+                for row in self.mirror.rows("id", "code", "region", "universe", "sharpe", "fitness", "turnover",
+                                            "returns", ids=set(missing)):
+                    add(*row, missing[row[0]])
+        for rows in sections.values():
+            rows.sort(key=lambda row: (-(row[2] if row[2] is not None else float("-inf")), row[0]))
+        return sections
+
+    # ---- RENDERING ----
+
+    @staticmethod
+    def fingerprint(rows):
+        digest = hashlib.blake2b(digest_size=16)
+        for row in rows:
+            digest.update(repr(row).encode("utf-8"))
+        return digest.hexdigest()
+
+    @staticmethod
+    def _section_path(key):
+        region, universe, dataset, family = key
+        return os.path.join(_slug(region), _slug(universe), f"{_slug(dataset)}__{_slug(family)}.md")
+
+    def render_section(self, key, rows):
+        region, universe, dataset, family = key
+        counts = {status: sum(1 for row in rows if row[1] == status) for status in STATUSES}
+        lines = [
+            f"# {dataset} · {family}",
+            "",
+            f"{region} / {universe}: {counts[SUBMITTED]} submitted, {counts[PENDING]} pending, "
+            f"{counts[READY]} ready, {counts[REJECTED]} rejected",
+            "",
+            "| id | status | sharpe | fitness | turnover | returns | expression |",
+            "|---|---|---:|---:|---:|---:|---|",
+        ]
+        for alpha_id, status, sharpe, fitness, turnover, returns, code in rows:
+            expression = code.replace("|", "\\|").replace("\n", " ")
+            lines.append(f"| {alpha_id} | {status} | {_cell(sharpe)} | {_cell(fitness)} | {_cell(turnover)} "
+                         f"| {_cell(returns)} | `{expression}` |")
+        return "\n".join(lines) + "\n"
+
+    def render_universe_index(self, region, universe, summaries):
+        lines = [f"# {region} / {universe}", "",
+                 "| dataset | family | submitted | pending | ready | rejected | best sharpe |",
+                 "|---|---|---:|---:|---:|---:|---:|"]
+        for key, summary in sorted(summaries.items(), key=lambda item: item[0][2:]):
+            link = os.path.basename(self._section_path(key))
+            lines.append(f"| [{key[2]}]({link}) | {key[3]} | {summary['submitted']} | {summary['pending']} "
+                         f"| {summary['ready']} | {summary['rejected']} | {_cell(summary['best_sharpe'])} |")
+        return "\n".join(lines) + "\n"
+
+    def render_index(self, totals):
+        lines = ["# Alpha report", "",
+                 "| region | universe | submitted | pending | ready | rejected | sections |",
+                 "|---|---|---:|---:|---:|---:|---:|"]
+        for (region, universe), total in sorted(totals.items()):
+            link = f"{_slug(region)}/{_slug(universe)}/README.md"
+            lines.append(f"| {region} | [{universe}]({link}) | {total['submitted']} | {total['pending']} "
+                         f"| {total['ready']} | {total['rejected']} | {total['sections']} |")
+        return "\n".join(lines) + "\n"
+
+    # ---- BUILD ----
+
+    def _load_state(self):
+        try:
+            with open(os.path.join(self.out_dir, STATE_FILE), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _write(self, relative_path, text):
+        path = os.path.join(self.out_dir, relative_path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(text)
+        os.replace(tmp_path, path)
+
+    def build(self, full=False):
+        """Bring the report up to date; returns {"written": n, "removed": n, "unchanged": n, "seconds": s}."""
+        started = time.time()
+        with metrics.timer("stage_seconds", stage="markdown_report"):
+            state = {} if full else self._load_state()
+            old_sections = state.get("sections", {})
+            old_indexes = state.get("indexes", {})
+            new_sections, new_indexes = {}, {}
+            summaries = {}
+            written = unchanged = 0
+            for key, rows in self.sections().items():
+                path = self._section_path(key)
+                fingerprint = self.fingerprint(rows)
+                new_sections[path] = fingerprint
+                summaries.setdefault(key[:2], {})[key] = {
+                    status: sum(1 for row in rows if row[1] == status) for status in STATUSES
+                }
+                summaries[key[:2]][key]["best_sharpe"] = rows[0][2]
+                if old_sections.get(path) == fingerprint and os.path.exists(os.path.join(self.out_dir, path)):
+                    unchanged += 1
+                    continue
+                self._write(path, self.render_section(key, rows))
+                written += 1
+            totals = {}
+            for (region, universe), universe_summaries in summaries.items():
+                path = os.path.join(_slug(region), _slug(universe), "README.md")
+                text = self.render_universe_index(region, universe, universe_summaries)
+                fingerprint = self.fingerprint([text])
+                new_indexes[path] = fingerprint
+                if old_indexes.get(path) != fingerprint or not os.path.exists(os.path.join(self.out_dir, path)):
+                    self._write(path, text)
+                    written += 1
+                totals[(region, universe)] = {
+                    status: sum(summary[status] for summary in universe_summaries.values())
+                    for status in STATUSES
+                }
+                totals[(region, universe)]["sections"] = len(universe_summaries)
+            index = self.render_index(totals)
+            new_indexes["README.md"] = self.fingerprint([index])
+            if old_indexes.get("README.md") != new_indexes["README.md"] or \
+                    not os.path.exists(os.path.join(self.out_dir, "README.md")):
+                self._write("README.md", index)
+                written += 1
+            removed = 0
+            for path in set(old_sections) - set(new_sections) | set(old_indexes) - set(new_indexes):
+                try:
+                    os.remove(os.path.join(self.out_dir, path))
+                    removed += 1
+                except FileNotFoundError:
+                    pass
+            self._write(STATE_FILE, json.dumps({"sections": new_sections, "indexes": new_indexes,
+                                                "built_at": time.time()}, sort_keys=True))
+        stats = {"written": written, "removed": removed, "unchanged": unchanged,
+                 "seconds": round(time.time() - started, 2)}
+        logger.info(f"Markdown report in {self.out_dir}: {stats}")
+        return stats
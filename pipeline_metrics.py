@@ -0,0 +1,235 @@
+"""Counters and latency histograms for the whole pipeline.
+
+One process-wide `metrics` registry collects:
+
+* per endpoint (via a `requests` response hook that every BrainSession
+  installs): request count by status, latency histogram, and the total of
+  `Retry-After` seconds the server asked for;
+* per stage: how long `testing_alphas` jobs queue, how long simulations run,
+  `fetch_successful_alphas`, `get_datafields`, `submit_alpha` and the sleeps
+  of `monitor_submission`, plus re-logins and failures.
+
+`export(path)` writes Prometheus text (or JSON for a `.json` path),
+`serve(port)` exposes the same text over HTTP, and `summary()` renders the
+end-of-run table that `export_at_exit` logs.
+"""
+import atexit
+import bisect
+import contextlib
+import functools
+import json
+import logging
+import math
+import re
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# upper bounds in seconds; the last bucket is +Inf
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+
+_ID_SEGMENT_RE = re.compile(r"/(simulations|alphas)/[^/?#]+")
+
+
+def endpoint_of(url):
+    """`/alphas/{id}/submit`-style template of a request URL, without host and query."""
+    path = re.sub(r"^[a-z]+://[^/]+", "", url).split("?", 1)[0]
+    return _ID_SEGMENT_RE.sub(lambda m: f"/{m.group(1)}/{{id}}", path) or "/"
+
+
+class Histogram:
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(BUCKETS, value)] += 1
+        self.count += 1
+        self.total += value
+        self.max = max(self.max, value)
+
+    def quantile(self, q):
+        """Upper bound of the bucket holding the q-quantile (max for the +Inf bucket)."""
+        if not self.count:
+            return 0.0
+        rank = math.ceil(q * self.count)
+        seen = 0
+        for i, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank:
+                return min(BUCKETS[i], self.max) if i < len(BUCKETS) else self.max
+        return self.max
+
+
+class MetricsRegistry:
+    """Thread-safe counters and histograms keyed by name and labels."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._histograms = {}
+        self.started_at = time.time()
+
+    @staticmethod
+    def _key(name, labels):
+        return name, tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+    def inc(self, name, value=1, **labels):
+        key = self._key(name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name, seconds, **labels):
+        key = self._key(name, labels)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram()
+            histogram.observe(seconds)
+
+    @contextlib.contextmanager
+    def timer(self, name, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def timed(self, name, **labels):
+        """Decorator form of `timer`."""
+        def decorate(fn):
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                with self.timer(name, **labels):
+                    return fn(*args, **kwargs)
+            return wrapper
+        return decorate
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+            self.started_at = time.time()
+
+    # ---- REQUESTS HOOK ----
+
+    def instrument_session(self, sess):
+        """Record every response of `sess` (a requests.Session) per endpoint."""
+        def record(response, *args, **kwargs):
+            endpoint = endpoint_of(response.request.url)
+            method = response.request.method
+            self.inc("http_requests_total", method=method, endpoint=endpoint, status=response.status_code)
+            self.observe("http_request_seconds", response.elapsed.total_seconds(), method=method, endpoint=endpoint)
+            retry_after = response.headers.get("Retry-After")
+            if retry_after:
+                try:
+                    self.inc("http_retry_after_seconds_total", float(retry_after), method=method, endpoint=endpoint)
+                except ValueError:
+                    pass
+            return response
+        sess.hooks["response"].append(record)
+        return sess
+
+    # ---- EXPORT ----
+
+    def snapshot(self):
+        with self._lock:
+            counters = [
+                {"name": name, "labels": dict(labels), "value": value}
+                for (name, labels), value in sorted(self._counters.items())
+            ]
+            histograms = [
+                {
+                    "name": name, "labels": dict(labels), "count": h.count, "sum": h.total, "max": h.max,
+                    "p50": h.quantile(0.5), "p95": h.quantile(0.95), "buckets": list(h.counts),
+                }
+                for (name, labels), h in sorted(self._histograms.items())
+            ]
+        return {"started_at": self.started_at, "uptime": time.time() - self.started_at,
+                "counters": counters, "histograms": histograms}
+
+    def to_prometheus(self):
+        def labels_text(labels, extra=None):
+            items = list(labels.items()) + list((extra or {}).items())
+            if not items:
+                return ""
+            return "{" + ",".join(f'{k}="{v}"' for k, v in items) + "}"
+
+        lines = []
+        snap = self.snapshot()
+        for counter in snap["counters"]:
+            lines.append(f"wqb_{counter['name']}{labels_text(counter['labels'])} {counter['value']}")
+        for h in snap["histograms"]:
+            cumulative = 0
+            for bound, count in zip(list(BUCKETS) + ["+Inf"], h["buckets"]):
+                cumulative += count
+                lines.append(f"wqb_{h['name']}_bucket{labels_text(h['labels'], {'le': bound})} {cumulative}")
+            lines.append(f"wqb_{h['name']}_sum{labels_text(h['labels'])} {h['sum']:.6f}")
+            lines.append(f"wqb_{h['name']}_count{labels_text(h['labels'])} {h['count']}")
+        return "\n".join(lines) + "\n"
+
+    def export(self, path):
+        """Write the current metrics: JSON for `*.json`, Prometheus text otherwise."""
+        with open(path, "w", encoding="utf-8") as f:
+            if path.endswith(".json"):
+                json.dump(self.snapshot(), f, indent=2)
+            else:
+                f.write(self.to_prometheus())
+
+    def summary(self):
+        """Human-readable table: histograms by total time, then counters."""
+        snap = self.snapshot()
+        lines = [f"Pipeline metrics after {snap['uptime']:.1f}s"]
+        histograms = sorted(snap["histograms"], key=lambda h: h["sum"], reverse=True)
+        if histograms:
+            lines.append(f"{'timer':<58} {'count':>7} {'total s':>9} {'p50 s':>8} {'p95 s':>8} {'max s':>8}")
+            for h in histograms:
+                label = h["name"] + "".join(f" {k}={v}" for k, v in h["labels"].items())
+                lines.append(f"{label[:58]:<58} {h['count']:>7} {h['sum']:>9.2f} {h['p50']:>8.3f} "
+                             f"{h['p95']:>8.3f} {h['max']:>8.3f}")
+        if snap["counters"]:
+            lines.append(f"{'counter':<58} {'value':>9}")
+            for counter in snap["counters"]:
+                label = counter["name"] + "".join(f" {k}={v}" for k, v in counter["labels"].items())
+                value = counter["value"]
+                lines.append(f"{label[:58]:<58} {value:>9.6g}")
+        return "\n".join(lines)
+
+    def serve(self, port=9108, host="127.0.0.1"):
+        """Serve the Prometheus text on http://host:port/metrics from a daemon thread."""
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+        registry = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                body = registry.to_prometheus().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        server = ThreadingHTTPServer((host, port), Handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        logger.info(f"Metrics on http://{host}:{server.server_address[1]}/metrics")
+        return server
+
+    def export_at_exit(self, path="pipeline_metrics.prom"):
+        """Write the metrics to `path` and log the summary when the process exits."""
+        def finish():
+            try:
+                self.export(path)
+                logger.info("\n" + self.summary())
+                logger.info(f"Metrics written to {path}")
+            except Exception as e:
+                logger.warning(f"Could not write metrics to {path}: {e}")
+        atexit.register(finish)
+
+
+metrics = MetricsRegistry()
@@ -0,0 +1,130 @@
+"""Local store of alpha PnL series from /alphas/{id}/recordsets/pnl.
+
+The correlation screen needs the PnL of every submitted alpha each time it
+scores candidates; downloading them per run would cost one request per
+submitted alpha. `PnlStore` keeps each series in SQLite (dates as JSON, values
+as float64 bytes) and `ensure` only fetches the IDs it does not have yet,
+concurrently.
+"""
+import json
+import logging
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from brain_api import API_BASE
+
+logger = logging.getLogger(__name__)
+
+PNL_URL = f"{API_BASE}/alphas/{{alpha_id}}/recordsets/pnl"
+DEFAULT_PNL_PATH = "pnl_store.db"
+
+
+def fetch_pnl(sess, alpha_id, max_retries=5, retry_delay=5, max_wait=120):
+    """
+    Return `(dates, cumulative_pnl)` lists for an alpha, or None.
+
+    The recordset is computed on demand: while it is not ready the server
+    answers with an empty body and a Retry-After header.
+    """
+    url = PNL_URL.format(alpha_id=alpha_id)
+    deadline = time.time() + max_wait
+    failures = 0
+    while failures < max_retries and time.time() < deadline:
+        try:
+            response = sess.get(url)
+            retry_after = response.headers.get("Retry-After")
+            if response.status_code == 429 or retry_after:
+                time.sleep(float(retry_after or retry_delay))
+                continue
+            response.raise_for_status()
+            data = response.json()
+            names = [prop.get("name") for prop in (data.get("schema") or {}).get("properties", [])]
+            date_col = names.index("date") if "date" in names else 0
+            pnl_col = names.index("pnl") if "pnl" in names else 1
+            records = data.get("records") or []
+            return [r[date_col] for r in records], [float(r[pnl_col] or 0.0) for r in records]
+        except Exception as e:
+            failures += 1
+            logger.warning(f"Fetching PnL of {alpha_id} failed (attempt {failures}): {e}")
+            time.sleep(retry_delay)
+    return None
+
+
+class PnlStore:
+    """SQLite-backed PnL store; safe to share between threads of one process."""
+
+    def __init__(self, path=DEFAULT_PNL_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS pnl (
+                alpha_id TEXT PRIMARY KEY,
+                dates TEXT NOT NULL,
+                pnl BLOB NOT NULL,
+                fetched_at REAL NOT NULL
+            )
+            """
+        )
+        self._conn.commit()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def put(self, alpha_id, dates, pnl):
+        import numpy as np
+        values = np.asarray(pnl, dtype=np.float64).tobytes()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO pnl (alpha_id, dates, pnl, fetched_at) VALUES (?, ?, ?, ?)",
+                (alpha_id, json.dumps(list(dates)), values, time.time()),
+            )
+
+    def get(self, alpha_id):
+        """`(dates, cumulative pnl array)` or None."""
+        import numpy as np
+        with self._lock:
+            row = self._conn.execute("SELECT dates, pnl FROM pnl WHERE alpha_id = ?", (alpha_id,)).fetchone()
+        if row is None:
+            return None
+        return json.loads(row[0]), np.frombuffer(row[1], dtype=np.float64)
+
+    def __contains__(self, alpha_id):
+        with self._lock:
+            return self._conn.execute("SELECT 1 FROM pnl WHERE alpha_id = ?", (alpha_id,)).fetchone() is not None
+
+    def __len__(self):
+        with self._lock:
+            (count,) = self._conn.execute("SELECT COUNT(*) FROM pnl").fetchone()
+        return count
+
+    def ensure(self, sess, alpha_ids, max_workers=8):
+        """Fetch and store the PnL of every ID not stored yet. Returns the IDs now available."""
+        alpha_ids = list(dict.fromkeys(alpha_ids))
+        missing = [alpha_id for alpha_id in alpha_ids if alpha_id not in self]
+        if missing:
+            with ThreadPoolExecutor(max_workers=max_workers) as pool:
+                for alpha_id, series in zip(missing, pool.map(lambda a: fetch_pnl(sess, a), missing)):
+                    if series is not None and series[0]:
+                        self.put(alpha_id, *series)
+            logger.info(f"PnL store: fetched {len(missing)} series, {len(self)} stored")
+        return [alpha_id for alpha_id in alpha_ids if alpha_id in self]
+
+    def daily_frame(self, alpha_ids):
+        """DataFrame of daily PnL (diff of the cumulative series), one column per alpha, indexed by date."""
+        import pandas as pd
+        columns = {}
+        for alpha_id in alpha_ids:
+            stored = self.get(alpha_id)
+            if stored is None:
+                continue
+            dates, cumulative = stored
+            columns[alpha_id] = pd.Series(cumulative, index=pd.Index(dates)).diff()
+        if not columns:
+            return pd.DataFrame()
+        return pd.DataFrame(columns).sort_index()
@@ -0,0 +1,332 @@
+"""Spend a limited daily simulation quota on the most promising payloads first.
+
+`testing_alphas` simulates its list in order, and `generate_alpha_variants`
+emits variants in itertools.product order, so the tail of a strong parent's
+variant space may never run before the day's quota is gone.
+`PriorityScheduler` holds the pending payloads in a heap and hands
+`run_in_flight` the one with the highest expected value whenever a slot
+frees up, until `DailyQuota` says the day's simulations are spent:
+
+    expected value = parent_weight  * reward of the parent (sharpe + fitness)
+                   + family_weight  * mean reward of the operators it uses
+                   + novelty_weight * distance from already-tested neighbours
+
+Operator rewards start from the results already in a `ResultStore` and are
+updated as new results come back (through a `ResultHarvester`). Neighbours
+are variants of the same expression shape (see variable_list): the distance
+is the share of operator/group/window slots in which a payload differs from
+the closest one already simulated. Scores change while the queue drains, so
+the top entry is re-scored before it is handed out and pushed back if it
+has fallen behind the next one.
+
+Payloads the cache or the journal already answer are skipped without being
+charged to the quota.
+"""
+import datetime
+import heapq
+import itertools
+import logging
+import sqlite3
+import threading
+from collections import deque
+
+from adaptive_search import default_reward
+from pipeline_metrics import metrics
+from simulation_journal import COMPLETED, payload_hash
+from variable_list import _extract_alpha_code, _variant_dimensions, group_operator_list, ts_operator_list
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_QUOTA_PATH = "simulation_quota.db"
+_OPERATORS = frozenset(ts_operator_list) | frozenset(group_operator_list)
+
+
+class DailyQuota:
+    """
+    Simulations left today, persisted so several runs on one day share it.
+
+    limit: simulations allowed per day; tz: name of the time zone whose
+    midnight starts a new day (None for UTC).
+    """
+
+    def __init__(self, limit, path=DEFAULT_QUOTA_PATH, tz=None):
+        self.limit = limit
+        self.path = path
+        self.tz = tz
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS quota (day TEXT PRIMARY KEY, used INTEGER NOT NULL)")
+        self._conn.commit()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def today(self):
+        if self.tz is None:
+            return datetime.datetime.now(datetime.timezone.utc).date().isoformat()
+        from zoneinfo import ZoneInfo
+        return datetime.datetime.now(ZoneInfo(self.tz)).date().isoformat()
+
+    def used(self):
+        with self._lock:
+            row = self._conn.execute("SELECT used FROM quota WHERE day = ?", (self.today(),)).fetchone()
+        return row[0] if row else 0
+
+    def remaining(self):
+        return max(0, self.limit - self.used())
+
+    def spend(self, count=1):
+        """Charge `count` simulations to today; False (and nothing charged) if they do not fit."""
+        day = self.today()
+        with self._lock, self._conn:
+            row = self._conn.execute("SELECT used FROM quota WHERE day = ?", (day,)).fetchone()
+            used = row[0] if row else 0
+            if used + count > self.limit:
+                return False
+            self._conn.execute(
+                "INSERT INTO quota (day, used) VALUES (?, ?) ON CONFLICT(day) DO UPDATE SET used = excluded.used",
+                (day, used + count),
+            )
+        return True
+
+
+class _Pending:
+    __slots__ = ("payload", "parent_reward", "shape", "values", "operators")
+
+    def __init__(self, payload, parent_reward, shape, values, operators):
+        self.payload = payload
+        self.parent_reward = parent_reward
+        self.shape = shape
+        self.values = values
+        self.operators = operators
+
+
+def _neighbourhood(code):
+    """(shape, slot values, operators) of an expression; variants of one parent share a shape."""
+    tokens, dimensions = _variant_dimensions(code)
+    slots = sorted(slot for slot_list, _, _ in dimensions for slot in slot_list)
+    parts = list(tokens)
+    for slot in slots:
+        parts[slot] = "\x00"
+    operators = frozenset(token for token in tokens if token in _OPERATORS)
+    return "".join(parts), tuple(tokens[slot] for slot in slots), operators
+
+
+class PriorityScheduler:
+    """
+    Iterable of payloads for `run_in_flight` / `testing_alphas`, best expected value first.
+
+    quota: DailyQuota (None for no limit). harvester: optional
+    result_store.ResultHarvester; its store seeds the operator history and
+    neighbours, and `on_result` feeds new results back through it. cache /
+    journal: payloads they already answer are skipped without spending quota.
+    neighbour_window: tested neighbours remembered per expression shape.
+    prior_weight: pseudo-observations pulling a rarely seen operator's mean
+    towards the overall mean.
+    """
+
+    def __init__(self, quota=None, harvester=None, cache=None, journal=None,
+                 parent_weight=1.0, family_weight=1.0, novelty_weight=2.0,
+                 neighbour_window=256, prior_weight=5):
+        self.quota = quota
+        self.harvester = harvester
+        self.cache = cache
+        self.journal = journal
+        self.parent_weight = parent_weight
+        self.family_weight = family_weight
+        self.novelty_weight = novelty_weight
+        self.neighbour_window = neighbour_window
+        self.prior_weight = prior_weight
+        self._lock = threading.Lock()
+        self._heap = []
+        self._order = itertools.count()
+        self._tested = {}          # shape -> deque of slot-value tuples already simulated
+        self._operator_stats = {}  # operator -> [reward sum, count]
+        self._reward_sum = 0.0
+        self._reward_count = 0
+        self._source = None
+        self.lookahead = 0
+        if harvester is not None:
+            self.seed(harvester.store.select())
+
+    def __len__(self):
+        return len(self._heap)
+
+    # ---- HISTORY ----
+
+    def _prior(self):
+        return self._reward_sum / self._reward_count if self._reward_count else 0.0
+
+    def observe(self, payload, alpha_metrics):
+        """Record the result of a simulated payload (payload dict or bare expression)."""
+        code = _extract_alpha_code(payload) if not isinstance(payload, str) else payload
+        if not code:
+            return
+        reward = default_reward(alpha_metrics)
+        shape, values, operators = _neighbourhood(code)
+        with self._lock:
+            self._reward_sum += reward
+            self._reward_count += 1
+            for operator in operators:
+                stats = self._operator_stats.setdefault(operator, [0.0, 0])
+                stats[0] += reward
+                stats[1] += 1
+            self._mark_tested(shape, values)
+
+    def seed(self, alphas):
+        """Learn from API-shaped alpha records, e.g. ResultStore.select() or AlphaMirror.select()."""
+        count = 0
+        for alpha in alphas:
+            regular = alpha.get("regular")
+            code = regular.get("code") if isinstance(regular, dict) else regular
+            if code:
+                self.observe(code, alpha.get("is"))
+                count += 1
+        if count:
+            logger.info(f"Priority scheduler seeded with {count} results (mean reward {self._prior():.2f})")
+
+    def _mark_tested(self, shape, values):
+        tested = self._tested.setdefault(shape, deque(maxlen=self.neighbour_window))
+        if values and values not in tested:
+            tested.append(values)
+
+    # ---- SCORING ----
+
+    def _family_score(self, operators):
+        prior = self._prior()
+        if not operators:
+            return prior
+        total = 0.0
+        for operator in operators:
+            reward_sum, count = self._operator_stats.get(operator, (0.0, 0))
+            total += (reward_sum + self.prior_weight * prior) / (count + self.prior_weight)
+        return total / len(operators)
+
+    def _novelty(self, shape, values):
+        """Share of slots that differ from the closest tested neighbour; 1.0 with none tested."""
+        tested = self._tested.get(shape)
+        if not values or not tested:
+            return 1.0
+        closest = min(sum(a != b for a, b in zip(values, other)) for other in tested)
+        return closest / len(values)
+
+    def _score(self, item):
+        parent_reward = item.parent_reward if item.parent_reward is not None else self._prior()
+        return (self.parent_weight * parent_reward
+                + self.family_weight * self._family_score(item.operators)
+                + self.novelty_weight * self._novelty(item.shape, item.values))
+
+    def expected_value(self, payload, parent_metrics=None):
+        """Score a payload as it would be queued now."""
+        with self._lock:
+            return self._score(self._pending(payload, parent_metrics))
+
+    # ---- QUEUE ----
+
+    def _pending(self, payload, parent_metrics):
+        shape, values, operators = _neighbourhood(_extract_alpha_code(payload))
+        parent_reward = default_reward(parent_metrics) if parent_metrics else None
+        return _Pending(payload, parent_reward, shape, values, operators)
+
+    def push(self, payload, parent_metrics=None):
+        """Queue a payload; parent_metrics are the IS metrics of the alpha it was derived from."""
+        item = self._pending(payload, parent_metrics)
+        with self._lock:
+            heapq.heappush(self._heap, (-self._score(item), next(self._order), item))
+
+    def extend(self, payloads, parent_metrics=None):
+        for payload in payloads:
+            self.push(payload, parent_metrics)
+
+    def feed(self, source, lookahead=2000):
+        """
+        Queue `(payload, parent_metrics)` pairs from `source` lazily: iteration
+        tops the queue up to `lookahead` pending payloads before each pick, so
+        a large variant stream is never held in memory at once. The best of
+        the lookahead is issued first; later payloads compete as they arrive.
+        """
+        self._source = iter(source)
+        self.lookahead = lookahead
+
+    def _refill(self):
+        while self._source is not None and len(self._heap) < self.lookahead:
+            try:
+                payload, parent_metrics = next(self._source)
+            except StopIteration:
+                self._source = None
+                return
+            self.push(payload, parent_metrics)
+
+    @property
+    def exhausted(self):
+        """True once nothing is queued and the fed source (if any) has run dry."""
+        return not self._heap and self._source is None
+
+    def _already_done(self, payload):
+        if self.cache is not None and payload in self.cache:
+            return "cache"
+        if self.journal is not None:
+            entry = self.journal.get(payload_hash(payload))
+            if entry and entry["state"] == COMPLETED:
+                return "journal"
+        return None
+
+    def _pop_best(self):
+        """Highest-value pending item after re-scoring, or None when the queue is empty."""
+        with self._lock:
+            while self._heap:
+                _, order, item = heapq.heappop(self._heap)
+                score = self._score(item)
+                if self._heap and score < -self._heap[0][0]:
+                    heapq.heappush(self._heap, (-score, order, item))
+                    continue
+                return item, score
+        return None
+
+    def __iter__(self):
+        while True:
+            self._refill()
+            best = self._pop_best()
+            if best is None:
+                return
+            item, score = best
+            reason = self._already_done(item.payload)
+            if reason is not None:
+                metrics.inc("priority_skipped_total", reason=reason)
+                continue
+            if self.quota is not None and not self.quota.spend():
+                with self._lock:
+                    heapq.heappush(self._heap, (-score, next(self._order), item))
+                metrics.inc("priority_quota_exhausted_total")
+                logger.warning(f"Daily simulation quota of {self.quota.limit} spent; {len(self._heap)} payloads left queued")
+                return
+            with self._lock:
+                self._mark_tested(item.shape, item.values)
+            metrics.inc("priority_issued_total")
+            logger.debug(f"Issuing payload with expected value {score:.2f}: {_extract_alpha_code(item.payload)}")
+            yield item.payload
+
+    # ---- FEEDBACK ----
+
+    def on_result(self, idx, alpha, alpha_id):
+        """run_in_flight callback: fetch the result through the harvester and learn from it."""
+        if self.harvester is None or not alpha_id or not isinstance(alpha, dict):
+            return
+        future = self.harvester.submit(alpha_id, alpha)
+        if future is None:
+            stored = self.harvester.store.get(alpha_id)
+            if stored is not None:
+                self.observe(alpha, stored["is"])
+            return
+        future.add_done_callback(lambda f: self._observe_future(alpha, f))
+
+    def _observe_future(self, alpha, future):
+        try:
+            stored = future.result()
+        except Exception as e:
+            logger.warning(f"Priority feedback failed: {e}")
+            return
+        if stored is not None:
+            self.observe(alpha, stored["is"])
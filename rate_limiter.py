@@ -0,0 +1,235 @@
+"""Token buckets shared by every pipeline process on one host.
+
+`alpha_variation_main`, `iteration_main` and `automatic_submitter` often run
+at the same time against one account, and each used to meet 429s on its own
+with fixed sleeps, so between them they kept tripping the limit.
+`SharedRateLimiter` keeps one token bucket per (account, endpoint) in a small
+SQLite file (in the temp directory by default); SQLite's write lock makes
+every take-a-token step atomic across processes. BrainSession takes a token
+before each request, so all processes share one budget per endpoint:
+
+    simulate  POST /simulations
+    poll      GET  /simulations/...
+    alphas    /alphas/{id}, /users/self/alphas, PnL records
+    submit    /alphas/{id}/submit
+    data      /data-fields, /data-sets, /operators
+    other     everything else
+
+A real rate-limit 429 blocks the bucket for every process until Retry-After
+has passed and halves its rate; the rate then climbs back to the budget over
+`recovery` seconds, so the processes back off together instead of taking
+turns hitting the limit. CONCURRENT_SIMULATION_LIMIT 429s are not rate
+limits and are left to the scheduler.
+
+Budgets are (requests per second, burst). Override them with
+WQB_RATE_LIMITS, e.g. `simulate=0.5/5,alphas=8/20`; WQB_RATE_LIMIT=off
+turns the limiter off and WQB_RATE_LIMIT_PATH moves the state file.
+"""
+import logging
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from urllib.parse import urlparse
+
+from brain_api import API_BASE
+from pipeline_metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUDGETS = {
+    "simulate": (2.0, 10),
+    "poll": (10.0, 20),
+    "alphas": (5.0, 10),
+    "submit": (1.0, 5),
+    "data": (2.0, 5),
+    "other": (5.0, 10),
+}
+DEFAULT_LIMITER_PATH = os.path.join(tempfile.gettempdir(), "wqb_rate_limit.db")
+DEFAULT_RETRY_AFTER = 5.0
+# floor for a penalized rate, so a bucket always refills eventually
+MIN_RATE = 0.01
+_API_PATH = urlparse(API_BASE).path.rstrip("/")
+
+
+def endpoint_of(method, url):
+    """Budget name for a request."""
+    path = urlparse(url).path
+    if _API_PATH and path.startswith(_API_PATH):
+        path = path[len(_API_PATH):]
+    if path.startswith("/simulations"):
+        return "simulate" if method.upper() == "POST" and path.rstrip("/") == "/simulations" else "poll"
+    if path.startswith("/alphas/") and "/submit" in path:
+        return "submit"
+    if path.startswith("/alphas") or path.startswith("/users/self/alphas"):
+        return "alphas"
+    if path.startswith(("/data-fields", "/data-sets", "/operators")):
+        return "data"
+    return "other"
+
+
+def check_budget(name, rate, burst):
+    """(rate, burst) as numbers; ValueError unless rate > 0 and burst >= 1."""
+    rate, burst = float(rate), int(burst)
+    if not rate > 0:
+        raise ValueError(f"rate limit budget {name!r}: rate must be positive, got {rate}")
+    if burst < 1:
+        raise ValueError(f"rate limit budget {name!r}: burst must be at least 1, got {burst}")
+    return rate, burst
+
+
+def parse_budgets(text):
+    """`name=rate/burst,...` -> {name: (rate, burst)}, on top of DEFAULT_BUDGETS."""
+    budgets = dict(DEFAULT_BUDGETS)
+    for item in (text or "").split(","):
+        if not item.strip():
+            continue
+        name, _, value = item.partition("=")
+        rate, _, burst = value.partition("/")
+        name = name.strip()
+        budgets[name] = check_budget(name, rate, burst if burst else max(1, int(float(rate))))
+    return budgets
+
+
+def is_rate_limited(response):
+    """True for a 429 that means "slow down", not a concurrency limit."""
+    if response.status_code != 429:
+        return False
+    try:
+        return "CONCURRENT_SIMULATION_LIMIT" not in response.text
+    except Exception:
+        return True
+
+
+class SharedRateLimiter:
+    """
+    Cross-process token buckets; safe to share between threads of one process.
+
+    budgets: {endpoint: (requests per second, burst)}. recovery: seconds for
+    a halved rate to climb back to its budget. clock/sleep: wall-clock time
+    and sleep functions (for tests); every process must use the same clock.
+    """
+
+    def __init__(self, path=DEFAULT_LIMITER_PATH, budgets=None, recovery=120.0, min_rate_share=0.05,
+                 clock=time.time, sleep=time.sleep):
+        self.path = path
+        self.budgets = {name: check_budget(name, *budget) for name, budget in (budgets or DEFAULT_BUDGETS).items()}
+        self.recovery = recovery
+        self.min_rate_share = min_rate_share
+        self._clock = clock
+        self._sleep = sleep
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        # the buckets are throw-away state; losing the last update in a crash is harmless
+        self._conn.execute("PRAGMA synchronous=OFF")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS buckets (
+                key TEXT PRIMARY KEY,
+                tokens REAL NOT NULL,
+                rate REAL NOT NULL,
+                updated REAL NOT NULL,
+                blocked_until REAL NOT NULL
+            )
+            """
+        )
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def _budget(self, endpoint):
+        return self.budgets.get(endpoint) or self.budgets.get("other") or DEFAULT_BUDGETS["other"]
+
+    def _transaction(self, key, endpoint, update):
+        """Run `update(tokens, rate, blocked_until, now)` on a refilled bucket under the cross-process lock."""
+        budget_rate, burst = self._budget(endpoint)
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                now = self._clock()
+                row = self._conn.execute(
+                    "SELECT tokens, rate, updated, blocked_until FROM buckets WHERE key = ?", (key,)
+                ).fetchone()
+                if row is None:
+                    tokens, rate, blocked_until = float(burst), budget_rate, 0.0
+                else:
+                    tokens, rate, updated, blocked_until = row
+                    elapsed = max(0.0, now - updated)
+                    # the floor also covers rows written by an older, zero-rate configuration
+                    rate = max(MIN_RATE, min(budget_rate, rate + budget_rate * elapsed / self.recovery))
+                    tokens = min(float(burst), tokens + elapsed * rate)
+                tokens, rate, blocked_until, result = update(tokens, rate, blocked_until, now)
+                self._conn.execute(
+                    "INSERT INTO buckets (key, tokens, rate, updated, blocked_until) VALUES (?, ?, ?, ?, ?) "
+                    "ON CONFLICT(key) DO UPDATE SET tokens = excluded.tokens, rate = excluded.rate, "
+                    "updated = excluded.updated, blocked_until = excluded.blocked_until",
+                    (key, tokens, rate, now, blocked_until),
+                )
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        return result
+
+    def acquire(self, endpoint, account=""):
+        """Block until a token for `endpoint` is available; returns the seconds waited."""
+        key = f"{account}:{endpoint}"
+
+        def take(tokens, rate, blocked_until, now):
+            if blocked_until > now:
+                return tokens, rate, blocked_until, blocked_until - now
+            if tokens >= 1.0:
+                return tokens - 1.0, rate, blocked_until, 0.0
+            return tokens, rate, blocked_until, (1.0 - tokens) / rate
+
+        waited = 0.0
+        while True:
+            wait = self._transaction(key, endpoint, take)
+            if wait <= 0:
+                break
+            self._sleep(wait)
+            waited += wait
+        if waited:
+            metrics.observe("rate_limit_wait_seconds", waited, endpoint=endpoint)
+        return waited
+
+    def penalize(self, endpoint, account="", retry_after=None):
+        """Record a 429: every process waits out `retry_after` and the rate is halved."""
+        key = f"{account}:{endpoint}"
+        budget_rate, _ = self._budget(endpoint)
+        pause = float(retry_after) if retry_after else DEFAULT_RETRY_AFTER
+
+        def block(tokens, rate, blocked_until, now):
+            rate = max(budget_rate * self.min_rate_share, rate / 2, MIN_RATE)
+            return 0.0, rate, max(blocked_until, now + pause), rate
+
+        rate = self._transaction(key, endpoint, block)
+        metrics.inc("rate_limited_total", endpoint=endpoint)
+        logger.warning(f"Rate limited on {endpoint}; all processes pause {pause:.0f}s, rate now {rate:.2f}/s")
+
+    def state(self):
+        """{key: (tokens, rate, blocked_until)} as last written."""
+        with self._lock:
+            rows = self._conn.execute("SELECT key, tokens, rate, blocked_until FROM buckets").fetchall()
+        return {key: (tokens, rate, blocked_until) for key, tokens, rate, blocked_until in rows}
+
+
+_shared = None
+_shared_lock = threading.Lock()
+
+
+def shared_rate_limiter():
+    """The process-wide limiter configured from the environment, or None when turned off."""
+    global _shared
+    if os.environ.get("WQB_RATE_LIMIT", "").lower() in ("off", "0", "false", "no"):
+        return None
+    with _shared_lock:
+        if _shared is None:
+            _shared = SharedRateLimiter(
+                os.environ.get("WQB_RATE_LIMIT_PATH", DEFAULT_LIMITER_PATH),
+                parse_budgets(os.environ.get("WQB_RATE_LIMITS")),
+            )
+        return _shared
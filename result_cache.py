@@ -0,0 +1,164 @@
+"""Persistent, content-addressed cache of simulation results.
+
+Entries are keyed by the canonical alpha expression (see fastexpr) plus the
+settings that change a simulation's outcome, so the same alpha is recognised
+across runs even when it was produced by a different parent or template.
+Entries written before the canonical form existed are found under their old
+key and moved on first use. Each entry keeps the alpha ID and, when known,
+its IS metrics. The cache is bounded by entry count and age; least recently
+used entries go first.
+"""
+import hashlib
+import json
+import re
+import sqlite3
+import threading
+import time
+
+from fastexpr import canonical_expression
+
+DEFAULT_CACHE_PATH = "result_cache.db"
+
+# Settings that define a distinct simulation. Alpha records from
+# /users/self/alphas carry extra keys that must not affect the cache key.
+CACHE_SETTINGS = (
+    "instrumentType", "region", "universe", "delay", "decay", "neutralization",
+    "truncation", "pasteurization", "unitHandling", "nanHandling", "language",
+)
+
+
+def _key(expression, payload):
+    settings = payload.get("settings") or {}
+    canonical_settings = {name: str(settings.get(name)) for name in CACHE_SETTINGS}
+    raw = expression + "\n" + json.dumps(canonical_settings, sort_keys=True)
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+def _code(payload):
+    regular = payload.get("regular")
+    if isinstance(regular, dict):
+        regular = regular.get("code")
+    return regular
+
+
+def cache_key(payload) -> str:
+    """Key for a simulation payload or an alpha record (both have `regular` and `settings`)."""
+    return _key(canonical_expression(_code(payload)), payload)
+
+
+def legacy_cache_key(payload) -> str:
+    """Key used before the parsed canonical form: only whitespace was ignored."""
+    return _key(re.sub(r"\s+", "", _code(payload) or ""), payload)
+
+
+class ResultCache:
+    """SQLite-backed result cache; safe to share between threads of one process."""
+
+    def __init__(self, path=DEFAULT_CACHE_PATH, max_entries=200_000, max_age_days=120, evict_every=1000):
+        self.path = path
+        self.max_entries = max_entries
+        self.max_age_days = max_age_days
+        self.evict_every = evict_every
+        self._puts = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS results (
+                cache_key TEXT PRIMARY KEY,
+                expression TEXT NOT NULL,
+                alpha_id TEXT,
+                metrics TEXT,
+                created_at REAL NOT NULL,
+                last_used REAL NOT NULL
+            )
+            """
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_results_last_used ON results(last_used)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_results_created_at ON results(created_at)")
+        self._conn.commit()
+        self.evict()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def _find(self, payload):
+        """
+        Key of the payload's row, or None. A row still under its legacy key
+        (written before the canonical form) is moved to the current key.
+        Call with the lock held, inside a transaction.
+        """
+        key = cache_key(payload)
+        if self._conn.execute("SELECT 1 FROM results WHERE cache_key = ?", (key,)).fetchone():
+            return key
+        legacy = legacy_cache_key(payload)
+        if legacy == key or not self._conn.execute(
+            "SELECT 1 FROM results WHERE cache_key = ?", (legacy,)
+        ).fetchone():
+            return None
+        self._conn.execute(
+            "UPDATE results SET cache_key = ?, expression = ? WHERE cache_key = ?",
+            (key, canonical_expression(_code(payload)), legacy),
+        )
+        return key
+
+    def __contains__(self, payload):
+        with self._lock, self._conn:
+            return self._find(payload) is not None
+
+    def get(self, payload):
+        """Return `{"alpha_id": ..., "metrics": {...} or None}` for a cached payload, else None."""
+        with self._lock, self._conn:
+            key = self._find(payload)
+            if key is None:
+                return None
+            row = self._conn.execute(
+                "SELECT alpha_id, metrics FROM results WHERE cache_key = ?", (key,)
+            ).fetchone()
+            self._conn.execute("UPDATE results SET last_used = ? WHERE cache_key = ?", (time.time(), key))
+        alpha_id, metrics = row
+        return {"alpha_id": alpha_id, "metrics": json.loads(metrics) if metrics else None}
+
+    def put(self, payload, alpha_id, metrics=None):
+        """Store a result. Existing metrics are kept when `metrics` is None."""
+        regular = _code(payload)
+        now = time.time()
+        with self._lock, self._conn:
+            self._find(payload)
+            self._conn.execute(
+                """
+                INSERT INTO results (cache_key, expression, alpha_id, metrics, created_at, last_used)
+                VALUES (?, ?, ?, ?, ?, ?)
+                ON CONFLICT(cache_key) DO UPDATE SET
+                    alpha_id = COALESCE(excluded.alpha_id, results.alpha_id),
+                    metrics = COALESCE(excluded.metrics, results.metrics),
+                    last_used = excluded.last_used
+                """,
+                (
+                    cache_key(payload), canonical_expression(regular), alpha_id,
+                    json.dumps(metrics) if metrics is not None else None, now, now,
+                ),
+            )
+        self._puts += 1
+        if self._puts % self.evict_every == 0:
+            self.evict()
+
+    def evict(self):
+        """Drop entries older than `max_age_days`, then the least recently used above `max_entries`."""
+        cutoff = time.time() - self.max_age_days * 86400
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM results WHERE created_at < ?", (cutoff,))
+            (count,) = self._conn.execute("SELECT COUNT(*) FROM results").fetchone()
+            if count > self.max_entries:
+                self._conn.execute(
+                    "DELETE FROM results WHERE cache_key IN "
+                    "(SELECT cache_key FROM results ORDER BY last_used LIMIT ?)",
+                    (count - self.max_entries,),
+                )
+
+    def __len__(self):
+        with self._lock:
+            (count,) = self._conn.execute("SELECT COUNT(*) FROM results").fetchone()
+        return count
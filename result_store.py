@@ -0,0 +1,316 @@
+"""Harvest full simulation results into a local columnar store.
+
+`testing_alphas` only kept the alpha ID of a finished simulation; the IS
+metrics and check outcomes had to be recovered later by paging through
+/users/self/alphas again. `ResultHarvester` fetches `/alphas/{id}` for every
+completed simulation on a thread pool, over a connection pool sized to it,
+with Retry-After handling and exponential backoff, and writes the results to
+`ResultStore`.
+
+`ResultStore` keeps one row per alpha, keyed by alpha ID and indexed by the
+simulation payload hash (simulation_journal.payload_hash), with one typed
+column per metric and the check outcomes as short strings instead of the raw
+JSON. `select` hands back API-shaped dicts, so alpha_selection and the
+submitter's check filters work on it unchanged.
+"""
+import logging
+import random
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from brain_api import API_BASE
+from pipeline_metrics import metrics
+from simulation_journal import payload_hash
+
+logger = logging.getLogger(__name__)
+
+ALPHA_URL = f"{API_BASE}/alphas/{{alpha_id}}"
+DEFAULT_RESULTS_PATH = "alpha_results.db"
+
+# IS metric -> column
+RESULT_METRIC_COLUMNS = {
+    "sharpe": "sharpe",
+    "fitness": "fitness",
+    "returns": "returns",
+    "turnover": "turnover",
+    "drawdown": "drawdown",
+    "margin": "margin",
+    "longCount": "long_count",
+    "shortCount": "short_count",
+}
+SETTING_COLUMNS = ("region", "universe", "delay", "decay", "neutralization", "truncation")
+
+
+def fetch_alpha(sess, alpha_id, max_retries=5, base_delay=1.0, max_delay=60.0, max_throttled=10):
+    """
+    GET /alphas/{id} and return the alpha record, or None.
+
+    429/503 responses are waited out as their Retry-After asks (at most
+    `max_delay`), up to `max_throttled` times; other failures back off
+    exponentially (with jitter) up to `max_retries` times; other client
+    errors are not retried.
+    """
+    url = ALPHA_URL.format(alpha_id=alpha_id)
+    failures = 0
+    throttled = 0
+    while failures < max_retries:
+        try:
+            response = sess.get(url)
+            if response.status_code in (429, 503):
+                throttled += 1
+                if throttled > max_throttled:
+                    logger.error(f"Fetching alpha {alpha_id} still throttled after {max_throttled} waits")
+                    return None
+                time.sleep(min(max_delay, float(response.headers.get("Retry-After") or base_delay)))
+                continue
+            if response.status_code >= 500:
+                raise RuntimeError(f"status {response.status_code}")
+            if response.status_code >= 400:
+                # 404/403 will not change on retry
+                logger.error(f"Fetching alpha {alpha_id} failed: status {response.status_code}")
+                return None
+            return response.json()
+        except Exception as e:
+            failures += 1
+            delay = min(max_delay, base_delay * 2 ** failures) * random.uniform(0.5, 1.0)
+            logger.warning(f"Fetching alpha {alpha_id} failed (attempt {failures}): {e}; retrying in {delay:.1f}s")
+            time.sleep(delay)
+    return None
+
+
+def _encode_checks(checks):
+    """`NAME=RESULT,...` for every check, e.g. `LOW_SHARPE=PASS,SELF_CORRELATION=PENDING`."""
+    return ",".join(f"{check.get('name')}={check.get('result')}" for check in checks or [] if check.get("name"))
+
+
+def _decode_checks(text):
+    checks = []
+    for item in (text or "").split(","):
+        if "=" in item:
+            name, result = item.split("=", 1)
+            checks.append({"name": name, "result": result})
+    return checks
+
+
+class ResultStore:
+    """SQLite-backed result store; safe to share between threads of one process."""
+
+    def __init__(self, path=DEFAULT_RESULTS_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        metric_columns = ", ".join(f"{column} REAL" for column in RESULT_METRIC_COLUMNS.values())
+        self._conn.execute(
+            f"""
+            CREATE TABLE IF NOT EXISTS results (
+                alpha_id TEXT PRIMARY KEY,
+                payload_hash TEXT,
+                code TEXT,
+                region TEXT,
+                universe TEXT,
+                delay INTEGER,
+                decay INTEGER,
+                neutralization TEXT,
+                truncation REAL,
+                date_created TEXT,
+                {metric_columns},
+                failed_checks INTEGER,
+                pending_checks INTEGER,
+                checks TEXT,
+                harvested_at REAL NOT NULL
+            )
+            """
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_results_payload ON results(payload_hash)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_results_sharpe ON results(sharpe)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_results_fitness ON results(fitness)")
+        self._conn.commit()
+        self._columns = ["alpha_id", "payload_hash", "code", *SETTING_COLUMNS, "date_created",
+                         *RESULT_METRIC_COLUMNS.values(), "failed_checks", "pending_checks", "checks", "harvested_at"]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    # ---- WRITE SIDE ----
+
+    def put(self, alpha, payload=None):
+        """Store an /alphas/{id} record; `payload` is the simulation payload that produced it."""
+        stats = alpha.get("is") or {}
+        settings = alpha.get("settings") or (payload or {}).get("settings") or {}
+        regular = alpha.get("regular")
+        code = regular.get("code") if isinstance(regular, dict) else regular
+        checks = stats.get("checks") or []
+        row = (
+            alpha.get("id"), payload_hash(payload) if payload else None, code,
+            *[settings.get(name) for name in SETTING_COLUMNS], alpha.get("dateCreated"),
+            *[stats.get(metric) for metric in RESULT_METRIC_COLUMNS],
+            sum(1 for check in checks if check.get("result") == "FAIL"),
+            sum(1 for check in checks if check.get("result") == "PENDING"),
+            _encode_checks(checks), time.time(),
+        )
+        updates = ", ".join(
+            f"{column} = COALESCE(excluded.{column}, {column})" if column == "payload_hash" else f"{column} = excluded.{column}"
+            for column in self._columns[1:]
+        )
+        with self._lock, self._conn:
+            self._conn.execute(
+                f"INSERT INTO results ({', '.join(self._columns)}) VALUES ({', '.join('?' * len(self._columns))}) "
+                f"ON CONFLICT(alpha_id) DO UPDATE SET {updates}",
+                row,
+            )
+
+    # ---- READ SIDE ----
+
+    def __contains__(self, alpha_id):
+        with self._lock:
+            return self._conn.execute("SELECT 1 FROM results WHERE alpha_id = ?", (alpha_id,)).fetchone() is not None
+
+    def __len__(self):
+        with self._lock:
+            (count,) = self._conn.execute("SELECT COUNT(*) FROM results").fetchone()
+        return count
+
+    def _as_alpha(self, row):
+        record = dict(zip(self._columns, row))
+        stats = {metric: record[column] for metric, column in RESULT_METRIC_COLUMNS.items()}
+        stats["checks"] = _decode_checks(record["checks"])
+        return {
+            "id": record["alpha_id"],
+            "dateCreated": record["date_created"],
+            "regular": {"code": record["code"]},
+            "settings": {name: record[name] for name in SETTING_COLUMNS if record[name] is not None},
+            "is": stats,
+            "payloadHash": record["payload_hash"],
+        }
+
+    def get(self, alpha_id):
+        """API-shaped alpha dict (id, regular, settings, is with checks), or None."""
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT {', '.join(self._columns)} FROM results WHERE alpha_id = ?", (alpha_id,)
+            ).fetchone()
+        return self._as_alpha(row) if row else None
+
+    def for_payload(self, payload):
+        """The stored result of a simulation payload, or None."""
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT {', '.join(self._columns)} FROM results WHERE payload_hash = ? "
+                f"ORDER BY harvested_at DESC LIMIT 1",
+                (payload_hash(payload),),
+            ).fetchone()
+        return self._as_alpha(row) if row else None
+
+    def select(self, min_sharpe=None, min_fitness=None, max_turnover=None, exclude_failed=False, limit=None):
+        """API-shaped alpha dicts passing the thresholds, best sharpe first."""
+        query = f"SELECT {', '.join(self._columns)} FROM results"
+        conditions, params = [], []
+        for column, op, threshold in (("sharpe", ">=", min_sharpe), ("fitness", ">=", min_fitness),
+                                      ("turnover", "<=", max_turnover)):
+            if threshold is not None:
+                conditions.append(f"COALESCE({column}, {'0' if op == '>=' else '1e9'}) {op} ?")
+                params.append(threshold)
+        if exclude_failed:
+            conditions.append("COALESCE(failed_checks, 0) = 0")
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+        query += " ORDER BY sharpe DESC"
+        if limit is not None:
+            query += " LIMIT ?"
+            params.append(limit)
+        with self._lock:
+            rows = self._conn.execute(query, params).fetchall()
+        return [self._as_alpha(row) for row in rows]
+
+    def rows(self, *columns):
+        """Tuples of the given columns for every stored result (no JSON decoding)."""
+        unknown = set(columns) - set(self._columns)
+        if unknown:
+            raise ValueError(f"Unknown result columns: {', '.join(sorted(unknown))}")
+        with self._lock:
+            return self._conn.execute(f"SELECT {', '.join(columns)} FROM results").fetchall()
+
+    def frame(self):
+        """All results as a DataFrame with one column per stored field."""
+        import pandas as pd
+        with self._lock:
+            rows = self._conn.execute(f"SELECT {', '.join(self._columns)} FROM results").fetchall()
+        return pd.DataFrame(rows, columns=self._columns)
+
+
+class ResultHarvester:
+    """
+    Fetch and store the full result of completed simulations concurrently.
+
+    `on_result` matches run_in_flight's callback, so pass it straight to the
+    scheduler (testing_alphas(harvester=...) does). Alphas already in the
+    store are not fetched again. Use as a context manager, or call `close()`
+    to wait for outstanding fetches.
+
+    Fetches go through the caller's session and share its connection pool,
+    which is sized when the session is created (BrainSession's
+    `pool_maxsize`); keep `max_workers` at or below it.
+    """
+
+    def __init__(self, sess, store=None, max_workers=8, max_retries=5):
+        self.sess = sess
+        self.store = store if store is not None else ResultStore()
+        self.max_retries = max_retries
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="harvest")
+        self._pending = set()
+        self._pending_lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self._pool.shutdown(wait=True)
+
+    def fetch(self, alpha_id, payload=None):
+        """Fetch and store one alpha now; returns the stored API-shaped dict or None."""
+        stored = self.store.get(alpha_id)
+        if stored is not None:
+            return stored
+        with metrics.timer("stage_seconds", stage="harvest_alpha"):
+            alpha = fetch_alpha(self.sess, alpha_id, max_retries=self.max_retries)
+        if alpha is None:
+            metrics.inc("harvests_total", outcome="failed")
+            logger.error(f"Could not harvest alpha {alpha_id}")
+            return None
+        self.store.put(alpha, payload)
+        metrics.inc("harvests_total", outcome="stored")
+        return self.store.get(alpha_id)
+
+    def submit(self, alpha_id, payload=None):
+        """Queue one alpha for fetching in the background; returns a Future (or None if skipped)."""
+        if not alpha_id or alpha_id in self.store:
+            return None
+        with self._pending_lock:
+            if alpha_id in self._pending:
+                return None
+            self._pending.add(alpha_id)
+        future = self._pool.submit(self.fetch, alpha_id, payload)
+        future.add_done_callback(lambda _: self._discard_pending(alpha_id))
+        return future
+
+    def _discard_pending(self, alpha_id):
+        with self._pending_lock:
+            self._pending.discard(alpha_id)
+
+    def on_result(self, idx, alpha, alpha_id):
+        self.submit(alpha_id, alpha if isinstance(alpha, dict) else None)
+
+    def harvest(self, alpha_ids):
+        """Fetch every ID that is not stored yet and wait; returns the IDs now stored."""
+        futures = [self.submit(alpha_id) for alpha_id in dict.fromkeys(alpha_ids)]
+        for future in futures:
+            if future is not None:
+                future.result()
+        return [alpha_id for alpha_id in dict.fromkeys(alpha_ids) if alpha_id in self.store]
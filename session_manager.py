@@ -0,0 +1,192 @@
+"""Shared, self-refreshing Brain sessions.
+
+`BrainSession` (in brain_session, which is the only place that imports
+`requests`) is a `requests.Session` that knows its account, records when its
+auth token expires and re-authenticates shortly before that, or at once when
+a request comes back 401. It is still importable from here; this module
+itself stays free of `requests` so variant generation and other offline work
+can import `sign_in` and friends without paying for it.
+
+`SessionPool` holds one BrainSession per credential set in `credential.txt`
+and has the same `get`/`post` interface: new simulations go to the account
+with the fewest simulations running, and follow-up requests for a simulation
+or alpha go to the account that created it.
+
+`sign_in` replaces the per-module login functions and hands out one shared
+session (or pool) per process.
+"""
+import json
+import logging
+import os
+import re
+import threading
+
+from brain_api import SIMULATIONS_URL
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CREDENTIALS_PATH = "credential.txt"
+DEFAULT_TOKEN_LIFETIME = 4 * 3600  # used when the server does not say
+REFRESH_MARGIN = 300
+
+_RESOURCE_RE = re.compile(r"/(simulations|alphas)/([^/?#]+)")
+
+
+class AuthenticationError(RuntimeError):
+    """The platform refused the credentials."""
+
+
+def load_credentials(credentials_path=None, username=None, password=None):
+    """
+    List of `(username, password)` pairs.
+
+    Explicit username/password win; otherwise `credentials_path` (default
+    credential.txt, if it exists) is read as JSON: `{"username", "password"}`,
+    a list of such dicts, `["user", "pass"]`, or a list of such pairs.
+    Falls back to the WQB_USERNAME / WQB_PASSWORD environment variables.
+    """
+    if username and password:
+        return [(username, password)]
+    path = credentials_path or (DEFAULT_CREDENTIALS_PATH if os.path.exists(DEFAULT_CREDENTIALS_PATH) else None)
+    if path:
+        with open(path, "r") as f:
+            data = json.load(f)
+        if isinstance(data, dict):
+            data = [data]
+        if isinstance(data, list) and len(data) == 2 and all(isinstance(item, str) for item in data):
+            data = [data]
+        accounts = []
+        for item in data if isinstance(data, list) else []:
+            if isinstance(item, dict):
+                accounts.append((item.get("username"), item.get("password")))
+            elif isinstance(item, (list, tuple)) and len(item) == 2:
+                accounts.append(tuple(item))
+        accounts = [(user, pwd) for user, pwd in accounts if user and pwd]
+        if not accounts:
+            raise AuthenticationError(f"No usable credentials in {path}")
+        return accounts
+    username, password = os.getenv("WQB_USERNAME"), os.getenv("WQB_PASSWORD")
+    if not username or not password:
+        raise AuthenticationError(
+            "Missing username or password for authentication. "
+            "Set env WQB_USERNAME/WQB_PASSWORD, pass credentials or create credential.txt."
+        )
+    return [(username, password)]
+
+
+class SessionPool:
+    """
+    Several BrainSessions behind the Session interface used by the pipeline.
+
+    Simulations are spread over the accounts by how many each has running;
+    everything that names a simulation or alpha is sent with the account that
+    created it. Size `max_in_flight` as per-account limit x len(pool).
+    """
+
+    def __init__(self, sessions):
+        if not sessions:
+            raise ValueError("SessionPool needs at least one session")
+        self.sessions = list(sessions)
+        self._lock = threading.Lock()
+        self._owner = {}      # simulation or alpha id -> session
+        self._running = {id(s): set() for s in self.sessions}  # session -> running simulation ids
+        self._next = 0
+
+    def __len__(self):
+        return len(self.sessions)
+
+    def authenticate(self):
+        for session in self.sessions:
+            session.authenticate()
+
+    def _pick(self):
+        with self._lock:
+            start = self._next
+            self._next = (self._next + 1) % len(self.sessions)
+            order = self.sessions[start:] + self.sessions[:start]
+            return min(order, key=lambda s: len(self._running[id(s)]))
+
+    def _session_for(self, url):
+        match = _RESOURCE_RE.search(url)
+        with self._lock:
+            owner = self._owner.get(match.group(2)) if match else None
+        return owner or self.sessions[0]
+
+    def _remember(self, session, *resource_ids):
+        with self._lock:
+            for resource_id in resource_ids:
+                if resource_id:
+                    self._owner[str(resource_id)] = session
+
+    def post(self, url, *args, **kwargs):
+        if url.rstrip("/") != SIMULATIONS_URL:
+            return self._session_for(url).post(url, *args, **kwargs)
+        session = self._pick()
+        response = session.post(url, *args, **kwargs)
+        location = response.headers.get("Location")
+        match = _RESOURCE_RE.search(location or "")
+        if match:
+            self._remember(session, match.group(2))
+            with self._lock:
+                self._running[id(session)].add(match.group(2))
+        return response
+
+    def get(self, url, *args, **kwargs):
+        session = self._session_for(url)
+        response = session.get(url, *args, **kwargs)
+        match = _RESOURCE_RE.search(url)
+        if match and match.group(1) == "simulations" and not response.headers.get("Retry-After"):
+            with self._lock:
+                self._running[id(session)].discard(match.group(2))
+            try:
+                body = response.json()
+            except ValueError:
+                body = None
+            if isinstance(body, dict):
+                children = [str(child).rstrip("/").rsplit("/", 1)[-1] for child in body.get("children") or []]
+                self._remember(session, body.get("alpha"), *children)
+        return response
+
+    def patch(self, url, *args, **kwargs):
+        return self._session_for(url).patch(url, *args, **kwargs)
+
+
+def __getattr__(name):
+    # `from session_manager import BrainSession` keeps working, importing requests on demand
+    if name == "BrainSession":
+        from brain_session import BrainSession
+        return BrainSession
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def account_count(sess):
+    """Number of accounts behind a session or pool (scale max_in_flight by it)."""
+    return len(sess) if isinstance(sess, SessionPool) else 1
+
+
+_shared = None
+_shared_lock = threading.Lock()
+
+
+def sign_in(credentials_path=None, username=None, password=None, pool=False):
+    """
+    Return the process-wide session, logging in first.
+
+    The first call (or one with explicit credentials) creates it: a
+    BrainSession for the first account, or with pool=True a SessionPool over
+    every account in the credentials file. Later calls without arguments
+    force a fresh login of the existing session and return it, which is what
+    the retry paths that call `sign_in()` after repeated failures expect.
+    """
+    from brain_session import BrainSession
+    global _shared
+    with _shared_lock:
+        if _shared is None or credentials_path or username or password or (pool and not isinstance(_shared, SessionPool)):
+            accounts = load_credentials(credentials_path, username, password)
+            sessions = [BrainSession(user, pwd) for user, pwd in (accounts if pool else accounts[:1])]
+            shared = SessionPool(sessions) if pool else sessions[0]
+            shared.authenticate()
+            _shared = shared
+        else:
+            _shared.authenticate()
+        return _shared
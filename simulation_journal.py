@@ -0,0 +1,182 @@
+"""Durable on-disk journal of simulation payloads so crashed runs can resume.
+
+Every payload is keyed by `payload_hash` and moves through the states
+submitted -> in_flight (progress URL known) -> completed (alpha ID) or failed.
+`run_in_flight` consults the journal: completed payloads are skipped, and
+payloads still in flight server-side are re-attached by polling their stored
+progress URL instead of being simulated a second time.
+"""
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+
+from fastexpr import canonical_expression
+
+SUBMITTED = "submitted"
+IN_FLIGHT = "in_flight"
+COMPLETED = "completed"
+FAILED = "failed"
+
+DEFAULT_JOURNAL_PATH = "simulation_journal.db"
+
+# PRAGMA user_version; 1 = payload_hash over the canonical expression,
+# 2 = nested == / != keep their grouping
+SCHEMA_VERSION = 2
+# which of two rows for the same payload survives when keys are merged
+_STATE_RANK = {COMPLETED: 3, IN_FLIGHT: 2, SUBMITTED: 1, FAILED: 0}
+
+
+def payload_hash(payload) -> str:
+    """Stable hash of a simulation payload; the expression counts in canonical form."""
+    if isinstance(payload, str):
+        raw = payload
+    else:
+        if isinstance(payload.get("regular"), str):
+            payload = dict(payload, regular=canonical_expression(payload["regular"]))
+        raw = json.dumps(payload, sort_keys=True, ensure_ascii=True)
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+class SimulationJournal:
+    """SQLite-backed journal; safe to share between threads of one process."""
+
+    def __init__(self, path=DEFAULT_JOURNAL_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS simulations (
+                payload_hash TEXT PRIMARY KEY,
+                payload TEXT NOT NULL,
+                state TEXT NOT NULL,
+                progress_url TEXT,
+                batch_pos INTEGER,
+                alpha_id TEXT,
+                error TEXT,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                updated_at REAL NOT NULL
+            )
+            """
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_simulations_state ON simulations(state)")
+        self._conn.commit()
+        self._migrate()
+
+    def _migrate(self):
+        """
+        Re-key rows written before payload_hash used the canonical expression,
+        so runs interrupted before the upgrade still resume. When two old rows
+        collapse to one key, the one further along is kept.
+        """
+        (version,) = self._conn.execute("PRAGMA user_version").fetchone()
+        if version >= SCHEMA_VERSION:
+            return
+        with self._conn:
+            rows = self._conn.execute("SELECT payload_hash, payload, state FROM simulations").fetchall()
+            for old_key, payload, state in rows:
+                new_key = payload_hash(json.loads(payload))
+                if new_key == old_key:
+                    continue
+                existing = self._conn.execute(
+                    "SELECT state FROM simulations WHERE payload_hash = ?", (new_key,)
+                ).fetchone()
+                if existing is not None:
+                    if _STATE_RANK.get(existing[0], 0) >= _STATE_RANK.get(state, 0):
+                        self._conn.execute("DELETE FROM simulations WHERE payload_hash = ?", (old_key,))
+                        continue
+                    self._conn.execute("DELETE FROM simulations WHERE payload_hash = ?", (new_key,))
+                self._conn.execute(
+                    "UPDATE simulations SET payload_hash = ? WHERE payload_hash = ?", (new_key, old_key)
+                )
+            self._conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def get(self, key):
+        """Return the journal row for a payload hash as a dict, or None."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT payload_hash, payload, state, progress_url, batch_pos, alpha_id, error, attempts "
+                "FROM simulations WHERE payload_hash = ?",
+                (key,),
+            ).fetchone()
+        if row is None:
+            return None
+        return dict(zip(
+            ("payload_hash", "payload", "state", "progress_url", "batch_pos", "alpha_id", "error", "attempts"),
+            row,
+        ))
+
+    def mark_submitted(self, payloads):
+        """Record payloads about to be posted (before the POST, so a crash leaves a trace)."""
+        now = time.time()
+        with self._lock, self._conn:
+            for payload in payloads:
+                self._conn.execute(
+                    """
+                    INSERT INTO simulations (payload_hash, payload, state, attempts, updated_at)
+                    VALUES (?, ?, ?, 1, ?)
+                    ON CONFLICT(payload_hash) DO UPDATE SET
+                        state = excluded.state, progress_url = NULL, batch_pos = NULL,
+                        attempts = simulations.attempts + 1, updated_at = excluded.updated_at
+                    """,
+                    (payload_hash(payload), json.dumps(payload, ensure_ascii=True), SUBMITTED, now),
+                )
+
+    def mark_in_flight(self, payloads, progress_url):
+        """Store the progress URL; payloads of one batch keep their position in it."""
+        now = time.time()
+        batch = len(payloads) > 1
+        with self._lock, self._conn:
+            for pos, payload in enumerate(payloads):
+                self._conn.execute(
+                    "UPDATE simulations SET state = ?, progress_url = ?, batch_pos = ?, updated_at = ? "
+                    "WHERE payload_hash = ?",
+                    (IN_FLIGHT, progress_url, pos if batch else None, now, payload_hash(payload)),
+                )
+
+    def mark_completed(self, payload, alpha_id):
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE simulations SET state = ?, alpha_id = ?, error = NULL, updated_at = ? "
+                "WHERE payload_hash = ?",
+                (COMPLETED, alpha_id, time.time(), payload_hash(payload)),
+            )
+
+    def mark_failed(self, payload, error):
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE simulations SET state = ?, error = ?, progress_url = NULL, updated_at = ? "
+                "WHERE payload_hash = ?",
+                (FAILED, str(error)[:500], time.time(), payload_hash(payload)),
+            )
+
+    def in_flight(self):
+        """
+        Simulations still running server-side, grouped by progress URL.
+
+        Returns a list of `(progress_url, [payload, ...])`, batch members in
+        their original order so children can be fanned out by position.
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT progress_url, payload FROM simulations WHERE state = ? "
+                "ORDER BY progress_url, COALESCE(batch_pos, 0)",
+                (IN_FLIGHT,),
+            ).fetchall()
+        grouped = {}
+        for progress_url, payload in rows:
+            grouped.setdefault(progress_url, []).append(json.loads(payload))
+        return list(grouped.items())
+
+    def counts(self):
+        """Number of journal entries per state."""
+        with self._lock:
+            rows = self._conn.execute("SELECT state, COUNT(*) FROM simulations GROUP BY state").fetchall()
+        return dict(rows)
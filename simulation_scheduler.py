@@ -0,0 +1,459 @@
+"""Keep several simulations in flight and poll them all from one loop.
+
+`testing_alphas` used to post one alpha, wait for it and only then post the
+next one. `run_in_flight` fills up to `max_in_flight` slots, polls every
+outstanding `Location` URL according to its own `Retry-After`, and refills a
+slot as soon as a simulation finishes. Per-alpha retry and re-login semantics
+are the same as the serial loop: `alpha_fail_attempt_tolerance` attempts, one
+re-login, then the alpha is skipped.
+
+With `batch_size > 1` compatible payloads are packed into multi-simulation
+requests (a JSON list of REGULAR payloads). When the parent simulation
+finishes, its children are fetched and their alpha IDs fanned back out to the
+original list positions. A rejected batch falls back to single submissions.
+A failed poll is retried against the same progress URL after a backoff,
+since the simulation may still be running server-side.
+
+With a `SimulationJournal`, payloads the journal marks completed are skipped
+and simulations it still has in flight are re-attached by progress URL.
+With a `ResultCache`, payloads simulated by any earlier run are answered from
+the cache and new results are added to it.
+
+`alpha_list` may be a live stream (see streaming_pipeline): it yields
+`SOURCE_IDLE` when nothing is ready yet, and the scheduler keeps polling and
+asks again shortly instead of treating the source as exhausted. `on_result`
+is told about every alpha as soon as its fate is known.
+"""
+import logging
+import time
+from collections import deque
+
+from brain_api import SIMULATIONS_URL
+from pipeline_metrics import metrics
+from simulation_journal import COMPLETED, payload_hash
+
+logger = logging.getLogger(__name__)
+
+
+MAX_MULTI_SIMULATION_SIZE = 10
+
+# Settings that must match for payloads to share one multi-simulation request.
+BATCH_COMPATIBLE_SETTINGS = ("instrumentType", "region", "universe", "delay", "language")
+
+# Yielded by a streaming alpha source that has nothing ready right now.
+SOURCE_IDLE = object()
+
+
+class SimulationJob:
+    """One alpha payload, or a batch of them, moving through the scheduler."""
+
+    def __init__(self, idx, alpha, members=None):
+        self.idx = idx
+        self.alpha = alpha
+        # (idx, alpha) pairs covered by this job; more than one for a batch.
+        self.members = members or [(idx, alpha)]
+        self.progress_url = None
+        self.next_poll = 0.0
+        self.not_before = 0.0
+        self.failure_count = 0
+        self.poll_failures = 0
+        self.has_relogged = False
+        self.queued_at = time.time()
+        self.submitted_at = None
+
+    @property
+    def is_batch(self):
+        return len(self.members) > 1
+
+    @property
+    def kind(self):
+        return "batch" if self.is_batch else "single"
+
+    def describe(self):
+        if self.is_batch:
+            return f"batch of {len(self.members)} alphas starting at [{self.idx}]"
+        return self.alpha.get("regular", "Unknown") if isinstance(self.alpha, dict) else str(self.alpha)
+
+    def payloads(self):
+        return [alpha for _, alpha in self.members]
+
+    def split(self):
+        """Break a batch back into single-alpha jobs."""
+        return [SimulationJob(idx, alpha) for idx, alpha in self.members]
+
+
+def batch_key(alpha):
+    """Payloads with the same key may be submitted together; None means never batch."""
+    if not isinstance(alpha, dict) or alpha.get("type") != "REGULAR":
+        return None
+    settings = alpha.get("settings") or {}
+    return tuple(str(settings.get(name)) for name in BATCH_COMPATIBLE_SETTINGS)
+
+
+def batch_alphas(indexed_alphas, batch_size=MAX_MULTI_SIMULATION_SIZE):
+    """
+    Group (idx, alpha) pairs into SimulationJobs of compatible payloads.
+
+    Works lazily: at most `batch_size` payloads per compatibility key are held
+    back before their batch is emitted, the rest are flushed at the end or
+    when the source goes idle (`SOURCE_IDLE` is passed through after them).
+    """
+    batch_size = max(1, min(batch_size, MAX_MULTI_SIMULATION_SIZE))
+    buckets = {}
+    for item in indexed_alphas:
+        if item is SOURCE_IDLE:
+            for bucket in buckets.values():
+                yield _job_from_members(bucket)
+            buckets.clear()
+            yield SOURCE_IDLE
+            continue
+        idx, alpha = item
+        key = batch_key(alpha) if batch_size > 1 else None
+        if key is None:
+            yield SimulationJob(idx, alpha)
+            continue
+        bucket = buckets.setdefault(key, [])
+        bucket.append((idx, alpha))
+        if len(bucket) >= batch_size:
+            del buckets[key]
+            yield _job_from_members(bucket)
+    for bucket in buckets.values():
+        yield _job_from_members(bucket)
+
+
+def _job_from_members(members):
+    if len(members) == 1:
+        return SimulationJob(*members[0])
+    return SimulationJob(members[0][0], [alpha for _, alpha in members], members)
+
+
+def _indexed(alpha_list):
+    """enumerate() that passes SOURCE_IDLE through without using up an index."""
+    idx = 0
+    for alpha in alpha_list:
+        if alpha is SOURCE_IDLE:
+            yield SOURCE_IDLE
+            continue
+        yield idx, alpha
+        idx += 1
+
+
+class BatchRejected(RuntimeError):
+    """The platform refused a multi-simulation request as a whole."""
+
+
+def _submit(sess, job, now, retry_sleep):
+    """Post the job. Returns False if the platform asked us to come back later."""
+    sim_resp = sess.post(SIMULATIONS_URL, json=job.alpha)
+    if sim_resp.status_code == 429:
+        # Concurrent-simulation limit or rate limit: not the alpha's fault.
+        wait_time = float(sim_resp.headers.get("Retry-After", retry_sleep))
+        logger.info(f"[{job.idx}] Simulation slot unavailable, retrying in {wait_time}s")
+        metrics.inc("simulation_slot_waits_total")
+        job.not_before = now + wait_time
+        return False
+    if 'Location' not in sim_resp.headers:
+        if job.is_batch:
+            raise BatchRejected(
+                f"Batch rejected | status={sim_resp.status_code} | "
+                f"response={sim_resp.text[:200]}"
+            )
+        raise RuntimeError(
+            f"Submit failed | status={sim_resp.status_code} | "
+            f"response={sim_resp.text[:200]}"
+        )
+    job.progress_url = sim_resp.headers['Location']
+    job.next_poll = now
+    # `now` is the scheduler tick, which can predate a job queued in the same tick
+    job.submitted_at = time.time()
+    metrics.observe("simulation_queue_seconds", job.submitted_at - job.queued_at, kind=job.kind)
+    logging.info(f"[{job.idx}] Alpha submitted: {job.progress_url}")
+    print(f"[{job.idx}] Alpha submitted: {job.progress_url}")
+    return True
+
+
+def _poll(sess, job, now):
+    """Poll the job once. Returns the finished progress response or None."""
+    sim_progress_resp = sess.get(job.progress_url)
+    retry_after = float(sim_progress_resp.headers.get("Retry-After", 0))
+    if retry_after == 0:
+        return sim_progress_resp
+    job.next_poll = now + retry_after
+    return None
+
+
+def _child_alpha_ids(sess, job, done_resp):
+    """Fan a finished multi-simulation out to one alpha ID per member."""
+    children = done_resp.json().get("children") or []
+    if len(children) != len(job.members):
+        raise BatchRejected(
+            f"Batch finished with {len(children)} children for {len(job.members)} alphas | "
+            f"status={done_resp.json().get('status')}"
+        )
+    alpha_ids = []
+    for child in children:
+        child_url = child if str(child).startswith("http") else f"{SIMULATIONS_URL}/{child}"
+        alpha_ids.append(sess.get(child_url).json().get("alpha"))
+    return alpha_ids
+
+
+def run_in_flight(
+    alpha_list,
+    sess,
+    sign_in,
+    max_in_flight=3,
+    alpha_fail_attempt_tolerance=3,
+    retry_sleep=5,
+    batch_size=1,
+    journal=None,
+    cache=None,
+    on_result=None,
+    idle_poll=0.2,
+):
+    """
+    Simulate `alpha_list` keeping up to `max_in_flight` simulations running.
+
+    `sign_in` is called without arguments when an alpha exhausts its attempts
+    and has not triggered a re-login yet; the new session is shared by every
+    slot. A batch counts as one slot. Returns a list of `(idx, alpha_id)` in
+    completion order, including alphas the journal already had completed.
+
+    on_result(idx, alpha, alpha_id) is called for every alpha of the list as
+    soon as it is done (from journal, cache or simulation) or given up on
+    (alpha_id None). When the source yields SOURCE_IDLE it is asked again
+    after `idle_poll` seconds.
+    """
+    retry_queue = deque()
+    in_flight = []
+    results = []
+    # payload hash -> list index, for alphas covered by a re-attached simulation
+    reattached = {}
+
+    if journal is not None:
+        for progress_url, payloads in journal.in_flight():
+            job = _job_from_members([(None, payload) for payload in payloads])
+            job.progress_url = progress_url
+            in_flight.append(job)
+            for payload in payloads:
+                reattached[payload_hash(payload)] = None
+            logging.info(f"Re-attached to {job.describe()} at {progress_url}")
+            print(f"Re-attached to {job.describe()} at {progress_url}")
+
+    def record(idx, alpha, alpha_id):
+        results.append((idx, alpha_id))
+        if on_result is not None:
+            on_result(idx, alpha, alpha_id)
+
+    def unfinished(indexed_alphas):
+        for item in indexed_alphas:
+            if journal is None or item is SOURCE_IDLE:
+                yield item
+                continue
+            idx, alpha = item
+            key = payload_hash(alpha)
+            if key in reattached:
+                reattached[key] = idx
+                continue
+            entry = journal.get(key)
+            if entry and entry["state"] == COMPLETED:
+                logging.info(f"[{idx}] Already simulated (journal). Alpha ID: {entry['alpha_id']}")
+                metrics.inc("simulations_skipped_total", source="journal")
+                record(idx, alpha, entry["alpha_id"])
+                continue
+            yield idx, alpha
+
+    def uncached(indexed_alphas):
+        for item in indexed_alphas:
+            if item is SOURCE_IDLE:
+                yield item
+                continue
+            idx, alpha = item
+            cached = cache.get(alpha) if cache is not None and isinstance(alpha, dict) else None
+            if cached is not None:
+                logging.info(f"[{idx}] Already simulated (cache). Alpha ID: {cached['alpha_id']}")
+                metrics.inc("simulations_skipped_total", source="cache")
+                record(idx, alpha, cached["alpha_id"])
+                continue
+            yield idx, alpha
+
+    def complete(job, alpha_ids):
+        if job.submitted_at is not None:
+            metrics.observe("simulation_seconds", time.time() - job.submitted_at, kind=job.kind)
+        metrics.inc("simulations_completed_total", sum(1 for alpha_id in alpha_ids if alpha_id))
+        for (idx, alpha), alpha_id in zip(job.members, alpha_ids):
+            if cache is not None and alpha_id and isinstance(alpha, dict):
+                cache.put(alpha, alpha_id)
+            if journal is not None:
+                if alpha_id:
+                    journal.mark_completed(alpha, alpha_id)
+                else:
+                    # ERROR or no alpha: leave it retryable for the next resume
+                    journal.mark_failed(alpha, "simulation finished without an alpha")
+                key = payload_hash(alpha)
+                if key in reattached:
+                    idx = reattached.pop(key)
+            print(f"[{idx}] Simulation complete. Alpha ID: {alpha_id}")
+            logging.info(f"[{idx}] Simulation complete. Alpha ID: {alpha_id}")
+            if idx is not None:
+                record(idx, alpha, alpha_id)
+
+    def give_up(job, error):
+        for idx, alpha in job.members:
+            if journal is not None:
+                journal.mark_failed(alpha, error)
+                key = payload_hash(alpha)
+                if key in reattached:
+                    idx = reattached.pop(key)
+            if idx is not None and on_result is not None:
+                on_result(idx, alpha, None)
+
+    source = batch_alphas(uncached(unfinished(_indexed(alpha_list))), batch_size)
+    source_exhausted = False
+    source_idle_until = 0.0
+
+    def handle_failure(job, error):
+        nonlocal sess
+        metrics.inc("simulation_failures_total", kind=job.kind)
+        if job.is_batch:
+            # Fall back to single submissions; their own retry budget applies.
+            logging.warning(f"{error} -> resubmitting {len(job.members)} alphas one by one")
+            print(f"{error} -> resubmitting {len(job.members)} alphas one by one")
+            retry_queue.extendleft(reversed(job.split()))
+            return
+        job.failure_count += 1
+        job.progress_url = None
+        logging.error(f"Alpha error (attempt {job.failure_count}): {error}")
+        print(f"Error (attempt {job.failure_count}/{alpha_fail_attempt_tolerance}): {error}")
+        job.not_before = time.time() + retry_sleep
+        if job.failure_count < alpha_fail_attempt_tolerance:
+            retry_queue.append(job)
+            return
+        # ---- EXCEEDED TOLERANCE ----
+        if not job.has_relogged:
+            logging.warning("Retry limit reached. Re-authenticating...")
+            print("Retry limit reached. Re-authenticating...")
+            metrics.inc("relogins_total", stage="testing_alphas")
+            try:
+                sess = sign_in()
+                job.has_relogged = True
+                job.failure_count = 0
+                retry_queue.append(job)
+            except Exception as login_err:
+                logging.error(f"Re-login failed: {login_err}")
+                print(f"Re-login failed: {login_err}")
+                give_up(job, error)
+        else:
+            msg = f"Skipping alpha after re-login failure: {job.describe()}"
+            metrics.inc("simulations_skipped_total", source="failed")
+            logging.error(msg)
+            print(msg)
+            give_up(job, error)
+
+    def handle_poll_failure(job, error, now):
+        """
+        A poll failed, but the simulation may still be running server-side:
+        back off and poll the same progress URL again instead of posting the
+        payloads a second time. Returns True while the job stays in flight.
+        """
+        nonlocal sess
+        metrics.inc("simulation_poll_failures_total", kind=job.kind)
+        job.poll_failures += 1
+        logging.error(f"Poll error (attempt {job.poll_failures}) for {job.describe()}: {error}")
+        print(f"Poll error (attempt {job.poll_failures}/{alpha_fail_attempt_tolerance}): {error}")
+        job.next_poll = now + retry_sleep
+        if job.poll_failures < alpha_fail_attempt_tolerance:
+            return True
+        if not job.has_relogged:
+            logging.warning("Poll retry limit reached. Re-authenticating...")
+            print("Poll retry limit reached. Re-authenticating...")
+            metrics.inc("relogins_total", stage="testing_alphas")
+            try:
+                sess = sign_in()
+                job.has_relogged = True
+                job.poll_failures = 0
+                return True
+            except Exception as login_err:
+                logging.error(f"Re-login failed: {login_err}")
+                print(f"Re-login failed: {login_err}")
+        msg = f"Giving up on polling {job.describe()} at {job.progress_url}"
+        metrics.inc("simulations_skipped_total", source="failed")
+        logging.error(msg)
+        print(msg)
+        give_up(job, error)
+        return False
+
+    while True:
+        now = time.time()
+
+        # ---- REFILL FREE SLOTS ----
+        while len(in_flight) < max_in_flight:
+            if retry_queue and retry_queue[0].not_before <= now:
+                job = retry_queue.popleft()
+            elif not source_exhausted and source_idle_until <= now:
+                try:
+                    job = next(source)
+                except StopIteration:
+                    source_exhausted = True
+                    continue
+                if job is SOURCE_IDLE:
+                    source_idle_until = now + idle_poll
+                    break
+            else:
+                break
+            try:
+                if journal is not None:
+                    journal.mark_submitted(job.payloads())
+                if _submit(sess, job, now, retry_sleep):
+                    if journal is not None:
+                        journal.mark_in_flight(job.payloads(), job.progress_url)
+                    in_flight.append(job)
+                else:
+                    retry_queue.appendleft(job)
+                    break
+            except Exception as e:
+                handle_failure(job, e)
+
+        if not in_flight and not retry_queue and source_exhausted:
+            break
+
+        # ---- POLL OUTSTANDING SIMULATIONS ----
+        still_running = []
+        for job in in_flight:
+            if job.next_poll > now:
+                still_running.append(job)
+                continue
+            try:
+                done_resp = _poll(sess, job, now)
+                if done_resp is None:
+                    still_running.append(job)
+                    continue
+                if job.is_batch:
+                    alpha_ids = _child_alpha_ids(sess, job, done_resp)
+                else:
+                    alpha_ids = [done_resp.json().get("alpha")]
+            except BatchRejected as e:
+                # the batch itself failed server-side: resubmit its members one by one
+                handle_failure(job, e)
+                continue
+            except Exception as e:
+                if handle_poll_failure(job, e, now):
+                    still_running.append(job)
+                continue
+            complete(job, alpha_ids)
+        in_flight = still_running
+
+        # ---- SLEEP UNTIL THE NEXT THING IS DUE ----
+        wake_times = [job.next_poll for job in in_flight]
+        # queued work can only start once a slot frees up, which a poll will notice
+        if len(in_flight) < max_in_flight:
+            if retry_queue:
+                wake_times.append(retry_queue[0].not_before)
+            if not source_exhausted and source_idle_until > now:
+                wake_times.append(source_idle_until)
+        if not wake_times:
+            continue
+        delay = min(wake_times) - time.time()
+        if delay > 0:
+            time.sleep(delay)
+
+    return results
@@ -0,0 +1,274 @@
+"""Closed-loop streaming pipeline: fetch -> generate -> simulate -> evaluate.
+
+`alpha_variation_main` used to fetch every parent, generate the whole variant
+list and only then start simulating, and never looked at what came back.
+`StreamingPipeline` runs the stages concurrently, connected by bounded queues:
+
+    fetch     a thread pushes parent payloads into `parents` (bounded, so a
+              slow generator holds the fetcher back)
+    generate  a thread runs `iter_alpha_variants` over the parents as they
+              arrive and pushes variants into `variants` (bounded, so at most
+              a few batches are ever generated ahead of the simulator)
+    simulate  `run_in_flight` in the calling thread pulls from `variants`
+              without blocking (SOURCE_IDLE when it is empty) and reports
+              each alpha through `on_result`
+    evaluate  worker threads fetch the IS metrics of every new alpha; those
+              that pass the thresholds go back into the generator as parents,
+              `depth` generations deep at most
+
+Memory is bounded by the queue sizes and the in-flight simulations, not by
+the size of the variant space, and the first simulation starts as soon as
+the first parent has been fetched. The run ends once the fetcher is done and
+no queued, simulating or evaluating alpha can produce another parent.
+"""
+import json
+import logging
+import queue
+import threading
+
+from adaptive_search import fetch_alpha_metrics
+from fastexpr import canonical_expression
+from pipeline_metrics import metrics
+from simulation_scheduler import SOURCE_IDLE, run_in_flight
+from variable_list import _extract_alpha_code, iter_alpha_variants
+
+logger = logging.getLogger(__name__)
+
+_DONE = object()
+
+
+class StreamingPipeline:
+    """
+    sess, sign_in: as for `run_in_flight`.
+    fetch_parents: callable returning an iterable of parent payloads; it runs
+    in its own thread and may be lazy.
+    max_depth: generations of feedback; 0 only simulates the fetched parents'
+    variants, 1 also the variants of qualifying children, and so on.
+    min_sharpe / min_fitness: what a simulated variant needs to become a parent.
+    variant_kwargs: passed to `iter_alpha_variants` (max_per_parent,
+    max_total, sample, seed, ...); max_total caps the whole run.
+    record_path: optional JSONL file every generated variant is appended to.
+    harvester: optional result_store.ResultHarvester; the evaluate stage then
+    reads and fills its store instead of keeping only the IS metrics.
+    """
+
+    def __init__(self, sess, sign_in, fetch_parents, max_depth=2, min_sharpe=1.25, min_fitness=1.0,
+                 max_in_flight=3, batch_size=10, journal=None, cache=None, evaluators=4,
+                 parent_queue_size=16, variant_queue_size=None, record_path=None, harvester=None, **variant_kwargs):
+        self.sess = sess
+        self.sign_in = sign_in
+        self.fetch_parents = fetch_parents
+        self.max_depth = max_depth
+        self.min_sharpe = min_sharpe
+        self.min_fitness = min_fitness
+        self.max_in_flight = max_in_flight
+        self.batch_size = batch_size
+        self.journal = journal
+        self.cache = cache
+        self.evaluators = evaluators
+        self.record_path = record_path
+        self.harvester = harvester
+        self.variant_kwargs = variant_kwargs
+        # enough for every slot to be refilled with a full batch once
+        variant_queue_size = variant_queue_size or 2 * max_in_flight * max(1, batch_size)
+        self.parents = queue.Queue(parent_queue_size)   # (payload, depth) from the fetcher
+        self.children = queue.SimpleQueue()              # (payload, depth) fed back; taken first
+        self.variants = queue.Queue(variant_queue_size)  # (payload, depth) or _DONE
+        self.evaluations = queue.SimpleQueue()           # (payload, alpha_id, depth) or _DONE
+        self._lock = threading.Lock()
+        self._outstanding = 0          # variants generated whose evaluation has not finished
+        self._depths = {}              # list index in the simulator -> depth, while outstanding
+        self._depth = 1                # depth of the variants being generated
+        self._fetch_done = threading.Event()
+        self._stop = threading.Event()
+        self._seen_parents = set()
+        self.errors = []
+        self.qualified = []            # (payload, alpha_id, metrics, depth)
+
+    # ---- FETCH ----
+
+    def _fetch(self):
+        try:
+            for parent in self.fetch_parents():
+                if self._stop.is_set():
+                    break
+                self._put_parent(parent, 0, self.parents)
+        except Exception as e:
+            logger.exception("Fetching parents failed")
+            self.errors.append(e)
+        finally:
+            self._fetch_done.set()
+
+    def _put_parent(self, payload, depth, target):
+        code = _extract_alpha_code(payload)
+        if not code:
+            return False
+        key = canonical_expression(code)
+        with self._lock:
+            if key in self._seen_parents:
+                return False
+            self._seen_parents.add(key)
+        metrics.inc("pipeline_parents_total", source="fetch" if depth == 0 else "feedback")
+        if target is self.parents:
+            while not self._stop.is_set():
+                try:
+                    self.parents.put((payload, depth), timeout=0.5)
+                    break
+                except queue.Full:
+                    continue
+        else:
+            target.put((payload, depth))
+        return True
+
+    # ---- GENERATE ----
+
+    def _idle(self):
+        """True once nothing left can produce another parent (checked by the generator only)."""
+        if not self._fetch_done.is_set():
+            return False
+        with self._lock:
+            if self._outstanding:
+                return False
+        # an evaluator puts a child before it drops `_outstanding`, so check the queues after it
+        return self.children.empty() and self.parents.empty()
+
+    def _parent_stream(self):
+        """Parents in arrival order, feedback first; sets `_depth` for the variants that follow."""
+        while not self._stop.is_set():
+            try:
+                payload, depth = self.children.get_nowait()
+            except queue.Empty:
+                try:
+                    payload, depth = self.parents.get(timeout=0.2)
+                except queue.Empty:
+                    if self._idle():
+                        return
+                    continue
+            self._depth = depth + 1
+            yield payload
+
+    def _generate(self):
+        record = open(self.record_path, "w", encoding="utf-8") if self.record_path else None
+        try:
+            for count, variant in enumerate(iter_alpha_variants(self._parent_stream(), **self.variant_kwargs), 1):
+                with self._lock:
+                    self._outstanding += 1
+                metrics.inc("pipeline_variants_total")
+                if record is not None:
+                    record.write(json.dumps(variant, ensure_ascii=True) + "\n")
+                    record.flush()
+                if count % 1000 == 0:
+                    logger.info(f"Pipeline: {count} variants generated so far")
+                while not self._stop.is_set():
+                    try:
+                        self.variants.put((variant, self._depth), timeout=0.5)
+                        break
+                    except queue.Full:
+                        continue
+                if self._stop.is_set():
+                    break
+            # the variant budget may end generation early: discard the parents that are
+            # left (there is no budget for their variants) until the feedback loop is idle
+            for _ in self._parent_stream():
+                pass
+        except Exception as e:
+            logger.exception("Generating variants failed")
+            self.errors.append(e)
+        finally:
+            if record is not None:
+                record.close()
+            self.variants.put(_DONE)
+
+    # ---- SIMULATE ----
+
+    def _variant_source(self):
+        """What run_in_flight iterates: variants, SOURCE_IDLE while the queue is empty."""
+        idx = 0
+        while True:
+            try:
+                item = self.variants.get_nowait()
+            except queue.Empty:
+                yield SOURCE_IDLE
+                continue
+            if item is _DONE:
+                return
+            payload, depth = item
+            with self._lock:
+                self._depths[idx] = depth
+            idx += 1
+            yield payload
+
+    def _on_result(self, idx, alpha, alpha_id):
+        with self._lock:
+            depth = self._depths.pop(idx, None)
+        if depth is None:
+            return
+        self.evaluations.put((alpha, alpha_id, depth))
+
+    # ---- EVALUATE ----
+
+    def qualifies(self, alpha_metrics):
+        if not alpha_metrics:
+            return False
+        return ((alpha_metrics.get("sharpe") or 0) >= self.min_sharpe
+                and (alpha_metrics.get("fitness") or 0) >= self.min_fitness)
+
+    def _evaluate_one(self, payload, alpha_id, depth):
+        if not alpha_id:
+            return
+        cached = self.cache.get(payload) if self.cache is not None else None
+        alpha_metrics = cached["metrics"] if cached is not None and cached["metrics"] is not None else None
+        if alpha_metrics is None:
+            if self.harvester is not None:
+                stored = self.harvester.fetch(alpha_id, payload)
+                alpha_metrics = stored["is"] if stored is not None else None
+            else:
+                alpha_metrics = fetch_alpha_metrics(self.sess, alpha_id)
+            if self.cache is not None and alpha_metrics is not None:
+                self.cache.put(payload, alpha_id, alpha_metrics)
+        if not self.qualifies(alpha_metrics):
+            return
+        metrics.inc("pipeline_qualified_total", depth=depth)
+        self.qualified.append((payload, alpha_id, alpha_metrics, depth))
+        logger.info(f"Pipeline: alpha {alpha_id} qualifies at depth {depth} "
+                    f"(sharpe {alpha_metrics.get('sharpe')}, fitness {alpha_metrics.get('fitness')})")
+        if depth < self.max_depth:
+            self._put_parent(payload, depth, self.children)
+
+    def _evaluate(self):
+        while True:
+            item = self.evaluations.get()
+            if item is _DONE:
+                return
+            try:
+                self._evaluate_one(*item)
+            except Exception as e:
+                logger.warning(f"Evaluating alpha {item[1]} failed: {e}")
+            finally:
+                with self._lock:
+                    self._outstanding -= 1
+
+    # ---- RUN ----
+
+    def run(self):
+        """Run every stage to completion; returns `qualified`, best sharpe first."""
+        threads = [threading.Thread(target=self._fetch, name="pipeline-fetch", daemon=True),
+                   threading.Thread(target=self._generate, name="pipeline-generate", daemon=True)]
+        threads += [threading.Thread(target=self._evaluate, name=f"pipeline-evaluate-{i}", daemon=True)
+                    for i in range(max(1, self.evaluators))]
+        for thread in threads:
+            thread.start()
+        try:
+            with metrics.timer("stage_seconds", stage="streaming_pipeline"):
+                run_in_flight(
+                    self._variant_source(), self.sess, self.sign_in,
+                    max_in_flight=self.max_in_flight, batch_size=self.batch_size,
+                    journal=self.journal, cache=self.cache, on_result=self._on_result,
+                )
+        finally:
+            self._stop.set()
+            for _ in range(max(1, self.evaluators)):
+                self.evaluations.put(_DONE)
+            for thread in threads:
+                thread.join(timeout=5)
+        return sorted(self.qualified, key=lambda q: q[2].get("sharpe") or 0, reverse=True)
@@ -0,0 +1,174 @@
+"""Append-only, crash-safe log of submission results.
+
+Replaces the read-modify-write `submission_results.json`: every result is one
+INSERT into a SQLite table in WAL mode, so appending costs the same however
+long the history is and a crash can at worst lose the entry being written.
+Entries are indexed by alpha_id and timestamp. `import_legacy_json` copies an
+existing `submission_results.json` in once.
+"""
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_LOG_PATH = "submission_log.db"
+LEGACY_JSON_PATH = "submission_results.json"
+
+
+def _result_status(result):
+    if not isinstance(result, dict):
+        return None
+    if result.get("status") in _REJECTED_STATUSES | _PENDING_STATUSES:
+        return result["status"]
+    checks = (result.get("is") or {}).get("checks", [])
+    if any(check.get("result") == "FAIL" for check in checks):
+        return "FAIL"
+    return result.get("status") or "PASS"
+
+
+# What a logged status means for the alpha. monitor_submission logs
+# {"status": "failed"} for a refused submission and {"status": "timeout"}
+# when it stopped waiting; checks failing on the returned alpha give "FAIL".
+PASSED = "passed"
+REJECTED = "rejected"
+PENDING = "pending"
+_REJECTED_STATUSES = frozenset({"failed", "FAIL"})
+_PENDING_STATUSES = frozenset({"timeout"})
+
+
+def submission_outcome(status):
+    """PASSED, REJECTED or PENDING (outcome unknown) for a status from latest_statuses()."""
+    if status is None or status in _REJECTED_STATUSES:
+        return REJECTED
+    if status in _PENDING_STATUSES:
+        return PENDING
+    return PASSED
+
+
+def result_outcome(result):
+    """submission_outcome() of a submission result as passed to SubmissionLog.append."""
+    return submission_outcome(_result_status(result))
+
+
+class SubmissionLog:
+    """SQLite-backed submission log; safe to share between threads of one process."""
+
+    def __init__(self, path=DEFAULT_LOG_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS submissions (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                alpha_id TEXT NOT NULL,
+                timestamp INTEGER NOT NULL,
+                status TEXT,
+                result TEXT
+            )
+            """
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_submissions_alpha ON submissions(alpha_id, timestamp)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_submissions_time ON submissions(timestamp)")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS imports (source TEXT PRIMARY KEY, imported_at REAL, entries INTEGER)")
+        self._conn.commit()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def append(self, alpha_id, result, timestamp=None):
+        timestamp = int(time.time()) if timestamp is None else int(timestamp)
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT INTO submissions (alpha_id, timestamp, status, result) VALUES (?, ?, ?, ?)",
+                (alpha_id, timestamp, _result_status(result), json.dumps(result, ensure_ascii=False)),
+            )
+
+    def _entries(self, where="", params=()):
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT alpha_id, timestamp, result FROM submissions {where} ORDER BY timestamp, id", params
+            ).fetchall()
+        return [
+            {"alpha_id": alpha_id, "timestamp": timestamp, "result": json.loads(result) if result else None}
+            for alpha_id, timestamp, result in rows
+        ]
+
+    def history(self, alpha_id):
+        """All entries for one alpha, oldest first."""
+        return self._entries("WHERE alpha_id = ?", (alpha_id,))
+
+    def latest(self, alpha_id):
+        entries = self.history(alpha_id)
+        return entries[-1] if entries else None
+
+    def between(self, start_ts=None, end_ts=None):
+        """Entries with start_ts <= timestamp < end_ts (either bound optional)."""
+        return self._entries(
+            "WHERE timestamp >= ? AND timestamp < ?",
+            (start_ts if start_ts is not None else 0, end_ts if end_ts is not None else 2 ** 62),
+        )
+
+    def submitted_alpha_ids(self, status=None):
+        """Distinct alpha IDs with at least one logged submission (optionally with a given status)."""
+        query = "SELECT DISTINCT alpha_id FROM submissions"
+        params = ()
+        if status is not None:
+            query += " WHERE status = ?"
+            params = (status,)
+        with self._lock:
+            return {row[0] for row in self._conn.execute(query, params)}
+
+    def latest_statuses(self):
+        """{alpha_id: (status, timestamp)} of the newest entry per alpha, in one query."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT alpha_id, status, timestamp FROM submissions WHERE id IN "
+                "(SELECT MAX(id) FROM submissions GROUP BY alpha_id)"
+            ).fetchall()
+        return {alpha_id: (status, timestamp) for alpha_id, status, timestamp in rows}
+
+    def __len__(self):
+        with self._lock:
+            (count,) = self._conn.execute("SELECT COUNT(*) FROM submissions").fetchone()
+        return count
+
+    def import_legacy_json(self, path=LEGACY_JSON_PATH):
+        """
+        One-time import of the old JSON list log. Returns the number of imported
+        entries (0 if the file is missing or was imported before). A corrupt
+        file is left untouched and reported instead of being reset.
+        """
+        if not os.path.exists(path):
+            return 0
+        source = os.path.abspath(path)
+        with self._lock:
+            if self._conn.execute("SELECT 1 FROM imports WHERE source = ?", (source,)).fetchone():
+                return 0
+        try:
+            with open(path, "r") as f:
+                entries = json.load(f)
+        except json.JSONDecodeError as e:
+            logger.error(f"无法解析 {path}，未导入（文件保持不变）: {e}")
+            return 0
+        with self._lock, self._conn:
+            for entry in entries:
+                result = entry.get("result")
+                self._conn.execute(
+                    "INSERT INTO submissions (alpha_id, timestamp, status, result) VALUES (?, ?, ?, ?)",
+                    (entry.get("alpha_id"), int(entry.get("timestamp", 0)), _result_status(result),
+                     json.dumps(result, ensure_ascii=False)),
+                )
+            self._conn.execute(
+                "INSERT INTO imports (source, imported_at, entries) VALUES (?, ?, ?)",
+                (source, time.time(), len(entries)),
+            )
+        logger.info(f"已从 {path} 导入 {len(entries)} 条提交记录")
+        return len(entries)
@@ -0,0 +1,94 @@
+from alpha_mirror import ALPHA_URL, AlphaMirror
+
+
+class Response:
+    def __init__(self, body, status_code=200):
+        self.status_code = status_code
+        self.headers = {}
+        self._body = body
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise RuntimeError(f"status {self.status_code}")
+
+    def json(self):
+        return self._body
+
+
+class FakeBrain:
+    """/users/self/alphas (newest first, filtered by status) and /alphas/{id}."""
+
+    def __init__(self, alphas):
+        self.alphas = {alpha["id"]: alpha for alpha in alphas}
+        self.list_calls = 0
+
+    def get(self, url, params=None):
+        if params is None:
+            alpha = self.alphas.get(url.rsplit("/", 1)[1])
+            return Response(alpha, 200 if alpha else 404)
+        self.list_calls += 1
+        listed = [alpha for alpha in self.alphas.values() if alpha["status"] == params["status"]]
+        listed.reverse()  # insertion order is creation order
+        return Response({"results": listed[params["offset"]:params["offset"] + params["limit"]]})
+
+
+def alpha(alpha_id, created, status="UNSUBMITTED"):
+    return {"id": alpha_id, "dateCreated": created, "status": status, "regular": {"code": "rank(close)"},
+            "settings": {"region": "USA"}, "is": {"sharpe": 1.0}}
+
+
+def ids(mirror, status="UNSUBMITTED"):
+    return sorted(a["id"] for a in mirror.select(status=status))
+
+
+def test_watermark_compares_instants_across_dst(tmp_path):
+    mirror = AlphaMirror(str(tmp_path / "mirror.db"))
+    brain = FakeBrain([alpha("A", "2025-11-02T01:50:00-04:00")])
+    mirror.sync(brain, page_size=10)
+    # after the fall-back 01:10 EST is later than 01:50 EDT, though it sorts lower as a string
+    brain.alphas["B"] = alpha("B", "2025-11-02T01:10:00-05:00")
+    brain.alphas["C"] = alpha("C", "2025-11-02T01:20:00-05:00")
+    assert mirror.sync(brain, page_size=10) == 3
+    assert ids(mirror) == ["A", "B", "C"]
+    assert mirror.watermark("UNSUBMITTED") == "2025-11-02T06:20:00+00:00"
+
+
+def test_watermark_waits_until_the_gap_is_walked(tmp_path):
+    mirror = AlphaMirror(str(tmp_path / "mirror.db"))
+    brain = FakeBrain([alpha("old", "2026-01-01T00:00:00-05:00")])
+    mirror.sync(brain, page_size=2)
+    for day in range(2, 8):
+        brain.alphas[f"d{day}"] = alpha(f"d{day}", f"2026-01-0{day}T00:00:00-05:00")
+    mirror.sync(brain, page_size=2, max_items=4)
+    assert mirror.watermark("UNSUBMITTED") == "2026-01-01T05:00:00+00:00"
+    assert "d2" not in ids(mirror)
+    mirror.sync(brain, page_size=2, max_items=10)
+    assert ids(mirror) == ["d2", "d3", "d4", "d5", "d6", "d7", "old"]
+    assert mirror.watermark("UNSUBMITTED") == "2026-01-07T05:00:00+00:00"
+
+
+def test_incremental_sync_stops_at_the_watermark(tmp_path):
+    mirror = AlphaMirror(str(tmp_path / "mirror.db"))
+    brain = FakeBrain([alpha(f"a{i}", f"2026-01-01T00:{i:02d}:00-05:00") for i in range(10)])
+    mirror.sync(brain, page_size=3)
+    brain.list_calls = 0
+    brain.alphas["new"] = alpha("new", "2026-01-02T00:00:00-05:00")
+    assert mirror.sync(brain, page_size=3) == 2  # the new alpha and the one at the watermark
+    assert brain.list_calls == 1
+
+
+def test_reconcile_refreshes_alphas_submitted_elsewhere(tmp_path):
+    mirror = AlphaMirror(str(tmp_path / "mirror.db"))
+    brain = FakeBrain([alpha(f"a{i}", f"2026-01-01T00:{i:02d}:00-05:00") for i in range(5)])
+    mirror.sync(brain, page_size=2)
+    brain.alphas["a1"]["status"] = "ACTIVE"     # submitted from the web UI
+    del brain.alphas["a3"]                      # deleted on the platform
+    mirror.sync(brain, page_size=2)
+    assert "a1" in ids(mirror)                  # a plain incremental sync cannot see it
+    mirror.sync(brain, page_size=2, reconcile=True)
+    assert ids(mirror) == ["a0", "a2", "a4"]
+    assert ids(mirror, "ACTIVE") == ["a1"]
+
+
+def test_alpha_url_is_per_alpha():
+    assert ALPHA_URL.format(alpha_id="X1").endswith("/alphas/X1")
@@ -0,0 +1,62 @@
+import math
+import random
+
+import pytest
+
+from alpha_selection import alphas_to_frame, pareto_mask, select_alphas
+
+
+def brute_force_front(rows):
+    """Indices of rows no other row dominates; NaN is the worst value."""
+    def score(row):
+        sharpe, fitness, turnover, drawdown = row
+        worst = lambda value, sign: -math.inf if value is None or math.isnan(value) else sign * value
+        return (worst(sharpe, 1), worst(fitness, 1), worst(turnover, -1), worst(drawdown, -1))
+
+    scores = [score(row) for row in rows]
+    front = []
+    for i, a in enumerate(scores):
+        dominated = any(
+            all(y >= x for x, y in zip(a, b)) and any(y > x for x, y in zip(a, b))
+            for j, b in enumerate(scores) if j != i
+        )
+        if not dominated:
+            front.append(i)
+    return front
+
+
+def alpha(i, sharpe, fitness, turnover, drawdown):
+    metrics = {"sharpe": sharpe, "fitness": fitness, "turnover": turnover, "drawdown": drawdown}
+    return {"id": f"A{i}", "regular": {"code": f"rank(x{i})"},
+            "is": {name: value for name, value in metrics.items() if value is not None}}
+
+
+@pytest.mark.parametrize("seed", range(25))
+def test_pareto_mask_matches_brute_force(seed):
+    rng = random.Random(seed)
+    rows = []
+    for _ in range(rng.randrange(1, 60)):
+        # a coarse grid gives plenty of ties and exact duplicates; some metrics missing
+        row = [rng.choice([None, *range(5)]) if rng.random() < 0.1 else rng.randrange(5) for _ in range(4)]
+        rows.append(tuple(float("nan") if value is None else float(value) for value in row))
+    frame = alphas_to_frame([alpha(i, *row) for i, row in enumerate(rows)])
+    mask = pareto_mask(frame)
+    assert [i for i, kept in enumerate(mask) if kept] == brute_force_front(rows)
+
+
+def test_pareto_mask_keeps_identical_rows():
+    frame = alphas_to_frame([alpha(0, 1.5, 1.0, 0.3, 0.1), alpha(1, 1.5, 1.0, 0.3, 0.1), alpha(2, 1.0, 1.0, 0.3, 0.1)])
+    assert list(pareto_mask(frame)) == [True, True, False]
+
+
+def test_select_alphas_thresholds_rank_and_top_k():
+    alphas = [alpha(0, 1.2, 0.9, 0.3, 0.1), alpha(1, 2.0, 0.4, 0.3, 0.1), alpha(2, 1.6, 1.1, 0.2, 0.1),
+              alpha(3, None, 1.5, 0.2, 0.1)]
+    selected = select_alphas(alphas, min_sharpe=1.0, min_fitness=0.5, rank_by="sharpe")
+    assert [a["id"] for a in selected] == ["A2", "A0"]
+    assert [a["id"] for a in select_alphas(alphas, rank_by="-sharpe", top_k=2)] == ["A0", "A2"]
+
+
+def test_select_alphas_pareto_before_top_k():
+    alphas = [alpha(0, 1.0, 1.0, 0.5, 0.2), alpha(1, 2.0, 0.5, 0.5, 0.2), alpha(2, 0.9, 0.9, 0.6, 0.3)]
+    assert [a["id"] for a in select_alphas(alphas, pareto=True, rank_by="sharpe")] == ["A1", "A0"]
@@ -0,0 +1,93 @@
+import pytest
+
+from fastexpr import CanonicalTemplate, FastExprSyntaxError, canonical_expression, parse, to_canonical
+
+
+@pytest.mark.parametrize("left, right", [
+    ("a + b", "b + a"),
+    ("a + (b + c)", "(c + b) + a"),
+    ("a * (b * c)", "c * b * a"),
+    ("a && (b && c)", "(c && b) && a"),
+    ("a || b", "b || a"),
+    ("a == b", "b == a"),
+    ("a != b", "b != a"),
+    ("add(x, y)", "add(y, x)"),
+    ("max(x, y, z)", "max(z, y, x)"),
+    ("rank(close,  20)", "rank( close , 20.0 )"),
+    ("ts_mean(x, d=5, k=2)", "ts_mean(x, k=2, d=5)"),
+])
+def test_equivalent_spellings_share_a_key(left, right):
+    assert canonical_expression(left) == canonical_expression(right)
+
+
+@pytest.mark.parametrize("left, right", [
+    ("(a == b) == c", "a == (b == c)"),
+    ("(a != b) != c", "a != (b != c)"),
+    ("(a == b) != c", "a == (b != c)"),
+    ("a - b", "b - a"),
+    ("a - (b - c)", "(a - b) - c"),
+    ("a / b", "b / a"),
+    ("(a / b) / c", "a / (b / c)"),
+    ("a ^ (b ^ c)", "(a ^ b) ^ c"),
+    ("a < b", "b < a"),
+    ("subtract(x, y)", "subtract(y, x)"),
+    ("ts_corr(x, y, 5)", "ts_corr(y, x, 5)"),
+])
+def test_different_expressions_keep_different_keys(left, right):
+    assert canonical_expression(left) != canonical_expression(right)
+
+
+def test_comparison_chains_keep_their_grouping():
+    assert canonical_expression("(a==b)==c") == "(a == b) == c"
+    assert canonical_expression("a==(b==c)") == "(b == c) == a"
+
+
+def test_precedence_and_parentheses():
+    assert canonical_expression("(a * b) + c") == "a * b + c"
+    assert canonical_expression("(a + b) * c") == "(a + b) * c"
+    assert canonical_expression("a - (b + c)") == "a - (b + c)"
+    assert canonical_expression("-(a + b)") == "-(a + b)"
+    assert canonical_expression("a ? b : c ? d : e") == "a ? b : c ? d : e"
+
+
+def test_numbers_are_normalised():
+    assert canonical_expression("rank(x, 5.0)") == "rank(x, 5)"
+    assert canonical_expression("rank(x, 0.50)") == "rank(x, 0.5)"
+    assert canonical_expression("rank(close*1e400)") == "rank(close * inf)"
+
+
+@pytest.mark.parametrize("code", [
+    "group_rank(ts_rank(close, 20), industry)",
+    "(a == b) == c",
+    "a != (b != c)",
+    "a - (b - c) / d ^ e ^ f",
+    "x = ts_mean(close, 5); y = -x; if_else(x > y && y < 0, x, y)",
+    "a ? (b ? c : d) : e",
+    "ts_decay_linear(rank(vwap) - rank(close), 10, dense=false)",
+])
+def test_canonical_form_round_trips_through_parse(code):
+    canonical = canonical_expression(code)
+    assert to_canonical(parse(canonical)) == canonical
+
+
+def test_unparseable_input_falls_back_to_whitespace_insensitive_form():
+    with pytest.raises(FastExprSyntaxError):
+        parse("rank(close")
+    assert canonical_expression("rank( close") == canonical_expression("rank(close")
+
+
+@pytest.mark.parametrize("template, slots, values", [
+    ("ts_mean(close, N1)", {"N1": ["5", "20"]}, ["1000000000000000"]),
+    ("ts_mean(close, N1)", {"N1": ["5", "20"]}, ["123456789012345678"]),
+    ("ts_mean(close, N1)", {"N1": ["5", "20"]}, ["5.0"]),
+    ("ts_mean(close, N1)", {"N1": ["5", "20"]}, ["007"]),
+    ("OP(x, 5) + y", {"OP": ["ts_mean", "ts_rank"]}, ["ts_rank"]),
+    ("OP(x, N1) == y", {"OP": ["ts_mean"], "N1": ["5"]}, ["ts_mean", "1e3"]),
+])
+def test_template_render_matches_canonical_expression(template, slots, values):
+    compiled = CanonicalTemplate.build(template, slots)
+    assert compiled is not None
+    filled = template
+    for slot, value in zip(slots, values):
+        filled = filled.replace(slot, value)
+    assert compiled.render(values) == canonical_expression(filled)
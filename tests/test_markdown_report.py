@@ -0,0 +1,60 @@
+import pytest
+
+import submission_log
+from markdown_report import PENDING, READY, REJECTED, SUBMITTED, MarkdownReport
+from result_store import ResultStore
+from submission_log import SubmissionLog, result_outcome, submission_outcome
+
+
+@pytest.mark.parametrize("result, outcome", [
+    ({"status": "failed", "error": "refused"}, submission_log.REJECTED),
+    ({"status": "timeout", "error": "gave up"}, submission_log.PENDING),
+    ({"is": {"checks": [{"name": "LOW_SHARPE", "result": "FAIL"}]}}, submission_log.REJECTED),
+    ({"status": "UNSUBMITTED", "is": {"checks": [{"result": "FAIL"}]}}, submission_log.REJECTED),
+    ({"is": {"checks": [{"result": "PASS"}]}}, submission_log.PASSED),
+    ({"status": "ACTIVE"}, submission_log.PASSED),
+    (None, submission_log.REJECTED),
+])
+def test_result_outcome(result, outcome):
+    assert result_outcome(result) == outcome
+
+
+def _alpha(alpha_id, checks="PASS"):
+    return {
+        "id": alpha_id, "regular": {"code": "rank(close)"}, "dateCreated": "2026-01-01T00:00:00-05:00",
+        "settings": {"region": "USA", "universe": "TOP3000", "delay": 1},
+        "is": {"sharpe": 1.5, "fitness": 1.1, "checks": [{"name": "LOW_SHARPE", "result": checks}]},
+    }
+
+
+def test_report_status_follows_the_latest_log_entry(tmp_path):
+    store = ResultStore(str(tmp_path / "results.db"))
+    for alpha_id in ("ok", "refused", "timed_out", "retried", "fresh"):
+        store.put(_alpha(alpha_id))
+    store.put(_alpha("failing", checks="FAIL"))
+    log = SubmissionLog(str(tmp_path / "log.db"))
+    log.append("ok", {"status": "ACTIVE"}, timestamp=1)
+    log.append("refused", {"status": "failed", "error": "refused"}, timestamp=1)
+    log.append("timed_out", {"status": "timeout"}, timestamp=1)
+    log.append("retried", {"status": "timeout"}, timestamp=1)
+    log.append("retried", {"status": "ACTIVE"}, timestamp=2)
+
+    report = MarkdownReport(store, log=log, out_dir=str(tmp_path / "reports"), field_datasets={})
+    statuses = {row[0]: row[1] for rows in report.sections().values() for row in rows}
+    assert statuses == {
+        "ok": SUBMITTED, "refused": REJECTED, "timed_out": PENDING, "retried": SUBMITTED, "fresh": READY,
+    }
+    assert {alpha_id: submission_outcome(status) for alpha_id, (status, _) in log.latest_statuses().items()} == {
+        "ok": submission_log.PASSED, "refused": submission_log.REJECTED,
+        "timed_out": submission_log.PENDING, "retried": submission_log.PASSED,
+    }
+
+
+def test_rebuild_only_rewrites_changed_sections(tmp_path):
+    store = ResultStore(str(tmp_path / "results.db"))
+    store.put(_alpha("a"))
+    report = MarkdownReport(store, out_dir=str(tmp_path / "reports"), field_datasets={})
+    assert report.build()["written"] == 3
+    assert report.build()["written"] == 0
+    store.put(_alpha("b"))
+    assert report.build()["written"] == 3
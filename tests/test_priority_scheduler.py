@@ -0,0 +1,54 @@
+from priority_scheduler import DailyQuota, PriorityScheduler
+
+
+def payload(code):
+    return {"type": "REGULAR", "settings": {"region": "USA"}, "regular": code}
+
+
+def variants(count, pulled):
+    for window in range(2, 2 + count):
+        pulled.append(window)
+        yield payload(f"ts_mean(close, {window})"), {"sharpe": 1.0, "fitness": 1.0}
+
+
+def test_feed_keeps_at_most_lookahead_payloads_pending():
+    pulled = []
+    scheduler = PriorityScheduler()
+    scheduler.feed(variants(50, pulled), lookahead=5)
+    issued = iter(scheduler)
+    next(issued)
+    assert len(pulled) == 5
+    assert len(scheduler) == 4
+    rest = list(issued)
+    assert len(rest) == 49
+    assert len(pulled) == 50
+    assert scheduler.exhausted
+
+
+def test_quota_stops_issuing_and_persists(tmp_path):
+    path = str(tmp_path / "quota.db")
+    scheduler = PriorityScheduler(DailyQuota(3, path=path))
+    scheduler.feed(variants(10, []), lookahead=4)
+    assert len(list(scheduler)) == 3
+    assert not scheduler.exhausted
+
+    again = PriorityScheduler(DailyQuota(3, path=path))
+    again.feed(variants(10, []), lookahead=4)
+    assert list(again) == []
+    assert DailyQuota(5, path=path).remaining() == 2
+
+
+def test_strong_parents_go_first():
+    scheduler = PriorityScheduler(novelty_weight=0.0)
+    scheduler.push(payload("rank(a)"), {"sharpe": 0.1, "fitness": 0.1})
+    scheduler.push(payload("rank(b)"), {"sharpe": 2.0, "fitness": 1.5})
+    scheduler.push(payload("rank(c)"), {"sharpe": 1.0, "fitness": 0.5})
+    assert [p["regular"] for p in scheduler] == ["rank(b)", "rank(c)", "rank(a)"]
+
+
+def test_tested_neighbours_lower_novelty():
+    scheduler = PriorityScheduler()
+    scheduler.observe("ts_mean(close, 20)", {"sharpe": 1.0, "fitness": 1.0})
+    near = scheduler.expected_value(payload("ts_mean(close, 20)"))
+    far = scheduler.expected_value(payload("ts_rank(close, 60)"))
+    assert far > near
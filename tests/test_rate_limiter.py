@@ -0,0 +1,102 @@
+import pytest
+
+from rate_limiter import DEFAULT_BUDGETS, MIN_RATE, SharedRateLimiter, endpoint_of, parse_budgets
+
+
+class Clock:
+    """time.time/time.sleep pair where sleeping just moves the clock."""
+
+    def __init__(self, now=1000.0):
+        self.now = now
+        self.slept = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.slept.append(seconds)
+        self.now += seconds
+
+
+def limiter(tmp_path, clock, **budgets):
+    return SharedRateLimiter(str(tmp_path / "limits.db"), budgets or {"poll": (2.0, 3)}, recovery=10.0,
+                             clock=clock, sleep=clock.sleep)
+
+
+def test_burst_then_refill_at_the_budget_rate(tmp_path):
+    clock = Clock()
+    bucket = limiter(tmp_path, clock)
+    assert [bucket.acquire("poll") for _ in range(3)] == [0.0, 0.0, 0.0]
+    assert bucket.acquire("poll") == pytest.approx(0.5)
+    clock.now += 1.0  # two more tokens
+    assert bucket.acquire("poll") == 0.0
+    assert bucket.acquire("poll") == 0.0
+    assert bucket.acquire("poll") == pytest.approx(0.5)
+
+
+def test_refill_is_capped_at_burst(tmp_path):
+    clock = Clock()
+    bucket = limiter(tmp_path, clock)
+    bucket.acquire("poll")
+    clock.now += 3600
+    assert [bucket.acquire("poll") for _ in range(3)] == [0.0, 0.0, 0.0]
+    assert bucket.acquire("poll") > 0
+
+
+def test_penalize_blocks_halves_and_recovers(tmp_path):
+    clock = Clock()
+    bucket = limiter(tmp_path, clock)
+    bucket.penalize("poll", retry_after=4)
+    tokens, rate, blocked_until = bucket.state()[":poll"]
+    assert (tokens, rate, blocked_until) == (0.0, 1.0, clock.now + 4)
+    assert bucket.acquire("poll") == pytest.approx(4.0)
+    # rate climbs back to the budget over `recovery` seconds
+    clock.now += 10.0
+    bucket.acquire("poll")
+    assert bucket.state()[":poll"][1] == 2.0
+
+
+def test_penalize_keeps_a_positive_rate(tmp_path):
+    clock = Clock()
+    bucket = SharedRateLimiter(str(tmp_path / "limits.db"), {"poll": (2.0, 3)}, recovery=1e9, min_rate_share=0.0,
+                               clock=clock, sleep=clock.sleep)
+    for _ in range(20):
+        bucket.penalize("poll", retry_after=1)
+    assert bucket.state()[":poll"][1] == MIN_RATE
+    assert bucket.acquire("poll") > 0  # finite wait rather than ZeroDivisionError
+
+
+def test_accounts_and_endpoints_have_separate_buckets(tmp_path):
+    clock = Clock()
+    bucket = limiter(tmp_path, clock, poll=(1.0, 1), simulate=(1.0, 1))
+    assert bucket.acquire("poll", account="a") == 0.0
+    assert bucket.acquire("poll", account="b") == 0.0
+    assert bucket.acquire("simulate", account="a") == 0.0
+    assert bucket.acquire("poll", account="a") == pytest.approx(1.0)
+
+
+def test_parse_budgets():
+    budgets = parse_budgets("simulate=0.5/5, alphas=8")
+    assert budgets["simulate"] == (0.5, 5)
+    assert budgets["alphas"] == (8.0, 8)
+    assert budgets["poll"] == DEFAULT_BUDGETS["poll"]
+    assert parse_budgets("poll=0.2")["poll"] == (0.2, 1)
+
+
+@pytest.mark.parametrize("text", ["simulate=0", "simulate=-1/5", "poll=1/0"])
+def test_parse_budgets_rejects_non_positive_budgets(text):
+    with pytest.raises(ValueError):
+        parse_budgets(text)
+
+
+def test_limiter_rejects_zero_rate_budget(tmp_path):
+    with pytest.raises(ValueError):
+        SharedRateLimiter(str(tmp_path / "limits.db"), {"poll": (0, 1)})
+
+
+def test_endpoint_of():
+    assert endpoint_of("POST", "https://api.worldquantbrain.com/simulations") == "simulate"
+    assert endpoint_of("GET", "https://api.worldquantbrain.com/simulations/abc") == "poll"
+    assert endpoint_of("POST", "https://api.worldquantbrain.com/alphas/X/submit") == "submit"
+    assert endpoint_of("GET", "https://api.worldquantbrain.com/users/self/alphas") == "alphas"
+    assert endpoint_of("GET", "https://api.worldquantbrain.com/data-fields") == "data"
@@ -0,0 +1,88 @@
+import result_cache
+from result_cache import ResultCache, cache_key, legacy_cache_key
+
+DAY = 86400
+
+
+class Clock:
+    def __init__(self, now=1_700_000_000.0):
+        self.now = now
+
+    def time(self):
+        return self.now
+
+
+def payload(code, decay=1):
+    return {"type": "REGULAR", "settings": {"region": "USA", "universe": "TOP3000", "decay": decay}, "regular": code}
+
+
+def open_cache(tmp_path, monkeypatch, **kwargs):
+    clock = Clock()
+    monkeypatch.setattr(result_cache, "time", clock)
+    return ResultCache(str(tmp_path / "cache.db"), **kwargs), clock
+
+
+def test_spelling_and_settings_decide_the_key(tmp_path, monkeypatch):
+    cache, _ = open_cache(tmp_path, monkeypatch)
+    cache.put(payload("rank(close) + rank(volume)"), "A1", {"sharpe": 1.5})
+    assert cache.get(payload("rank(volume)+rank(close)")) == {"alpha_id": "A1", "metrics": {"sharpe": 1.5}}
+    assert payload("rank(close) + rank(volume)", decay=4) not in cache
+
+
+def test_put_without_metrics_keeps_known_metrics(tmp_path, monkeypatch):
+    cache, _ = open_cache(tmp_path, monkeypatch)
+    cache.put(payload("rank(close)"), "A1", {"sharpe": 1.5})
+    cache.put(payload("rank(close)"), None)
+    assert cache.get(payload("rank(close)")) == {"alpha_id": "A1", "metrics": {"sharpe": 1.5}}
+
+
+def test_evict_drops_entries_past_max_age(tmp_path, monkeypatch):
+    cache, clock = open_cache(tmp_path, monkeypatch, max_age_days=30)
+    cache.put(payload("rank(close)"), "OLD")
+    clock.now += 20 * DAY
+    cache.put(payload("rank(open)"), "NEW")
+    cache.get(payload("rank(close)"))  # use does not extend the age limit
+    clock.now += 15 * DAY
+    cache.evict()
+    assert payload("rank(close)") not in cache
+    assert cache.get(payload("rank(open)"))["alpha_id"] == "NEW"
+
+
+def test_evict_drops_least_recently_used_above_max_entries(tmp_path, monkeypatch):
+    cache, clock = open_cache(tmp_path, monkeypatch, max_entries=3, evict_every=10_000)
+    for i in range(5):
+        clock.now += 1
+        cache.put(payload(f"ts_rank(close, {i + 1})"), f"A{i}")
+    clock.now += 1
+    cache.get(payload("ts_rank(close, 1)"))  # oldest put, but just used
+    cache.evict()
+    assert len(cache) == 3
+    assert [payload(f"ts_rank(close, {i + 1})") in cache for i in range(5)] == [True, False, False, True, True]
+
+
+def test_put_evicts_every_evict_every_puts(tmp_path, monkeypatch):
+    cache, clock = open_cache(tmp_path, monkeypatch, max_entries=2, evict_every=4)
+    for i in range(3):
+        clock.now += 1
+        cache.put(payload(f"ts_rank(close, {i + 1})"), f"A{i}")
+    assert len(cache) == 3
+    clock.now += 1
+    cache.put(payload("ts_rank(close, 4)"), "A3")
+    assert len(cache) == 2
+
+
+def test_legacy_rows_are_rekeyed_on_first_use(tmp_path, monkeypatch):
+    cache, _ = open_cache(tmp_path, monkeypatch)
+    old = payload("rank(volume) + rank(close)")
+    assert legacy_cache_key(old) != cache_key(old)
+    with cache._conn:
+        cache._conn.execute(
+            "INSERT INTO results VALUES (?, ?, ?, ?, ?, ?)",
+            (legacy_cache_key(old), "rank(volume)+rank(close)", "LEGACY", None, 0.0, 0.0),
+        )
+    cache.evict = lambda: None  # the row's timestamps are ancient; only the key matters here
+    assert cache.get(payload("rank(close)+rank(volume)")) is None  # a different spelling cannot reach the old key
+    assert cache.get(old)["alpha_id"] == "LEGACY"
+    (key,) = cache._conn.execute("SELECT cache_key FROM results").fetchone()
+    assert key == cache_key(old)
+    assert cache.get(payload("rank(close)+rank(volume)"))["alpha_id"] == "LEGACY"
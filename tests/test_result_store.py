@@ -0,0 +1,78 @@
+import pytest
+
+import result_store
+from result_store import ResultStore, fetch_alpha
+
+
+class Response:
+    def __init__(self, status_code, headers=None, body=None):
+        self.status_code = status_code
+        self.headers = headers or {}
+        self._body = body
+
+    def json(self):
+        return self._body
+
+
+class Scripted:
+    """Answers GETs from a list of responses; the last one repeats."""
+
+    def __init__(self, *responses):
+        self.responses = list(responses)
+        self.calls = 0
+
+    def get(self, url):
+        self.calls += 1
+        return self.responses.pop(0) if len(self.responses) > 1 else self.responses[0]
+
+
+@pytest.fixture(autouse=True)
+def no_sleep(monkeypatch):
+    slept = []
+    monkeypatch.setattr(result_store.time, "sleep", slept.append)
+    return slept
+
+
+def test_ok_response_with_retry_after_is_used():
+    sess = Scripted(Response(200, {"Retry-After": "2"}, {"id": "A1"}))
+    assert fetch_alpha(sess, "A1") == {"id": "A1"}
+    assert sess.calls == 1
+
+
+def test_throttling_is_waited_out(no_sleep):
+    sess = Scripted(Response(429, {"Retry-After": "3"}), Response(503, {}), Response(200, {}, {"id": "A1"}))
+    assert fetch_alpha(sess, "A1", base_delay=0.5) == {"id": "A1"}
+    assert no_sleep == [3.0, 0.5]
+
+
+def test_endless_throttling_gives_up():
+    sess = Scripted(Response(429, {"Retry-After": "1"}))
+    assert fetch_alpha(sess, "A1", max_throttled=4) is None
+    assert sess.calls == 5
+
+
+def test_client_errors_are_not_retried():
+    sess = Scripted(Response(404))
+    assert fetch_alpha(sess, "A1") is None
+    assert sess.calls == 1
+
+
+def test_server_errors_are_retried_up_to_max_retries():
+    sess = Scripted(Response(500))
+    assert fetch_alpha(sess, "A1", max_retries=3) is None
+    assert sess.calls == 3
+
+
+def test_store_round_trip(tmp_path):
+    store = ResultStore(str(tmp_path / "results.db"))
+    payload = {"type": "REGULAR", "settings": {"region": "USA"}, "regular": "rank(close)"}
+    store.put({
+        "id": "A1", "regular": {"code": "rank(close)"}, "settings": {"region": "USA", "universe": "TOP3000"},
+        "is": {"sharpe": 1.3, "checks": [{"name": "LOW_SHARPE", "result": "PASS"},
+                                        {"name": "SELF_CORRELATION", "result": "PENDING"}]},
+    }, payload)
+    stored = store.get("A1")
+    assert stored["is"]["sharpe"] == 1.3
+    assert [check["result"] for check in stored["is"]["checks"]] == ["PASS", "PENDING"]
+    assert store.for_payload(payload)["id"] == "A1"
+    assert store.rows("alpha_id", "pending_checks") == [("A1", 1)]
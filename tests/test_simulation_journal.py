@@ -0,0 +1,135 @@
+import hashlib
+import itertools
+import json
+import time
+
+from simulation_journal import COMPLETED, FAILED, IN_FLIGHT, SUBMITTED, SimulationJournal, payload_hash
+from simulation_scheduler import run_in_flight
+
+
+def payload(code):
+    return {"type": "REGULAR", "settings": {"region": "USA", "universe": "TOP3000"}, "regular": code}
+
+
+class Response:
+    def __init__(self, status_code=200, headers=None, body=None):
+        self.status_code = status_code
+        self.headers = headers or {}
+        self._body = body or {}
+        self.text = json.dumps(self._body)
+
+    def json(self):
+        return self._body
+
+
+class FakeSession:
+    """Simulations finish on their first poll; `alpha_for(code)` decides the alpha ID."""
+
+    def __init__(self, alpha_for=lambda code: "A_" + code):
+        self.alpha_for = alpha_for
+        self.ids = itertools.count()
+        self.posted = []
+        self.running = {}
+
+    def post(self, url, json=None):
+        self.posted.append(json)
+        url = f"http://brain/simulations/{next(self.ids)}"
+        self.running[url] = json
+        return Response(201, {"Location": url})
+
+    def get(self, url):
+        return Response(200, {}, {"alpha": self.alpha_for(self.running[url]["regular"])})
+
+
+def test_completed_payloads_are_skipped_on_resume(tmp_path):
+    journal = SimulationJournal(str(tmp_path / "journal.db"))
+    alphas = [payload("rank(a)"), payload("rank(b)")]
+    first = FakeSession()
+    run_in_flight(alphas, first, lambda: first, journal=journal)
+    assert len(first.posted) == 2
+
+    again = FakeSession()
+    results = run_in_flight(alphas + [payload("rank(c)")], again, lambda: again, journal=journal)
+    assert [p["regular"] for p in again.posted] == ["rank(c)"]
+    assert sorted(results) == [(0, "A_rank(a)"), (1, "A_rank(b)"), (2, "A_rank(c)")]
+
+
+def test_in_flight_simulations_are_reattached_not_resubmitted(tmp_path):
+    journal = SimulationJournal(str(tmp_path / "journal.db"))
+    alpha = payload("rank(a)")
+    journal.mark_submitted([alpha])
+    journal.mark_in_flight([alpha], "http://brain/simulations/old")
+    sess = FakeSession()
+    sess.running["http://brain/simulations/old"] = alpha
+
+    results = run_in_flight([alpha], sess, lambda: sess, journal=journal)
+    assert sess.posted == []
+    assert results == [(0, "A_rank(a)")]
+    assert journal.get(payload_hash(alpha))["state"] == COMPLETED
+
+
+def test_simulation_without_alpha_stays_retryable(tmp_path):
+    journal = SimulationJournal(str(tmp_path / "journal.db"))
+    alpha = payload("rank(a)")
+    sess = FakeSession(alpha_for=lambda code: None)
+    run_in_flight([alpha], sess, lambda: sess, journal=journal)
+    assert journal.get(payload_hash(alpha))["state"] == FAILED
+
+    retry = FakeSession()
+    assert run_in_flight([alpha], retry, lambda: retry, journal=journal) == [(0, "A_rank(a)")]
+    assert len(retry.posted) == 1
+
+
+def test_failed_relogin_marks_the_payload_failed(tmp_path):
+    journal = SimulationJournal(str(tmp_path / "journal.db"))
+    alpha = payload("rank(a)")
+
+    class Broken(FakeSession):
+        def post(self, url, json=None):
+            self.posted.append(json)
+            return Response(500, {}, {"error": "boom"})
+
+    def sign_in():
+        raise RuntimeError("login down")
+
+    seen = []
+    sess = Broken()
+    run_in_flight([alpha], sess, sign_in, journal=journal, retry_sleep=0,
+                  alpha_fail_attempt_tolerance=2, on_result=lambda *args: seen.append(args))
+    entry = journal.get(payload_hash(alpha))
+    assert entry["state"] == FAILED
+    assert entry["progress_url"] is None
+    assert journal.in_flight() == []
+    assert seen == [(0, alpha, None)]
+
+
+def _legacy_hash(p):
+    return hashlib.sha1(json.dumps(p, sort_keys=True, ensure_ascii=True).encode("utf-8")).hexdigest()
+
+
+def test_migration_rekeys_rows_and_keeps_the_most_advanced_state(tmp_path):
+    path = str(tmp_path / "journal.db")
+    journal = SimulationJournal(path)
+    journal._conn.execute("PRAGMA user_version = 0")
+    rows = [
+        (payload("rank( a )"), FAILED, None, None),
+        (payload("rank(a)"), COMPLETED, None, "A1"),
+        (payload("rank(b)+c"), SUBMITTED, None, None),
+        (payload("c + rank(b)"), IN_FLIGHT, "http://brain/simulations/7", None),
+        (payload("ts_mean(x, 5.0)"), SUBMITTED, None, None),
+    ]
+    for p, state, url, alpha_id in rows:
+        journal._conn.execute(
+            "INSERT INTO simulations (payload_hash, payload, state, progress_url, alpha_id, updated_at) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (_legacy_hash(p), json.dumps(p), state, url, alpha_id, time.time()),
+        )
+    journal._conn.commit()
+    journal.close()
+
+    journal = SimulationJournal(path)
+    assert journal.counts() == {COMPLETED: 1, IN_FLIGHT: 1, SUBMITTED: 1}
+    assert journal.get(payload_hash(payload("rank(a)")))["alpha_id"] == "A1"
+    assert journal.get(payload_hash(payload("rank(b) + c")))["state"] == IN_FLIGHT
+    assert journal.get(payload_hash(payload("ts_mean(x, 5)")))["state"] == SUBMITTED
+    assert [url for url, _ in journal.in_flight()] == ["http://brain/simulations/7"]
@@ -0,0 +1,172 @@
+import itertools
+import json
+
+from simulation_scheduler import SOURCE_IDLE, SimulationJob, batch_alphas, run_in_flight
+
+
+def payload(code, region="USA", decay=1):
+    return {"type": "REGULAR", "settings": {"region": region, "universe": "TOP3000", "decay": decay}, "regular": code}
+
+
+class Response:
+    def __init__(self, status_code=200, headers=None, body=None):
+        self.status_code = status_code
+        self.headers = headers or {}
+        self._body = body or {}
+        self.text = json.dumps(self._body)
+
+    def json(self):
+        return self._body
+
+
+class ScriptedBrain:
+    """
+    Simulations finish after `polls` polls. Batches (list payloads) answer
+    with one child per member. `post_script` / `poll_script` hold responses
+    or exceptions that are served first; `reject_batches` refuses list posts.
+    """
+
+    def __init__(self, polls=2, max_running=None, reject_batches=False):
+        self.polls = polls
+        self.max_running = max_running
+        self.reject_batches = reject_batches
+        self.ids = itertools.count()
+        self.posts = []
+        self.running = {}
+        self.children = {}
+        self.peak = 0
+        self.post_script = []
+        self.poll_script = []
+
+    def post(self, url, json=None):
+        if self.post_script:
+            step = self.post_script.pop(0)
+            if isinstance(step, Exception):
+                raise step
+            return step
+        if isinstance(json, list) and self.reject_batches:
+            return Response(400, body={"detail": "multi-simulation not allowed"})
+        if self.max_running is not None and len(self.running) >= self.max_running:
+            return Response(429, {"Retry-After": "0"}, {"detail": "CONCURRENT_SIMULATION_LIMIT_EXCEEDED"})
+        self.posts.append(json)
+        url = f"http://brain/simulations/{next(self.ids)}"
+        self.running[url] = [json, self.polls]
+        self.peak = max(self.peak, len(self.running))
+        return Response(201, {"Location": url})
+
+    def get(self, url):
+        if url in self.children:
+            return Response(200, body={"alpha": "A_" + self.children[url]["regular"]})
+        if self.poll_script:
+            step = self.poll_script.pop(0)
+            if isinstance(step, Exception):
+                raise step
+            return step
+        sim = self.running[url]
+        sim[1] -= 1
+        if sim[1] > 0:
+            return Response(200, {"Retry-After": "0.001"}, {"progress": 0.5})
+        del self.running[url]
+        body, _ = sim
+        if isinstance(body, list):
+            children = []
+            for member in body:
+                child = f"http://brain/simulations/{next(self.ids)}"
+                self.children[child] = member
+                children.append(child)
+            return Response(200, body={"status": "COMPLETE", "children": children})
+        return Response(200, body={"alpha": "A_" + body["regular"]})
+
+
+def codes(n):
+    return [payload(f"ts_rank(close, {i})") for i in range(n)]
+
+
+def test_keeps_at_most_max_in_flight_running():
+    brain = ScriptedBrain(polls=3)
+    results = run_in_flight(codes(10), brain, lambda: brain, max_in_flight=3, retry_sleep=0)
+    assert sorted(results) == [(i, f"A_ts_rank(close, {i})") for i in range(10)]
+    assert brain.peak == 3
+    assert len(brain.posts) == 10
+
+
+def test_concurrency_limit_429_waits_without_counting_a_failure():
+    brain = ScriptedBrain(polls=2, max_running=2)
+    signed_in = []
+    results = run_in_flight(codes(6), brain, lambda: signed_in.append(1) or brain, max_in_flight=4,
+                            alpha_fail_attempt_tolerance=1, retry_sleep=0)
+    assert len(results) == 6
+    assert len(brain.posts) == 6
+    assert signed_in == []
+
+
+def test_poll_errors_repoll_instead_of_resubmitting():
+    brain = ScriptedBrain(polls=1)
+    brain.poll_script = [ConnectionError("reset"), ConnectionError("reset")]
+    results = run_in_flight(codes(1), brain, lambda: brain, retry_sleep=0)
+    assert results == [(0, "A_ts_rank(close, 0)")]
+    assert len(brain.posts) == 1
+
+
+def test_poll_errors_past_tolerance_relogin_then_give_up():
+    brain = ScriptedBrain(polls=1)
+    brain.poll_script = [ConnectionError("reset")] * 6
+    given_up = []
+    logins = []
+    results = run_in_flight(codes(1), brain, lambda: logins.append(1) or brain, alpha_fail_attempt_tolerance=3,
+                            retry_sleep=0, on_result=lambda idx, alpha, alpha_id: given_up.append((idx, alpha_id)))
+    assert results == []
+    assert given_up == [(0, None)]
+    assert logins == [1]
+    assert len(brain.posts) == 1
+
+
+def test_submit_errors_retry_then_relogin_then_give_up():
+    brain = ScriptedBrain()
+    brain.post_script = [Response(500, body={"detail": "boom"})] * 6
+    done = []
+    logins = []
+    run_in_flight(codes(1), brain, lambda: logins.append(1) or brain, alpha_fail_attempt_tolerance=3, retry_sleep=0,
+                  on_result=lambda idx, alpha, alpha_id: done.append((idx, alpha_id)))
+    assert logins == [1]
+    assert done == [(0, None)]
+    assert brain.posts == []
+
+
+def test_batches_fan_out_to_one_alpha_per_member():
+    brain = ScriptedBrain(polls=2)
+    results = run_in_flight(codes(7), brain, lambda: brain, max_in_flight=2, batch_size=3, retry_sleep=0)
+    assert sorted(results) == [(i, f"A_ts_rank(close, {i})") for i in range(7)]
+    assert [len(body) if isinstance(body, list) else 1 for body in brain.posts] == [3, 3, 1]
+
+
+def test_rejected_batch_is_resubmitted_one_by_one():
+    brain = ScriptedBrain(polls=1, reject_batches=True)
+    results = run_in_flight(codes(4), brain, lambda: brain, batch_size=4, retry_sleep=0)
+    assert sorted(results) == [(i, f"A_ts_rank(close, {i})") for i in range(4)]
+    assert all(isinstance(body, dict) for body in brain.posts)
+
+
+def test_batch_with_missing_children_is_resubmitted_one_by_one():
+    brain = ScriptedBrain(polls=1)
+    brain.poll_script = [Response(200, body={"status": "ERROR", "children": []})]
+    results = run_in_flight(codes(3), brain, lambda: brain, batch_size=3, retry_sleep=0)
+    assert sorted(results) == [(i, f"A_ts_rank(close, {i})") for i in range(3)]
+    assert [isinstance(body, list) for body in brain.posts] == [True, False, False, False]
+
+
+def test_batch_alphas_groups_compatible_payloads_only():
+    alphas = [payload("a"), payload("b", region="CHN"), payload("c", decay=4), payload("d", region="CHN"),
+              {"type": "SUPER", "regular": "e"}]
+    jobs = list(batch_alphas(enumerate(alphas), batch_size=10))
+    groups = sorted(sorted(idx for idx, _ in job.members) for job in jobs)
+    # decay does not change batch compatibility; region does; non-REGULAR payloads go alone
+    assert groups == [[0, 2], [1, 3], [4]]
+
+
+def test_batch_alphas_flushes_partial_batches_when_the_source_idles():
+    items = [(0, payload("a")), (1, payload("b")), SOURCE_IDLE, (2, payload("c"))]
+    out = list(batch_alphas(iter(items), batch_size=10))
+    assert isinstance(out[0], SimulationJob) and [idx for idx, _ in out[0].members] == [0, 1]
+    assert out[1] is SOURCE_IDLE
+    assert [idx for idx, _ in out[2].members] == [2]
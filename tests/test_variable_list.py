@@ -0,0 +1,77 @@
+import collections
+import itertools
+import random
+
+import pytest
+
+from variable_list import _combo_at, _random_combos, _stratified_combos, iter_alpha_variants
+
+OPTION_LISTS = [
+    [["a", "b", "c", "d"], ["x", "y"], [5, 10, 20]],
+    [list(range(7)), ["p", "q", "r"]],
+    [["only"], list(range(11))],
+    [list(range(19)), list(range(4)), list(range(6))],
+]
+
+
+@pytest.mark.parametrize("option_lists", OPTION_LISTS)
+def test_combo_at_follows_product_order(option_lists):
+    product = list(itertools.product(*option_lists))
+    assert [_combo_at(i, option_lists) for i in range(len(product))] == product
+
+
+@pytest.mark.parametrize("sampler", [_random_combos, _stratified_combos])
+@pytest.mark.parametrize("option_lists", OPTION_LISTS)
+@pytest.mark.parametrize("seed", [0, 1, 7])
+def test_samplers_yield_every_combination_once(sampler, option_lists, seed):
+    combos = list(sampler(option_lists, random.Random(seed)))
+    assert len(combos) == len(set(combos))
+    assert set(combos) == set(itertools.product(*option_lists))
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_stratified_never_repeats_with_duplicate_options(seed):
+    option_lists = [["a", "a", "b"], [1, 2]]
+    combos = list(_stratified_combos(option_lists, random.Random(seed)))
+    assert sorted(combos) == sorted(set(itertools.product(*option_lists)))
+
+
+def test_stratified_first_round_covers_every_option():
+    option_lists = [list(range(19)), list(range(4)), list(range(6))]
+    first_round = list(itertools.islice(_stratified_combos(option_lists, random.Random(0)), 19))
+    for dimension, options in enumerate(option_lists):
+        counts = collections.Counter(combo[dimension] for combo in first_round)
+        assert set(counts) == set(options)
+        assert max(counts.values()) - min(counts.values()) <= 1
+
+
+def test_random_combos_large_product_draws_distinct_valid_combos():
+    option_lists = [list(range(60)), list(range(60)), list(range(60))]  # above the shuffle-in-memory threshold
+    combos = list(itertools.islice(_random_combos(option_lists, random.Random(0)), 5000))
+    assert len(set(combos)) == 5000
+    assert all(all(value in options for value, options in zip(combo, option_lists)) for combo in combos)
+
+
+def parent(code):
+    return {"type": "REGULAR", "settings": {"region": "USA"}, "regular": code}
+
+
+@pytest.mark.parametrize("sample", [None, "random", "stratified"])
+def test_iter_alpha_variants_caps_and_skips_the_parent(sample):
+    code = "group_rank(ts_rank(close, 20), subindustry)"
+    everything = list(iter_alpha_variants([parent(code)], sample=sample, seed=0))
+    assert code not in [variant["regular"] for variant in everything]
+    assert len({variant["regular"] for variant in everything}) == len(everything)
+    capped = list(iter_alpha_variants([parent(code)], sample=sample, seed=0, max_per_parent=25))
+    assert len(capped) == 25
+    assert {variant["regular"] for variant in capped} <= {variant["regular"] for variant in everything}
+
+
+def test_iter_alpha_variants_max_total_spans_parents():
+    parents = [parent("ts_rank(close, 20)"), parent("ts_mean(volume, 5)")]
+    assert len(list(iter_alpha_variants(parents, max_total=30))) == 30
+
+
+def test_iter_alpha_variants_rejects_unknown_sample():
+    with pytest.raises(ValueError):
+        list(iter_alpha_variants([parent("ts_rank(close, 20)")], sample="sobol"))
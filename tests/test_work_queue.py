@@ -0,0 +1,128 @@
+import pytest
+
+import work_queue
+from simulation_journal import COMPLETED, IN_FLIGHT, payload_hash
+from work_queue import DONE, FAILED, LEASED, PENDING, WorkQueue
+
+
+class Clock:
+    def __init__(self, now=1_700_000_000.0):
+        self.now = now
+
+    def time(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(work_queue, "time", clock)
+    return clock
+
+
+@pytest.fixture
+def queue(tmp_path, clock):
+    queue = WorkQueue(str(tmp_path / "queue.db"), lease_seconds=60, max_attempts=2)
+    yield queue
+    queue.close()
+
+
+def payload(i):
+    return {"type": "REGULAR", "settings": {"region": "USA"}, "regular": f"ts_rank(close, {i})"}
+
+
+def test_enqueue_ignores_payloads_already_queued(queue):
+    assert queue.enqueue([payload(i) for i in range(5)], chunk_size=2) == 5
+    assert queue.enqueue([payload(i) for i in range(3, 8)]) == 3
+    assert queue.counts() == {PENDING: 8}
+
+
+def test_leases_are_exclusive_and_in_queue_order(queue):
+    queue.enqueue([payload(i) for i in range(5)])
+    first = queue.lease("w1", 3)
+    second = queue.lease("w2", 3)
+    assert [p for _, p in first] == [payload(0), payload(1), payload(2)]
+    assert [p for _, p in second] == [payload(3), payload(4)]
+    assert queue.lease("w3", 3) == []
+
+
+def test_expired_unposted_lease_returns_to_the_queue(queue, clock):
+    queue.enqueue([payload(1)])
+    queue.lease("dead", 1)
+    clock.now += 59
+    assert queue.lease("w2", 1) == []
+    clock.now += 2
+    assert queue.counts() == {"expired": 1}
+    assert [p for _, p in queue.lease("w2", 1)] == [payload(1)]
+
+
+def test_heartbeat_keeps_a_lease_alive(queue, clock):
+    queue.enqueue([payload(1)])
+    queue.lease("w1", 1)
+    for _ in range(5):
+        clock.now += 40
+        assert queue.heartbeat("w1") == 1
+    assert queue.lease("w2", 1) == []
+    assert queue.counts() == {LEASED: 1}
+
+
+def test_posted_orphans_are_claimed_not_reposted(queue, clock):
+    queue.enqueue([payload(i) for i in range(3)])
+    queue.lease("dead", 3)
+    dead = queue.journal("dead")
+    dead.mark_submitted([payload(0), payload(1)])
+    dead.mark_in_flight([payload(1), payload(0)], "https://brain/simulations/batch")
+    assert not queue.has_orphans()
+    assert queue.claim_orphans("w2") == 0  # lease still live
+    clock.now += 61
+    assert queue.has_orphans()
+    # the unposted task goes back to pending; the posted ones are not handed out again
+    assert [p for _, p in queue.lease("w2", 10)] == [payload(2)]
+    assert queue.claim_orphans("w2") == 2
+    assert not queue.has_orphans()
+    journal = queue.journal("w2")
+    assert journal.in_flight() == [("https://brain/simulations/batch", [payload(1), payload(0)])]
+    assert journal.get(payload_hash(payload(0)))["state"] == IN_FLIGHT
+    assert queue.journal("dead").in_flight() == []
+    journal.mark_completed(payload(0), "A0")
+    assert journal.get(payload_hash(payload(0))) == {
+        "state": COMPLETED, "progress_url": "https://brain/simulations/batch", "alpha_id": "A0"}
+
+
+def test_failed_tasks_are_retried_until_max_attempts(queue):
+    queue.enqueue([payload(1)])
+    for attempt, state in enumerate([PENDING, FAILED]):
+        assert len(queue.lease("w1", 1)) == 1
+        queue.journal("w1").mark_submitted([payload(1)])
+        queue.journal("w1").mark_failed(payload(1), f"error {attempt}")
+        assert queue.counts() == {state: 1}
+    assert queue.lease("w1", 1) == []
+    assert queue.retry_failed() == 1
+    assert [p for _, p in queue.lease("w1", 1)] == [payload(1)]
+
+
+def test_fail_from_a_worker_without_the_lease_is_ignored(queue):
+    queue.enqueue([payload(1)])
+    queue.lease("w1", 1)
+    queue.fail(payload(1), "w2", "not mine")
+    assert queue.counts() == {LEASED: 1}
+
+
+def test_release_requeues_unposted_and_orphans_posted(queue):
+    queue.enqueue([payload(1), payload(2)])
+    queue.lease("w1", 2)
+    queue.journal("w1").mark_in_flight([payload(1)], "https://brain/simulations/1")
+    queue.release("w1")
+    assert queue.has_orphans()
+    assert [p for _, p in queue.lease("w2", 5)] == [payload(2)]
+    assert queue.claim_orphans("w2") == 1
+
+
+def test_complete_is_idempotent_and_results_are_in_queue_order(queue):
+    queue.enqueue([payload(1), payload(2)])
+    queue.lease("w1", 2)
+    assert queue.complete(payload(2), "A2")
+    assert not queue.complete(payload(2), "A2-again")
+    assert queue.complete(payload(1), "A1")
+    assert queue.results() == [(payload(1), "A1"), (payload(2), "A2")]
+    assert queue.counts() == {DONE: 2}
@@ -1,20 +1,23 @@
-import copy
+import collections
+import hashlib
 import itertools
 import json
 import logging
+import random
 import re
 import time
 from typing import Dict
 
-import requests
-from requests.auth import HTTPBasicAuth
+from alpha_mirror import ALPHAS_URL
+from alpha_selection import select_alphas
+from fastexpr import CanonicalTemplate, canonical_expression
+from pipeline_metrics import metrics
+from session_manager import sign_in
 
 group_list=["subindustry","market","sector","industry","country","currency"]
 group_operator_list=["group_rank","group_scale","group_neutralize","group_zscore"]
 ts_operator_list=["last_diff_value","ts_arg_max","ts_arg_min","ts_av_diff","ts_backfill","ts_corr","ts_count_nans","ts_decay_linear","ts_delay","ts_delta","ts_mean","ts_product","ts_quantile","ts_rank","ts_regression","ts_scale","ts_std_dev","ts_sum","ts_zscore"]
 
-DEFAULT_USERNAME = ""
-DEFAULT_PASSWORD = ""
 logger = logging.getLogger(__name__)
 
 
@@ -30,83 +33,219 @@ def _extract_alpha_code(element) -> str:
         return match.group(1)
     return ""
 
-def _token_present(alpha_code: str, token: str) -> bool:
-    return re.search(rf"(?<!\w){re.escape(token)}(?!\w)", alpha_code) is not None
-
-def _replace_token(alpha_code: str, token: str, replacement: str) -> str:
-    return re.sub(rf"(?<!\w){re.escape(token)}(?!\w)", replacement, alpha_code)
-
-def _number_dimensions(alpha_code: str):
-    matches = list(re.finditer(r"\b\d+\b", alpha_code))
-    if not matches:
-        return alpha_code, []
-    parts = []
-    last = 0
-    dimensions = []
-    for idx, match in enumerate(matches):
-        parts.append(alpha_code[last:match.start()])
-        num_str = match.group(0)
-        placeholder = f"__NUM{idx}__"
-        parts.append(placeholder)
-        last = match.end()
-        if len(num_str) == 1:
-            options = [num_str] + [str(v) for v in range(2, 12, 2) if str(v) != num_str]
-        elif len(num_str) == 2:
-            options = [num_str] + [str(v) for v in range(10, 50, 5) if str(v) != num_str]
+# One pass splits an expression into word tokens and the separators between
+# them; "".join(tokens) gives the expression back unchanged.
+_TOKEN_RE = re.compile(r"\w+|\W+")
+
+def _tokenize(alpha_code: str):
+    return _TOKEN_RE.findall(alpha_code)
+
+def _number_options(num_str: str):
+    if len(num_str) == 1:
+        return [num_str] + [str(v) for v in range(2, 12, 2) if str(v) != num_str]
+    if len(num_str) == 2:
+        return [num_str] + [str(v) for v in range(10, 50, 5) if str(v) != num_str]
+    return [num_str]
+
+def _variant_dimensions(alpha_code, group_list=group_list, group_operator_list=group_operator_list, ts_operator_list=ts_operator_list):
+    """
+    Tokenize alpha_code once and return (tokens, dimensions).
+
+    Each dimension is (slots, options, original): the token indices it
+    rewrites, the values to try (original first) and the original value.
+    Operator/group tokens get one dimension covering every occurrence, each
+    standalone integer gets its own dimension.
+    """
+    tokens = _tokenize(alpha_code)
+    token_slots = {}
+    number_dimensions = []
+    for slot, token in enumerate(tokens):
+        if token.isdecimal():
+            number_dimensions.append(([slot], _number_options(token), token))
         else:
-            options = [num_str]
-        dimensions.append((placeholder, options, num_str))
-    parts.append(alpha_code[last:])
-    return "".join(parts), dimensions
-
-def generate_alpha_variants(alpha2_0,group_list=group_list, group_operator_list=group_operator_list,ts_operator_list=ts_operator_list):
-    alpha3_0 = []
-    seen = set()
+            token_slots.setdefault(token, []).append(slot)
+    token_dimensions = []
+    for candidates in (group_list, group_operator_list, ts_operator_list):
+        for token in candidates:
+            if token in token_slots:
+                options = [token] + [v for v in candidates if v != token]
+                token_dimensions.append((token_slots[token], options, token))
+    return tokens, token_dimensions + number_dimensions
+
+def _canonical_template(tokens, all_dimensions):
+    """Parse the parent once with a placeholder per dimension (see fastexpr.CanonicalTemplate)."""
+    parts = list(tokens)
+    slot_options = {}
+    for k, (slots, options, _) in enumerate(all_dimensions):
+        placeholder = f"__variant_slot{k}__"
+        slot_options[placeholder] = options
+        for slot in slots:
+            parts[slot] = placeholder
+    return CanonicalTemplate.build("".join(parts), slot_options)
+
+def _render_variant(tokens, dimension_slots, combo):
+    """Substitute combo into a copy of the token list by slot index."""
+    parts = list(tokens)
+    for slots, replacement in zip(dimension_slots, combo):
+        for slot in slots:
+            parts[slot] = replacement
+    return "".join(parts)
+
+def _combo_at(index, option_lists):
+    """Decode a flat index of the cartesian product (itertools.product order)."""
+    combo = []
+    for options in reversed(option_lists):
+        index, pos = divmod(index, len(options))
+        combo.append(options[pos])
+    return tuple(reversed(combo))
+
+def _random_combos(option_lists, rng):
+    """Distinct combinations in random order, without materialising the product."""
+    total = 1
+    for options in option_lists:
+        total *= len(options)
+    if total <= 100_000:
+        order = list(range(total))
+        rng.shuffle(order)
+        for index in order:
+            yield _combo_at(index, option_lists)
+        return
+    drawn = set()
+    while len(drawn) < total:
+        index = rng.randrange(total)
+        if index in drawn:
+            continue
+        drawn.add(index)
+        yield _combo_at(index, option_lists)
+
+def _stratified_combos(option_lists, rng):
+    """
+    Latin-hypercube style rounds: within one round every option of every
+    dimension appears (near) equally often, so a small cap still covers each
+    operator, group and window instead of the first corner of the product.
+    Once the rounds mostly repeat themselves, the combinations not drawn yet
+    follow in product order, so an uncapped run still yields every one.
+    """
+    total = 1
+    for options in option_lists:
+        total *= len(options)
+    round_length = max(len(options) for options in option_lists)
+    emitted = set()
+    while len(emitted) < total:
+        shuffled = [rng.sample(options, len(options)) for options in option_lists]
+        fresh = 0
+        for i in range(round_length):
+            combo = tuple(options[i % len(options)] for options in shuffled)
+            if combo in emitted:
+                continue
+            emitted.add(combo)
+            fresh += 1
+            yield combo
+        if fresh * 2 < round_length:
+            break
+    if len(emitted) < total:
+        for combo in itertools.product(*option_lists):
+            if combo not in emitted:
+                emitted.add(combo)
+                yield combo
+
+
+class _BoundedSeen:
+    """Set of 16-byte digests that forgets the oldest entries beyond `capacity`."""
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self._digests = collections.OrderedDict()
+
+    def add(self, key: str) -> bool:
+        """Add key; return False if it was already present."""
+        digest = hashlib.blake2b(key.encode("utf-8"), digest_size=16).digest()
+        if digest in self._digests:
+            return False
+        self._digests[digest] = None
+        if len(self._digests) > self.capacity:
+            self._digests.popitem(last=False)
+        return True
+
+
+def iter_alpha_variants(
+    alpha2_0,
+    group_list=group_list,
+    group_operator_list=group_operator_list,
+    ts_operator_list=ts_operator_list,
+    cache=None,
+    max_per_parent=None,
+    max_total=None,
+    sample=None,
+    seed=None,
+    dedupe_capacity=500_000,
+):
+    """
+    Lazily yield variants of every parent in alpha2_0.
+
+    sample: None walks the product in order, "random" draws distinct
+    combinations in seeded random order, "stratified" spreads draws evenly
+    over each dimension's options. max_per_parent / max_total cap how many
+    variants are yielded. Dict variants share the parent's settings dict, so
+    treat them as read-only. cache: optional result_cache.ResultCache;
+    variants simulated by earlier runs are skipped.
+    """
+    if sample not in (None, "random", "stratified"):
+        raise ValueError(f"Unknown sample mode: {sample}")
+    rng = random.Random(seed)
+    seen = _BoundedSeen(dedupe_capacity)
+    total_yielded = 0
     for element in alpha2_0:
         alpha_code = _extract_alpha_code(element)
         if not alpha_code:
             continue
-        alpha_code_template, number_dimensions = _number_dimensions(alpha_code)
-        token_dimensions = []
-        for token in group_list:
-            if _token_present(alpha_code, token):
-                options = [token] + [v for v in group_list if v != token]
-                token_dimensions.append((token, options, token))
-        for token in group_operator_list:
-            if _token_present(alpha_code, token):
-                options = [token] + [v for v in group_operator_list if v != token]
-                token_dimensions.append((token, options, token))
-        for token in ts_operator_list:
-            if _token_present(alpha_code, token):
-                options = [token] + [v for v in ts_operator_list if v != token]
-                token_dimensions.append((token, options, token))
-        all_dimensions = token_dimensions + number_dimensions
+        tokens, all_dimensions = _variant_dimensions(alpha_code, group_list, group_operator_list, ts_operator_list)
         if not all_dimensions:
             continue
-        base_tokens = [token for token, _, _ in all_dimensions]
+        dimension_slots = [slots for slots, _, _ in all_dimensions]
         option_lists = [options for _, options, _ in all_dimensions]
-        base_values = [original for _, _, original in all_dimensions]
-        for combo in itertools.product(*option_lists):
-            if all(chosen == original for chosen, original in zip(combo, base_values)):
+        base_values = tuple(original for _, _, original in all_dimensions)
+        if sample == "random":
+            combos = _random_combos(option_lists, rng)
+        elif sample == "stratified":
+            combos = _stratified_combos(option_lists, rng)
+        else:
+            combos = itertools.product(*option_lists)
+        if isinstance(element, dict):
+            element_key = json.dumps({k: v for k, v in element.items() if k != "regular"}, sort_keys=True)
+            canonical_template = _canonical_template(tokens, all_dimensions)
+        parent_yielded = 0
+        for combo in combos:
+            if combo == base_values:
                 continue
-            new_code = alpha_code_template
-            for token, replacement in zip(base_tokens, combo):
-                if token.startswith("__NUM"):
-                    new_code = new_code.replace(token, replacement)
-                else:
-                    new_code = _replace_token(new_code, token, replacement)
+            new_code = _render_variant(tokens, dimension_slots, combo)
             if isinstance(element, dict):
-                new_element = copy.deepcopy(element)
+                new_element = dict(element)
                 new_element["regular"] = new_code
-                dedupe_key = json.dumps(new_element, sort_keys=True)
+                # canonical form: variants that only differ in spelling count once
+                if canonical_template is not None:
+                    dedupe_key = element_key + canonical_template.render(combo)
+                else:
+                    dedupe_key = element_key + canonical_expression(new_code)
             else:
                 new_element = element.replace(alpha_code, new_code, 1)
                 dedupe_key = new_element
-            if dedupe_key not in seen:
-                seen.add(dedupe_key)
-                alpha3_0.append(new_element)
+            if not seen.add(dedupe_key):
+                continue
+            if cache is not None and isinstance(new_element, dict) and new_element in cache:
+                continue
+            yield new_element
+            parent_yielded += 1
+            total_yielded += 1
+            if max_total is not None and total_yielded >= max_total:
+                return
+            if max_per_parent is not None and parent_yielded >= max_per_parent:
+                break
 
-    return alpha3_0
+def generate_alpha_variants(alpha2_0,group_list=group_list, group_operator_list=group_operator_list,ts_operator_list=ts_operator_list, cache=None, **kwargs):
+    # cache: optional result_cache.ResultCache; variants simulated by earlier runs are skipped
+    # kwargs are passed to iter_alpha_variants (caps, sampling); prefer that generator for large runs
+    return list(iter_alpha_variants(alpha2_0, group_list, group_operator_list, ts_operator_list, cache=cache, **kwargs))
 
 element={'type': 'REGULAR', 'settings': {'instrumentType': 'EQUITY', 'region': 'USA', 'universe': 'TOP3000', 'delay': 1, 'decay': 1, 'neutralization': 'SUBINDUSTRY', 'truncation': 0.01, 'pasteurization': 'ON', 'unitHandling': 'VERIFY', 'nanHandling': 'ON', 'language': 'FASTEXPR', 'visualization': False}, 'regular': 'XXXXX'}
 
@@ -114,9 +253,19 @@ class AlphaSubmitter:
     def __init__(self):
         self.sess = sign_in()
 
-    def fetch_successful_alphas(self, max_items: int = 1000, page_size: int = 100) -> Dict:
+    @metrics.timed("stage_seconds", stage="fetch_successful_alphas")
+    def fetch_successful_alphas(self, max_items: int = 1000, page_size: int = 100, mirror=None,
+                                min_sharpe=1.00, min_fitness=0.5, rank_by=None, top_k=None, pareto=False) -> Dict:
         """Fetches up to the most recent max_items unsubmitted alphas and filters by metrics."""
-        url = "https://api.worldquantbrain.com/users/self/alphas"
+        if mirror is not None:
+            # 本地镜像：只增量同步新的alpha，筛选在本地数据库里做
+            mirror.sync(self.sess, page_size=page_size, max_items=max_items)
+            collected = select_alphas(
+                mirror.select(min_sharpe=min_sharpe, min_fitness=min_fitness, window=max_items),
+                rank_by=rank_by, top_k=top_k, pareto=pareto,
+            )
+            return {"count": len(collected), "results": collected}
+        url = ALPHAS_URL
         max_retries = 3
         retry_delay = 60
         collected = []
@@ -144,14 +293,9 @@ class AlphaSubmitter:
                     data = response.json()
                     results = data.get("results", [])
                     if not results:
-                        return {"count": len(collected), "results": collected}
-
-                    filtered = [
-                        alpha for alpha in results
-                        if (alpha.get("is") or {}).get("sharpe", 0) >= 1.00
-                           and (alpha.get("is") or {}).get("fitness", 0) >= 0.5
-                    ]
-                    collected.extend(filtered)
+                        offset = max_items  # 服务器没有更多alpha了
+                        break
+                    collected.extend(results)
                     break
                 except Exception as e:
                     logger.warning(f"Fetch failed (Attempt {attempt + 1}): {str(e)}")
@@ -162,5 +306,10 @@ class AlphaSubmitter:
 
             offset += limit
 
+        # 阈值、排序、top-k 和 Pareto 前沿在整张表上一次性向量化计算
+        collected = select_alphas(
+            collected, min_sharpe=min_sharpe, min_fitness=min_fitness,
+            rank_by=rank_by, top_k=top_k, pareto=pareto,
+        )
         return {"count": len(collected), "results": collected}
 
@@ -0,0 +1,390 @@
+"""Shared queue of simulation payloads for several worker processes.
+
+One `testing_alphas` loop in one process used to run everything, and scaling
+out meant splitting lists like `alpha_list2[107:]` between terminals by hand.
+`WorkQueue` keeps the payloads in a SQLite file; any number of workers, each
+with its own session, lease tasks from it:
+
+    pending --lease--> leased --simulated--> done
+       ^                 |  \\--given up (attempts left)--> pending
+       |                 |   \\-given up (max_attempts)----> failed
+       +--lease expired--+
+
+A lease lasts `lease_seconds` and a worker's heartbeat thread keeps renewing
+it, so a crashed or killed worker's tasks become available again once their
+leases run out. The queue also records each task's progress URL (it is the
+journal `run_in_flight` writes to, see `WorkerJournal`): a task whose
+simulation was already posted is not posted again after its worker dies;
+the next worker re-attaches to the running simulation and collects its
+alpha, so nothing is simulated twice or lost.
+
+Workers on one host share the file directly; workers on several hosts need
+it on a filesystem with working POSIX locks.
+"""
+import json
+import logging
+import os
+import socket
+import sqlite3
+import threading
+import time
+
+from pipeline_metrics import metrics
+from simulation_journal import COMPLETED, FAILED, IN_FLIGHT, payload_hash
+from simulation_scheduler import SOURCE_IDLE, run_in_flight
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_QUEUE_PATH = "work_queue.db"
+PENDING = "pending"
+LEASED = "leased"
+DONE = "done"
+# queue state -> journal state reported to run_in_flight
+_JOURNAL_STATES = {DONE: COMPLETED, FAILED: FAILED}
+
+
+def default_worker_id():
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+class WorkQueue:
+    """
+    SQLite-backed lease queue; safe to share between threads and processes.
+
+    lease_seconds: how long a task stays with a worker that stopped sending
+    heartbeats. max_attempts: simulation posts per task (the scheduler makes
+    up to three before it gives up on one) before the task is marked failed.
+    """
+
+    def __init__(self, path=DEFAULT_QUEUE_PATH, lease_seconds=600, max_attempts=6):
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS tasks (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                payload_hash TEXT NOT NULL UNIQUE,
+                payload TEXT NOT NULL,
+                state TEXT NOT NULL,
+                worker TEXT,
+                lease_expires REAL,
+                progress_url TEXT,
+                batch_pos INTEGER,
+                alpha_id TEXT,
+                error TEXT,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                updated_at REAL NOT NULL
+            )
+            """
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_tasks_state ON tasks(state, id)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_tasks_worker ON tasks(worker, state)")
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def _write(self, fn):
+        """Run `fn(conn, now)` in one write transaction (locks out other processes)."""
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                result = fn(self._conn, time.time())
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        return result
+
+    # ---- PRODUCER SIDE ----
+
+    def enqueue(self, payloads, chunk_size=1000):
+        """Add payloads; ones already queued (same payload_hash) are ignored. Returns the number added."""
+        added = 0
+        chunk = []
+
+        def insert(conn, now):
+            before = conn.total_changes
+            conn.executemany(
+                "INSERT OR IGNORE INTO tasks (payload_hash, payload, state, updated_at) VALUES (?, ?, ?, ?)",
+                [(payload_hash(payload), json.dumps(payload, ensure_ascii=True), PENDING, now) for payload in chunk],
+            )
+            return conn.total_changes - before
+
+        for payload in payloads:
+            chunk.append(payload)
+            if len(chunk) >= chunk_size:
+                added += self._write(insert)
+                chunk = []
+        if chunk:
+            added += self._write(insert)
+        metrics.inc("work_queue_enqueued_total", added)
+        return added
+
+    def counts(self):
+        """{state: number of tasks}; leased tasks whose lease ran out count as `expired`."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT CASE WHEN state = ? AND lease_expires < ? THEN 'expired' ELSE state END, COUNT(*) "
+                "FROM tasks GROUP BY 1",
+                (LEASED, time.time()),
+            ).fetchall()
+        return dict(rows)
+
+    def results(self):
+        """(payload, alpha_id) of every finished task, in queue order."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT payload, alpha_id FROM tasks WHERE state = ? ORDER BY id", (DONE,)
+            ).fetchall()
+        return [(json.loads(payload), alpha_id) for payload, alpha_id in rows]
+
+    def retry_failed(self):
+        """Put failed tasks back in the queue with a fresh attempt budget; returns how many."""
+        def retry(conn, now):
+            return conn.execute(
+                "UPDATE tasks SET state = ?, attempts = 0, error = NULL, updated_at = ? WHERE state = ?",
+                (PENDING, now, FAILED),
+            ).rowcount
+        return self._write(retry)
+
+    # ---- WORKER SIDE ----
+
+    def lease(self, worker, count):
+        """Lease up to `count` pending tasks; returns [(task id, payload)]."""
+        def take(conn, now):
+            # expired leases that were never posted go straight back to pending
+            requeued = conn.execute(
+                "UPDATE tasks SET state = ?, worker = NULL, lease_expires = NULL, updated_at = ? "
+                "WHERE state = ? AND lease_expires < ? AND progress_url IS NULL",
+                (PENDING, now, LEASED, now),
+            ).rowcount
+            if requeued:
+                metrics.inc("work_queue_expired_total", requeued)
+                logger.warning(f"{requeued} expired leases returned to the queue")
+            rows = conn.execute(
+                "SELECT id, payload FROM tasks WHERE state = ? ORDER BY id LIMIT ?", (PENDING, count)
+            ).fetchall()
+            conn.executemany(
+                "UPDATE tasks SET state = ?, worker = ?, lease_expires = ?, updated_at = ? WHERE id = ?",
+                [(LEASED, worker, now + self.lease_seconds, now, task_id) for task_id, _ in rows],
+            )
+            return rows
+        rows = self._write(take)
+        metrics.inc("work_queue_leased_total", len(rows))
+        return [(task_id, json.loads(payload)) for task_id, payload in rows]
+
+    def claim_orphans(self, worker):
+        """Take over expired leases whose simulation is already running; returns how many."""
+        def claim(conn, now):
+            return conn.execute(
+                "UPDATE tasks SET worker = ?, lease_expires = ?, updated_at = ? "
+                "WHERE state = ? AND lease_expires < ? AND progress_url IS NOT NULL",
+                (worker, now + self.lease_seconds, now, LEASED, now),
+            ).rowcount
+        claimed = self._write(claim)
+        if claimed:
+            metrics.inc("work_queue_orphans_claimed_total", claimed)
+            logger.warning(f"{worker} re-attaches to {claimed} simulations left by expired leases")
+        return claimed
+
+    def has_orphans(self):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT 1 FROM tasks WHERE state = ? AND lease_expires < ? AND progress_url IS NOT NULL LIMIT 1",
+                (LEASED, time.time()),
+            ).fetchone()
+        return row is not None
+
+    def heartbeat(self, worker):
+        """Renew every lease `worker` holds; returns how many."""
+        def renew(conn, now):
+            return conn.execute(
+                "UPDATE tasks SET lease_expires = ? WHERE worker = ? AND state = ?",
+                (now + self.lease_seconds, worker, LEASED),
+            ).rowcount
+        return self._write(renew)
+
+    def release(self, worker):
+        """Give up every lease of `worker` now (clean shutdown); running simulations are left to be re-attached."""
+        def give_back(conn, now):
+            conn.execute(
+                "UPDATE tasks SET state = ?, worker = NULL, lease_expires = NULL, updated_at = ? "
+                "WHERE worker = ? AND state = ? AND progress_url IS NULL",
+                (PENDING, now, worker, LEASED),
+            )
+            conn.execute(
+                "UPDATE tasks SET lease_expires = 0, updated_at = ? WHERE worker = ? AND state = ?",
+                (now, worker, LEASED),
+            )
+        self._write(give_back)
+
+    def complete(self, payload, alpha_id):
+        """Mark a task done; False if it already was."""
+        def finish(conn, now):
+            return conn.execute(
+                "UPDATE tasks SET state = ?, alpha_id = ?, error = NULL, lease_expires = NULL, updated_at = ? "
+                "WHERE payload_hash = ? AND state != ?",
+                (DONE, alpha_id, now, payload_hash(payload), DONE),
+            ).rowcount
+        if not self._write(finish):
+            return False
+        metrics.inc("work_queue_done_total")
+        return True
+
+    def fail(self, payload, worker, error):
+        """A leased task was given up: back to pending, or failed once `max_attempts` are used."""
+        def give_up(conn, now):
+            conn.execute(
+                "UPDATE tasks SET state = CASE WHEN attempts >= ? THEN ? ELSE ? END, error = ?, "
+                "worker = NULL, lease_expires = NULL, progress_url = NULL, batch_pos = NULL, updated_at = ? "
+                "WHERE payload_hash = ? AND state = ? AND worker = ?",
+                (self.max_attempts, FAILED, PENDING, str(error)[:500], now, payload_hash(payload), LEASED, worker),
+            )
+        self._write(give_up)
+
+    def journal(self, worker):
+        return WorkerJournal(self, worker)
+
+
+class WorkerJournal:
+    """
+    The SimulationJournal interface over one worker's leases.
+
+    run_in_flight calls it as it posts and finishes simulations, so progress
+    URLs and alpha IDs land in the queue; `in_flight` hands it the running
+    simulations this worker took over with `claim_orphans`.
+    """
+
+    def __init__(self, queue, worker):
+        self.queue = queue
+        self.worker = worker
+
+    def get(self, key):
+        with self.queue._lock:
+            row = self.queue._conn.execute(
+                "SELECT state, progress_url, alpha_id FROM tasks WHERE payload_hash = ?", (key,)
+            ).fetchone()
+        if row is None:
+            return None
+        state, progress_url, alpha_id = row
+        return {"state": _JOURNAL_STATES.get(state, IN_FLIGHT if progress_url else state),
+                "progress_url": progress_url, "alpha_id": alpha_id}
+
+    def mark_submitted(self, payloads):
+        def submitted(conn, now):
+            conn.executemany(
+                "UPDATE tasks SET attempts = attempts + 1, progress_url = NULL, batch_pos = NULL, updated_at = ? "
+                "WHERE payload_hash = ? AND state = ? AND worker = ?",
+                [(now, payload_hash(payload), LEASED, self.worker) for payload in payloads],
+            )
+        self.queue._write(submitted)
+
+    def mark_in_flight(self, payloads, progress_url):
+        batch = len(payloads) > 1
+
+        def running(conn, now):
+            conn.executemany(
+                "UPDATE tasks SET progress_url = ?, batch_pos = ?, updated_at = ? "
+                "WHERE payload_hash = ? AND state = ? AND worker = ?",
+                [(progress_url, pos if batch else None, now, payload_hash(payload), LEASED, self.worker)
+                 for pos, payload in enumerate(payloads)],
+            )
+        self.queue._write(running)
+
+    def mark_completed(self, payload, alpha_id):
+        if alpha_id:
+            self.queue.complete(payload, alpha_id)
+        else:
+            self.queue.fail(payload, self.worker, "simulation finished without an alpha")
+
+    def mark_failed(self, payload, error):
+        self.queue.fail(payload, self.worker, error)
+
+    def in_flight(self):
+        with self.queue._lock:
+            rows = self.queue._conn.execute(
+                "SELECT progress_url, payload FROM tasks WHERE worker = ? AND state = ? AND progress_url IS NOT NULL "
+                "ORDER BY progress_url, COALESCE(batch_pos, 0)",
+                (self.worker, LEASED),
+            ).fetchall()
+        grouped = {}
+        for progress_url, payload in rows:
+            grouped.setdefault(progress_url, []).append(json.loads(payload))
+        return list(grouped.items())
+
+
+def run_worker(queue, sess, sign_in, worker=None, max_in_flight=3, batch_size=10, lease_chunk=None,
+               cache=None, harvester=None, wait=False, idle_poll=5.0):
+    """
+    Simulate tasks from `queue` until it is drained; returns the number completed by this worker.
+
+    Tasks are leased `lease_chunk` at a time (enough to refill every slot by
+    default) as slots free up. wait: keep polling for new tasks instead of
+    stopping once nothing is pending. cache / harvester: as for testing_alphas.
+    """
+    worker = worker or default_worker_id()
+    lease_chunk = lease_chunk or max_in_flight * max(1, batch_size)
+    journal = queue.journal(worker)
+    stop = threading.Event()
+    done = 0
+
+    def beat():
+        while not stop.wait(max(1.0, queue.lease_seconds / 3)):
+            try:
+                queue.heartbeat(worker)
+            except Exception as e:
+                logger.warning(f"Heartbeat of {worker} failed: {e}")
+
+    def source():
+        """Leased payloads as slots free up; ends the round when orphans are waiting to be re-attached."""
+        last_seen = time.time()
+        while True:
+            tasks = queue.lease(worker, lease_chunk)
+            for _, payload in tasks:
+                yield payload
+            if tasks:
+                last_seen = time.time()
+                continue
+            if queue.has_orphans():
+                return
+            counts = queue.counts()
+            if not wait and not counts.get(LEASED) and not counts.get("expired"):
+                return
+            # other workers still hold leases (they may expire) or new work may arrive
+            if time.time() - last_seen > idle_poll:
+                last_seen = time.time()
+                logger.info(f"{worker} waiting for work: {counts}")
+            yield SOURCE_IDLE
+
+    def on_result(idx, alpha, alpha_id):
+        nonlocal done
+        if alpha_id:
+            queue.complete(alpha, alpha_id)
+            done += 1
+        else:
+            queue.fail(alpha, worker, "given up by the scheduler")
+        if harvester is not None:
+            harvester.on_result(idx, alpha, alpha_id)
+
+    heartbeat = threading.Thread(target=beat, name="work-queue-heartbeat", daemon=True)
+    heartbeat.start()
+    logger.info(f"Worker {worker} started on {queue.path}")
+    try:
+        while True:
+            queue.claim_orphans(worker)
+            run_in_flight(
+                source(), sess, sign_in, max_in_flight=max_in_flight, batch_size=batch_size,
+                journal=journal, cache=cache, on_result=on_result, idle_poll=min(idle_poll, 1.0),
+            )
+            if not queue.has_orphans():
+                break
+    finally:
+        stop.set()
+        queue.release(worker)
+    logger.info(f"Worker {worker} finished: {done} alphas simulated, queue {queue.counts()}")
+    return done